@@ -0,0 +1,305 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    from Agents.intent_router import route_intent
+except ImportError:
+    from flask_backend.Agents.intent_router import route_intent
+
+# Admission control for /api/query.
+#
+# Each agent gets a bulkhead: at most `limit` of its queries run at once per worker and at most
+# `queue` more wait (up to AGENT_QUEUE_TIMEOUT_SECONDS) for a slot; anything beyond that is
+# rejected at once with Overloaded (503 + Retry-After). A flood of slow GPT-4 fallback queries
+# therefore fills only the fallback bulkhead, while greetings (no bulkhead) and order lookups
+# keep their own capacity. Each client IP also gets a token bucket (429 + Retry-After).
+
+# LLM-backed agents (fallback, food questions, recommendations): slots and queue per agent
+LLM_AGENT_CONCURRENCY = int(os.getenv("LLM_AGENT_CONCURRENCY", "8"))
+LLM_AGENT_QUEUE = int(os.getenv("LLM_AGENT_QUEUE", "16"))
+# MongoDB-only agents (order status, order creation)
+DB_AGENT_CONCURRENCY = int(os.getenv("DB_AGENT_CONCURRENCY", "32"))
+DB_AGENT_QUEUE = int(os.getenv("DB_AGENT_QUEUE", "64"))
+# Longest wait for a slot before the query is rejected
+AGENT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "2"))
+
+# Under gunicorn's gthread workers every running or waiting query holds one of the worker's
+# threads, so the bulkheads are capped to leave threads for everything else: the three LLM agents
+# may hold at most half of them together and order lookups a quarter. gunicorn.conf.py passes the
+# worker's real thread count to configure_worker_threads(); the environment only gives the value
+# used before that. (Queries to the ASGI app's native /api/query wait without holding a thread;
+# its other routes share the FLASK_THREADS pool, see asgi.py.)
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", "16")) if os.getenv("GUNICORN_WORKER_CLASS") == "gthread" else 0
+LLM_AGENT_THREADS = max(1, WORKER_THREADS // 2 // 3)
+DB_AGENT_THREADS = max(1, WORKER_THREADS // 4)
+
+# Per-client token bucket: sustained queries per second and burst size (0 disables it)
+QUERY_RATE_PER_SECOND = float(os.getenv("QUERY_RATE_PER_SECOND", "2"))
+QUERY_BURST = int(os.getenv("QUERY_BURST", "10"))
+# Clients tracked at once (least recently seen are dropped first)
+MAX_TRACKED_CLIENTS = int(os.getenv("MAX_TRACKED_CLIENTS", "10000"))
+
+
+class Overloaded(Exception):
+    """Raised when a query is rejected; retry_after is the suggested wait in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(Overloaded):
+    """Raised when a client sends queries faster than its token bucket allows."""
+
+
+class _Waiter:
+    # A caller waiting for a slot; wake() may be called from any thread
+    def __init__(self, loop=None):
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class Slot:
+    """
+    A bulkhead slot; release() is idempotent so it can be tied to several cleanup paths.
+    """
+
+    def __init__(self, bulkhead):
+        self.bulkhead = bulkhead
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self.bulkhead is None or self._released:
+            return
+        self._released = True
+        self.bulkhead.release(time.monotonic() - self.started)
+
+
+class Bulkhead:
+    """
+    Bounded concurrency with a bounded FIFO queue, shared by thread and asyncio callers.
+    """
+
+    def __init__(self, name, limit, queue_size, queue_timeout=AGENT_QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of the time a slot is held, for Retry-After
+        self.service_seconds = 1.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> int:
+        # Time for the current queue to drain, in whole seconds
+        return max(1, math.ceil(self.service_seconds * (len(self._waiters) + 1) / self.limit))
+
+    def _reject(self, reason):
+        # Called with _lock held
+        self.rejected += 1
+        return Overloaded(f"The {self.name} agent is {reason}, please retry shortly", self.retry_after())
+
+    def _enter(self, loop=None):
+        # Takes a free slot, or queues a waiter; returns None when a slot was taken
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.queue_size:
+                raise self._reject("at capacity")
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _leave_queue(self, waiter) -> bool:
+        # After a timed-out or cancelled wait: True if the waiter left the queue, False if it
+        # was handed a slot meanwhile (and now owns it)
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+            return False
+
+    def _timed_out(self):
+        with self._lock:
+            return self._reject("busy")
+
+    def acquire(self) -> Slot:
+        """
+        Waits (blocking the thread) for a slot.
+        :raises Overloaded: If the queue is full or no slot frees up within queue_timeout.
+        """
+        waiter = self._enter()
+        if waiter is not None and not waiter.event.wait(self.queue_timeout) and self._leave_queue(waiter):
+            raise self._timed_out()
+        return Slot(self)
+
+    async def acquire_async(self) -> Slot:
+        """
+        Awaits a slot without blocking the event loop.
+        :raises Overloaded: If the queue is full or no slot frees up within queue_timeout.
+        """
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._leave_queue(waiter):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                # The caller went away; pass on a slot it may have been handed
+                if not self._leave_queue(waiter):
+                    self.release(None)
+                raise
+        return Slot(self)
+
+    def release(self, held_seconds):
+        with self._lock:
+            if held_seconds is not None:
+                self.service_seconds = 0.9 * self.service_seconds + 0.1 * held_seconds
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter (active stays the same)
+                self.admitted += 1
+                self._waiters.popleft().wake()
+            else:
+                self.active -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "waiting": len(self._waiters),
+                "queue_size": self.queue_size,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+class TokenBucket:
+    """
+    Per-client token buckets: each client may send `burst` queries at once and `rate` per second after that.
+    """
+
+    def __init__(self, rate, burst, max_clients=MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.rejected = 0
+        # client -> (tokens, last refill time), least recently seen first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client):
+        """
+        Takes one token for the client.
+        :raises RateLimited: If the client's bucket is empty (retry_after: seconds until the next token).
+        """
+        if self.rate <= 0 or not client:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                self.rejected += 1
+                raise RateLimited("Too many queries, please slow down", max(1, math.ceil((1 - tokens) / self.rate)))
+            self._buckets[client] = (tokens - 1, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+
+def _bulkhead(name, limit, queue_size, max_threads):
+    # Caps running plus queued queries to max_threads when queries hold worker threads
+    if WORKER_THREADS and limit + queue_size > max_threads:
+        limit = min(limit, max_threads)
+        queue_size = max_threads - limit
+        print(f"{name} bulkhead capped to {limit} running + {queue_size} queued queries "
+              f"for {WORKER_THREADS} worker threads")
+    return Bulkhead(name, limit, queue_size)
+
+
+# Agent (intent) -> bulkhead; intents without one (greetings, fraud claims, which have their own job queue) are always admitted
+BULKHEADS = {}
+
+
+def configure_worker_threads(worker_threads):
+    """
+    (Re)builds the bulkheads for the number of threads each query may hold.
+    Call it before the worker serves queries (gunicorn.conf.py does in post_worker_init).
+    :param worker_threads: The gthread worker's thread count, or 0 when queries hold no thread.
+    """
+    global WORKER_THREADS, LLM_AGENT_THREADS, DB_AGENT_THREADS
+    WORKER_THREADS = worker_threads
+    LLM_AGENT_THREADS = max(1, WORKER_THREADS // 2 // 3)
+    DB_AGENT_THREADS = max(1, WORKER_THREADS // 4)
+    orders = _bulkhead("orders", DB_AGENT_CONCURRENCY, DB_AGENT_QUEUE, DB_AGENT_THREADS)
+    BULKHEADS.update({
+        "fallback": _bulkhead("fallback", LLM_AGENT_CONCURRENCY, LLM_AGENT_QUEUE, LLM_AGENT_THREADS),
+        "food_query": _bulkhead("food_query", LLM_AGENT_CONCURRENCY, LLM_AGENT_QUEUE, LLM_AGENT_THREADS),
+        "recommendation": _bulkhead("recommendation", LLM_AGENT_CONCURRENCY, LLM_AGENT_QUEUE, LLM_AGENT_THREADS),
+        "order_status": orders,
+        "order_creation": orders,
+    })
+    if WORKER_THREADS and 3 * LLM_AGENT_THREADS + DB_AGENT_THREADS >= WORKER_THREADS:
+        print(f"Warning: {WORKER_THREADS} worker threads leave none free beside the /api/query bulkheads; "
+              f"raise the gthread worker's threads (16 or more)")
+
+
+configure_worker_threads(WORKER_THREADS)
+
+query_rate_limiter = TokenBucket(QUERY_RATE_PER_SECOND, QUERY_BURST)
+
+
+def check_rate_limit(client):
+    """
+    Counts a query against the client's (IP address) token bucket.
+    :raises RateLimited: If the client is over its rate.
+    """
+    query_rate_limiter.take(client)
+
+
+def admit(query: str) -> Slot:
+    """
+    Reserves a slot in the bulkhead of the agent the query will be routed to.
+    The caller must release() the slot once the response is complete.
+    :raises Overloaded: If the agent's queue is full or the wait for a slot times out.
+    """
+    bulkhead = BULKHEADS.get(route_intent(query.lower().strip()))
+    return bulkhead.acquire() if bulkhead else Slot(None)
+
+
+async def admit_async(query: str) -> Slot:
+    """
+    Async variant of admit() for the ASGI app.
+    """
+    bulkhead = BULKHEADS.get(route_intent(query.lower().strip()))
+    return await bulkhead.acquire_async() if bulkhead else Slot(None)
+
+
+def get_admission_stats() -> dict:
+    """
+    Returns the state of every bulkhead and the number of rate-limited queries.
+    """
+    stats = {bulkhead.name: bulkhead.stats() for bulkhead in dict.fromkeys(BULKHEADS.values())}
+    stats["rate_limited"] = query_rate_limiter.rejected
+    return stats
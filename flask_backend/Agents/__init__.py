@@ -1,6 +1,18 @@
 # Agents/__init__.py
 
-from .decision_agent import decide_agent
-from .fraud_detection_agent import handle_fraud_detection
-from .food_recommendation_agent import get_food_recommendations
-from .query_agent import handle_food_query
\ No newline at end of file
+import importlib
+
+# Public agent entry points, imported from their modules on first access
+_EXPORTS = {
+    "decide_agent": "decision_agent",
+    "handle_fraud_detection": "fraud_detection_agent",
+    "get_food_recommendations": "food_recommendation_agent",
+    "handle_food_query": "query_agent",
+}
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f"{__name__}.{module}"), name)
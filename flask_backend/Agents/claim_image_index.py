@@ -0,0 +1,222 @@
+import datetime
+import os
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import errors
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only byte-identical images are matched
+    Image = None
+
+from .image_prep import MemoryViewReader
+
+try:
+    from Db import get_collection
+except ImportError:
+    from flask_backend.Db import get_collection
+
+# Images whose 64-bit difference hashes differ in at most this many bits are duplicates
+DUPLICATE_MAX_DISTANCE = int(os.getenv("CLAIM_DUPLICATE_MAX_DISTANCE", "6"))
+# How often each worker picks up images indexed by other workers
+REFRESH_SECONDS = float(os.getenv("CLAIM_INDEX_REFRESH_SECONDS", "10"))
+# created_at is stamped before the insert, so another worker's claim can commit after a later
+# one was already loaded; each refresh re-reads this many seconds before the newest loaded image
+REFRESH_OVERLAP_SECONDS = float(os.getenv("CLAIM_INDEX_REFRESH_OVERLAP_SECONDS", "60"))
+
+claim_images_collection = get_collection("ClaimImages")
+orders_collection = get_collection("Orders")
+
+
+def difference_hash(image_data):
+    """
+    Computes a 64-bit perceptual difference hash (dHash): the image is shrunk to 9x8
+    grayscale pixels and each bit records whether a pixel is brighter than its right neighbour.
+    Re-encoded, resized or slightly recoloured copies of a photo get the same or a close hash.
+    :param image_data: The image bytes.
+    :return: The hash as an int, or None if Pillow is missing or the image cannot be decoded.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(MemoryViewReader(image_data)) as image:
+            image.draft("L", (64, 64))
+            pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Error hashing claim image: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance: a search within distance d only
+    visits children whose edge distance lies in [dist - d, dist + d].
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, key, entry):
+        self.size += 1
+        if self._root is None:
+            self._root = (key, [entry], {})
+            return
+        node = self._root
+        while True:
+            node_key, entries, children = node
+            distance = hamming_distance(key, node_key)
+            if distance == 0:
+                entries.append(entry)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (key, [entry], {})
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """
+        Returns a list of (distance, entry) for every entry within max_distance of key.
+        """
+        matches = []
+        if self._root is None:
+            return matches
+        stack = [self._root]
+        while stack:
+            node_key, entries, children = stack.pop()
+            distance = hamming_distance(key, node_key)
+            if distance <= max_distance:
+                matches.extend((distance, entry) for entry in entries)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return matches
+
+
+_tree = BKTree()
+_sha256_index = {}
+_state = {"loaded_until": None, "refreshed_at": 0.0}
+# _id -> created_at of the documents indexed within the overlap window (loaded or recorded by this
+# worker), so re-read documents are not indexed twice
+_recent_ids = {}
+_lock = threading.Lock()
+
+
+def _index_entry(document):
+    # Called with _lock held
+    entry = {
+        "order_id": document.get("order_id"),
+        "user_id": document.get("user_id"),
+        "sha256": document.get("sha256"),
+    }
+    if document.get("phash"):
+        _tree.add(int(document["phash"], 16), entry)
+    if entry["sha256"]:
+        _sha256_index.setdefault(entry["sha256"], []).append(entry)
+
+
+def _aware(moment):
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
+
+
+def _refresh():
+    # Incrementally load images indexed since the last refresh (including by other workers)
+    with _lock:
+        if time.monotonic() - _state["refreshed_at"] < REFRESH_SECONDS:
+            return
+        loaded_until = _state["loaded_until"]
+        _state["refreshed_at"] = time.monotonic()
+
+    overlap = datetime.timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+    query = {"created_at": {"$gte": loaded_until - overlap}} if loaded_until else {}
+    try:
+        documents = list(claim_images_collection.find(query).sort("created_at", 1))
+    except errors.PyMongoError as e:
+        print(f"Error loading claim image index: {e}")
+        return
+
+    with _lock:
+        for document in documents:
+            created_at = _aware(document["created_at"])
+            if _state["loaded_until"] is None or created_at > _state["loaded_until"]:
+                _state["loaded_until"] = created_at
+            if document["_id"] in _recent_ids:
+                continue
+            _recent_ids[document["_id"]] = created_at
+            _index_entry(document)
+        if _state["loaded_until"] is not None:
+            # Documents older than the window are never re-read, so their ids can be forgotten
+            cutoff = _state["loaded_until"] - overlap
+            for document_id in [key for key, created_at in _recent_ids.items() if created_at < cutoff]:
+                del _recent_ids[document_id]
+
+
+def _order_user_id(order_id):
+    try:
+        order = orders_collection.find_one({"order_id": order_id}, {"user_ID": 1})
+        return order.get("user_ID") if order else None
+    except errors.PyMongoError as e:
+        print(f"Error looking up order {order_id}: {e}")
+        return None
+
+
+def check_and_record(image_data, order_id, sha256=None):
+    """
+    Looks up earlier claims with the same or a perceptually similar image, then indexes this one.
+    :param image_data: The claim image bytes.
+    :param order_id: The order the claim is for.
+    :param sha256: Optional content hash of the image (from the upload store).
+    :return: A dict with 'duplicate_orders' (other orders claimed with this image),
+             'cross_account' (True if any of them belongs to another user) and 'distance'
+             (smallest Hamming distance, 0 for identical images).
+    """
+    _refresh()
+    phash = difference_hash(image_data)
+    user_id = _order_user_id(order_id)
+
+    with _lock:
+        matches = _tree.search(phash, DUPLICATE_MAX_DISTANCE) if phash is not None else []
+        if sha256:
+            matches.extend((0, entry) for entry in _sha256_index.get(sha256, []))
+
+    others = [(distance, entry) for distance, entry in matches if entry["order_id"] != order_id]
+    result = {
+        "duplicate_orders": sorted({entry["order_id"] for _, entry in others}),
+        "cross_account": any(
+            entry["user_id"] and user_id and entry["user_id"] != user_id for _, entry in others
+        ),
+        "distance": min((distance for distance, _ in others), default=None),
+    }
+
+    document = {
+        "_id": ObjectId(),
+        "order_id": order_id,
+        "user_id": user_id,
+        "sha256": sha256,
+        "phash": f"{phash:016x}" if phash is not None else None,
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+    }
+    with _lock:
+        _index_entry(document)
+        _recent_ids[document["_id"]] = document["created_at"]
+    try:
+        claim_images_collection.insert_one(dict(document))
+    except errors.PyMongoError as e:
+        print(f"Error recording claim image: {e}")
+        with _lock:
+            _recent_ids.pop(document["_id"], None)
+    return result
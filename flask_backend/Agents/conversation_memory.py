@@ -0,0 +1,237 @@
+import datetime
+import json
+import os
+import re
+import uuid
+
+from pymongo import errors
+
+from . import registry
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; without it tokens are estimated from the text length
+    tiktoken = None
+
+try:
+    from Db import get_collection
+except ImportError:
+    from flask_backend.Db import get_collection
+
+# Conversation memory settings (override through environment variables)
+# Recent turns sent to the model with each query
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1000"))
+# Longest rolling summary of older turns
+SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "250"))
+# Longest single stored turn (long recommendation lists are cut)
+MAX_TURN_TOKENS = int(os.getenv("CHAT_MAX_TURN_TOKENS", "300"))
+# Idle sessions are deleted by the expires_at TTL index after this long
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+SESSION_COLLECTION = "ChatSessions"
+# Tries at saving a turn while other requests keep updating the same session
+SAVE_ATTEMPTS = 5
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_LLM = registry.register_llm(SUMMARY_MODEL, temperature=0)
+
+SUMMARY_PROMPT = """
+        Update the summary of a conversation between a user and a food ordering assistant.
+        Keep the user's preferences, dietary restrictions, dishes and order IDs mentioned.
+        Answer with the new summary only, in at most {max_words} words.
+
+        Current summary: "{summary}"
+
+        New messages:
+        {messages}
+        """
+
+_encoding = {"loaded": False, "value": None}
+
+
+def _get_encoding():
+    # tiktoken downloads the encoding on first use; if that fails, token counts are estimated
+    if not _encoding["loaded"]:
+        _encoding["loaded"] = True
+        if tiktoken is not None:
+            try:
+                _encoding["value"] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Error loading tiktoken encoding, estimating token counts instead: {e}")
+    return _encoding["value"]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with tiktoken (about 4 characters per token without it).
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate(text: str, max_tokens: int, keep_end=False) -> str:
+    # Cuts text to max_tokens, keeping its beginning (or its end with keep_end)
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is None:
+        return "..." + text[-max_tokens * 4:] if keep_end else text[:max_tokens * 4] + "..."
+    tokens = encoding.encode(text, disallowed_special=())
+    if keep_end:
+        return "..." + encoding.decode(tokens[-max_tokens:])
+    return encoding.decode(tokens[:max_tokens]) + "..."
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    """
+    Returns the client-supplied session id if it looks like one issued by new_session_id(), else None.
+    """
+    if isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id):
+        return session_id
+    return None
+
+
+def response_text(agent_response) -> str:
+    """
+    Flattens an agent response (text, recommendation list or order card) into the text stored as a turn.
+    """
+    if isinstance(agent_response, dict) and isinstance(agent_response.get("response"), str):
+        return agent_response["response"]
+    if isinstance(agent_response, dict):
+        return json.dumps(agent_response.get("response", agent_response), default=str)
+    if isinstance(agent_response, list):
+        return "\n".join(item if isinstance(item, str) else json.dumps(item, default=str) for item in agent_response)
+    return str(agent_response)
+
+
+def _load(session_id):
+    try:
+        return get_collection(SESSION_COLLECTION).find_one({"_id": session_id}) or {}
+    except errors.PyMongoError as e:
+        print(f"Error loading chat session {session_id}: {e}")
+        return {}
+
+
+def get_context(session_id) -> dict:
+    """
+    Returns what the model should see of the conversation so far.
+    :param session_id: The chat session id (None for a new session).
+    :return: {"summary": str, "turns": [{"role", "content"}]} where turns is the newest
+             window fitting HISTORY_TOKEN_BUDGET, oldest first.
+    """
+    if not session_id:
+        return {"summary": "", "turns": []}
+    session = _load(session_id)
+    window, tokens = [], 0
+    for turn in reversed(session.get("turns", [])):
+        tokens += turn["tokens"]
+        if tokens > HISTORY_TOKEN_BUDGET:
+            break
+        window.append({"role": turn["role"], "content": turn["content"]})
+    window.reverse()
+    return {"summary": session.get("summary", ""), "turns": window}
+
+
+def context_messages(context) -> list:
+    """
+    Converts get_context() output into chat messages to place between the system prompt and the query.
+    """
+    if not context:
+        return []
+    messages = []
+    if context["summary"]:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {context['summary']}"})
+    messages.extend(context["turns"])
+    return messages
+
+
+def cache_prompt(query: str, context) -> str:
+    """
+    Returns the prompt to key the LLM response cache on: the query alone for a fresh
+    conversation, otherwise the query together with the context it is answered in.
+    """
+    if not context or (not context["summary"] and not context["turns"]):
+        return query
+    return json.dumps([context["summary"], context["turns"], query])
+
+
+def _summarize(summary: str, turns: list) -> str:
+    # Folds evicted turns into the rolling summary; keeps the user's questions if the model is unavailable
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    try:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=SUMMARY_TOKEN_BUDGET * 3 // 4, summary=summary, messages=transcript
+        )
+        new_summary = registry.get(SUMMARY_LLM).invoke([{"role": "user", "content": prompt}]).content.strip()
+    except Exception as e:
+        print(f"Error summarizing chat history: {e}")
+        asked = "; ".join(turn["content"] for turn in turns if turn["role"] == "user")
+        return _truncate(f"{summary} The user asked: {asked}".strip(), SUMMARY_TOKEN_BUDGET, keep_end=True)
+    return _truncate(new_summary, SUMMARY_TOKEN_BUDGET)
+
+
+def _save(session_id, version, turns, summary) -> bool:
+    # Writes the session only if it is still at the version it was read at; False on a conflict
+    now = datetime.datetime.now(datetime.timezone.utc)
+    update = {
+        "$set": {
+            "turns": turns,
+            "summary": summary,
+            "updated_at": now,
+            "expires_at": now + datetime.timedelta(seconds=SESSION_TTL_SECONDS),
+        },
+        "$inc": {"version": 1},
+        "$setOnInsert": {"created_at": now},
+    }
+    collection = get_collection(SESSION_COLLECTION)
+    try:
+        if version is None:
+            # A new session (or one saved before sessions had a version); if another request
+            # created it meanwhile, the insert fails on _id
+            collection.update_one({"_id": session_id, "version": {"$exists": False}}, update, upsert=True)
+            return True
+        return collection.update_one({"_id": session_id, "version": version}, update).matched_count == 1
+    except errors.DuplicateKeyError:
+        return False
+    except errors.PyMongoError as e:
+        print(f"Error saving chat session {session_id}: {e}")
+        return True
+
+
+def record_turn(session_id, query: str, response: str):
+    """
+    Appends a user query and the assistant's response to the session. Once the stored turns
+    exceed the window budget, the oldest are folded into the rolling summary until half the
+    budget is left, so summarizing costs one small LLM call every few turns rather than every turn.
+    The session is saved only if no other turn was saved since it was read (its version is
+    unchanged); otherwise it is read again, so concurrent turns never overwrite each other.
+    :param session_id: The chat session id.
+    :param query: The user's query.
+    :param response: The assistant's response text (see response_text()).
+    """
+    new_turns = []
+    for role, content in (("user", query), ("assistant", response)):
+        content = _truncate(content, MAX_TURN_TOKENS)
+        new_turns.append({"role": role, "content": content, "tokens": count_tokens(content)})
+
+    for _ in range(SAVE_ATTEMPTS):
+        session = _load(session_id)
+        turns = session.get("turns", []) + new_turns
+        summary = session.get("summary", "")
+
+        if sum(turn["tokens"] for turn in turns) > HISTORY_TOKEN_BUDGET:
+            evicted = []
+            while turns and sum(turn["tokens"] for turn in turns) > HISTORY_TOKEN_BUDGET // 2:
+                evicted.append(turns.pop(0))
+            summary = _summarize(summary, evicted)
+
+        if _save(session_id, session.get("version"), turns, summary):
+            return
+    print(f"Error saving chat session {session_id}: too many concurrent updates")
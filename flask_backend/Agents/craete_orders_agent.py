@@ -1,20 +1,23 @@
-from langchain.tools import tool
-from langchain_openai import ChatOpenAI
-import os
-import random
+import datetime
 
-# Initialize OpenAI model for natural language processing
-llm = ChatOpenAI(
-    temperature=0.7,
-    model="GPT-4o mini",
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+from pymongo import errors
 
-# Mock database for storing orders
-orders_db = {
-    "12345": {"status": "Shipped", "delivery_date": "2024-11-25"},
-    "67890": {"status": "Processing", "delivery_date": "2024-11-28"},
-}
+try:
+    from Db import get_collection
+    from OrderIds import generate_order_id
+except ImportError:
+    from flask_backend.Db import get_collection
+    from flask_backend.OrderIds import generate_order_id
+
+from .fetch_orders import ORDER_ID_PATTERN
+
+# Orders placed through the chatbot go to the same collection as checkout orders (shared pool from Db.py)
+orders_collection = get_collection('Orders')
+
+# Status of a newly placed order
+NEW_ORDER_STATUS = "Processing"
+# Attempts to insert an order before giving up on order id collisions
+MAX_INSERT_ATTEMPTS = 3
 
 # Mock food item data
 food_item = {
@@ -27,99 +30,107 @@ food_item = {
     "spiceLevel": "Mild"
 }
 
-def generate_order_id():
-    """Generate a random 6-digit order ID."""
-    return str(random.randint(100000, 999999))
-
-@tool("handle_order_status", return_direct=True)
 def handle_order_status(query: str) -> str:
     """
     Handle customer queries about order status.
     """
     try:
         # Extract order ID from query
-        order_id = query.split()[-1]  # Assume the order ID is the last word
-        order = orders_db.get(order_id)
+        order_id_match = ORDER_ID_PATTERN.search(query.upper())
+        if not order_id_match:
+            return "Please include your order ID (e.g. ORD-123456) so I can look it up."
+        order = orders_collection.find_one({"order_id": order_id_match.group(0)}, {"status": 1})
         if order:
-        # if True:
-            return f"Order ID 12345"
+            return f"Order {order_id_match.group(0)} status: {order.get('status', NEW_ORDER_STATUS)}"
         else:
             return "Sorry, I couldn't find an order with that ID."
     except Exception as e:
         return f"Error retrieving order status: {e}"
 
-# @tool("place_order", return_direct=True)
-# def handle_place_order(query: str, additional_input: dict) -> str:
+def build_order_document(order_id, additional_input: dict, user_id) -> dict:
     """
-    Handle customer requests to place a new order.
+    Builds an Orders document (same fields as a checkout line item) from the chatbot's order form.
+    :param additional_input: {"userDetails": {...}, "foodItem": {...} or name, "quantity": int}.
+    :param user_id: The owner of the order, from the request's session token (never from the form).
+    :raises ValueError: If a required detail is missing or the quantity is not a positive number.
     """
+    user_details = additional_input.get("userDetails") or {}
+    food = additional_input.get("foodItem")
+    food_name = food.get("name") if isinstance(food, dict) else food
     try:
-        # Simulate storing order details in the database
-        order_id = generate_order_id()
-        orders_db[order_id] = {
-            "userDetails": additional_input["userDetails"],
-            "foodItem": additional_input["foodItem"],
-            "quantity": additional_input["quantity"]
-        }
-        return f"Order placed successfully! Your Order ID is {order_id}."
-    except Exception as e:
-        return f"Error placing order: {e}"
-
-# @tool("place_order", return_direct=True)
-# def handle_place_order(query: str, additional_input: dict) -> str:
+        quantity = int(additional_input.get("quantity", 1))
+    except (TypeError, ValueError):
+        raise ValueError("Quantity must be a number.")
+
+    if not food_name:
+        raise ValueError("Food item is required.")
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+    missing = [key for key in ("name", "email", "address") if not user_details.get(key)]
+    if missing:
+        raise ValueError(f"Missing order details: {', '.join(missing)}.")
+
+    # Payment details from the form are never stored
+    return {
+        "collecting_order": True,
+        "user_ID": user_id,
+        "fooditem_name": food_name,
+        "Name": user_details.get("name"),
+        "phone_number": user_details.get("phone"),
+        "email": user_details.get("email"),
+        "quantity": quantity,
+        "delivery_address": user_details.get("address"),
+        "order_id": order_id,
+        "line_no": 0,
+        "status": NEW_ORDER_STATUS,
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+    }
+
+def insert_order(additional_input: dict, user_id) -> str:
     """
-    Handle customer requests to place a new order.
+    Stores a new single-item order and returns its id.
+    The insert is a single atomic write; the unique (order_id, line_no) index rejects an id
+    that is already taken, in which case a fresh id is drawn.
+    :raises ValueError: If the order details are invalid.
     """
-    try:
-        # Generate a unique order ID
+    for attempt in range(MAX_INSERT_ATTEMPTS):
         order_id = generate_order_id()
-
-        # Store the order in the mock database
-        orders_db[order_id] = {
-            "userDetails": additional_input["userDetails"],
-            "foodItem": additional_input["foodItem"],
-            "quantity": additional_input["quantity"]
-        }
-
-        # Return a success message with the order ID
-        return f"Order placed successfully! Your Order ID is {order_id}. Thank you for ordering!"
-    except Exception as e:
-        return f"Error placing order: {e}"
-    
-@tool("place_order", return_direct=True)
-def handle_place_order(query: str, additional_input: dict) -> str:
+        try:
+            orders_collection.insert_one(build_order_document(order_id, additional_input, user_id))
+            return order_id
+        except errors.DuplicateKeyError:
+            print(f"Order ID {order_id} already taken, retrying")
+    raise errors.PyMongoError("Could not allocate a unique order ID")
+
+def handle_place_order(query: str, additional_input: dict, user_id=None) -> str:
     """
     Handle customer requests to place a new order.
+    :param user_id: The authenticated user (None if the request had no valid session token).
     """
+    if not user_id:
+        return "Please log in to place an order."
     try:
-        # Generate a unique order ID
-        order_id = generate_order_id()
-
-        print("Query received:", query)
-        print("Additional Input:", additional_input)
-
-
-        # Store the order in the mock database
-        orders_db[order_id] = {
-            "userDetails": additional_input["userDetails"],
-            "foodItem": additional_input["foodItem"],
-            "quantity": additional_input["quantity"],
-        }
+        order_id = insert_order(additional_input, user_id)
 
         # Return a success message with the order ID
         return f"Order placed successfully! Your Order ID is {order_id}. Thank you for ordering!"
+    except ValueError as e:
+        return f"Could not place the order: {e}"
     except Exception as e:
-        return f"Error placing order: {e}"
+        print(f"Error placing order: {e}")
+        return "Error placing order. Please try again later."
 
-def handle_order_creation(query: str, additional_input=None) -> dict:
+def handle_order_creation(query: str, additional_input=None, user_id=None) -> dict:
     """
     Determines whether the query is about order status or placing a new order.
+    :param user_id: The authenticated user new orders are placed for (see Auth.optional_user).
     """
-    if "status" or "track my order" in query.lower():
+    query_lower = query.lower()
+    if "status" in query_lower or "track my order" in query_lower:
         return {"response": handle_order_status(query)}
-    elif "place order" in query.lower():
+    elif "order" in query_lower:
         if additional_input:  # Check if additional input is provided
-            return {"response": handle_place_order(query, additional_input)}
+            return {"response": handle_place_order(query, additional_input, user_id)}
         else:
             # Confirm ordering and show product card with quantity controls
             return {
@@ -128,23 +139,3 @@ def handle_order_creation(query: str, additional_input=None) -> dict:
             }
     else:
         return {"response": "I'm sorry, I couldn't understand your order-related query. Please provide more details."}
-
-
-# def handle_orders(query: str, additional_input=None) -> dict:
-    """
-    Determines whether the query is about order status or placing a new order.
-    """
-    if "status" in query.lower():
-        return {"response": handle_order_status(query)}
-    elif "place order" in query.lower():
-        if additional_input:
-            return {"response": handle_place_order(query, additional_input)}
-        else:
-            # Confirm ordering and show product card with quantity controls
-            return {
-                "response": "Would you like to place an order for this item?",
-                "foodItem": food_item,
-            }
-        
-    else:
-        return {"response": "I'm sorry, I couldn't understand your order-related query. Please provide more details."}
\ No newline at end of file
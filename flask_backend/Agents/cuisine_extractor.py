@@ -0,0 +1,112 @@
+import re
+import threading
+from functools import lru_cache
+
+# Words that point to a cuisine without naming it
+CUISINE_SYNONYMS = {
+    "italy": "italian", "pasta": "italian", "pizza": "italian", "spaghetti": "italian",
+    "lasagna": "italian", "risotto": "italian", "carbonara": "italian",
+    "india": "indian", "biryani": "indian", "tikka": "indian", "masala": "indian",
+    "naan": "indian", "paneer": "indian", "tandoori": "indian",
+    "china": "chinese", "dumpling": "chinese", "dumplings": "chinese", "chow": "chinese",
+    "kung": "chinese", "wonton": "chinese",
+    "mexico": "mexican", "taco": "mexican", "tacos": "mexican", "burrito": "mexican",
+    "burritos": "mexican", "quesadilla": "mexican", "enchilada": "mexican", "nachos": "mexican",
+    "thailand": "thai",
+    "japan": "japanese", "sushi": "japanese", "ramen": "japanese", "tempura": "japanese",
+    "teriyaki": "japanese", "udon": "japanese",
+    "korea": "korean", "kimchi": "korean", "bibimbap": "korean", "bulgogi": "korean",
+    "america": "american", "usa": "american", "burger": "american", "burgers": "american",
+}
+
+# Minimum confidence for the local result to be used instead of the LLM
+FAST_PATH_MIN_CONFIDENCE = 0.8
+# Tokens shorter than this are never fuzzy matched ("an", "me", ...)
+MIN_FUZZY_TOKEN_LENGTH = 3
+
+_TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+_stats = {"fast_path_hits": 0, "llm_fallbacks": 0}
+_stats_lock = threading.Lock()
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions),
+    so 'italain' is one edit away from 'italian'.
+    """
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+@lru_cache(maxsize=4096)
+def _match_token(token: str, known_cuisines: frozenset) -> tuple:
+    # Exact cuisine names and synonyms are certain; otherwise take the closest cuisine name
+    if token in known_cuisines:
+        return token, 1.0
+    if token in CUISINE_SYNONYMS and CUISINE_SYNONYMS[token] in known_cuisines:
+        return CUISINE_SYNONYMS[token], 1.0
+    if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+        return None, 0.0
+
+    best, best_confidence = None, 0.0
+    for cuisine in known_cuisines:
+        # Cheap length filter before running the O(n*m) distance
+        if abs(len(cuisine) - len(token)) > 2:
+            continue
+        confidence = 1.0 - edit_distance(token, cuisine) / len(cuisine)
+        if confidence > best_confidence:
+            best, best_confidence = cuisine, confidence
+    return best, best_confidence
+
+
+def extract_cuisine(user_query: str, known_cuisines) -> tuple:
+    """
+    Extracts the cuisine(s) mentioned in a query without calling the LLM.
+    :param user_query: The user's input query.
+    :param known_cuisines: Normalized (lowercase) cuisine names to match against.
+    :return: A tuple (cuisine, confidence). Several confidently matched cuisines are
+             returned comma-separated; cuisine is None when nothing matched.
+    """
+    known_cuisines = frozenset(known_cuisines)
+    matches = {}
+    for token in _TOKEN_PATTERN.findall(user_query.lower()):
+        cuisine, confidence = _match_token(token, known_cuisines)
+        if cuisine and confidence > matches.get(cuisine, 0.0):
+            matches[cuisine] = confidence
+
+    confident = [cuisine for cuisine, confidence in matches.items() if confidence >= FAST_PATH_MIN_CONFIDENCE]
+    if confident:
+        return ", ".join(confident), min(matches[cuisine] for cuisine in confident)
+    if matches:
+        cuisine = max(matches, key=matches.get)
+        return cuisine, matches[cuisine]
+    return None, 0.0
+
+
+def record_fast_path(hit: bool):
+    """
+    Records whether a query was resolved locally (hit) or had to go to the LLM.
+    """
+    with _stats_lock:
+        _stats["fast_path_hits" if hit else "llm_fallbacks"] += 1
+
+
+def get_extractor_stats() -> dict:
+    """
+    Returns fast-path hit/fallback counters and the fast-path hit rate.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["fast_path_hits"] + stats["llm_fallbacks"]
+    stats["hit_rate"] = stats["fast_path_hits"] / total if total else 0.0
+    return stats
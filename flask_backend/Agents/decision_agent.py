@@ -1,86 +1,150 @@
-import uuid
-
 from werkzeug.datastructures import FileStorage
 
-from .food_recommendation_agent import get_food_recommendations
-from .query_agent import handle_food_query
+from .food_recommendation_agent import get_food_recommendations, get_food_recommendations_async
+from .query_agent import handle_food_query, handle_food_query_async, stream_food_query, stream_food_query_async
 from .fraud_detection_agent import handle_fraud_detection
-from .fetch_orders import handle_orders
-from .craete_orders_agent import handle_order_creation
-import os
+from .fetch_orders import handle_orders, handle_orders_async
+from .response_cache import cached_llm_call, cached_llm_call_async, cached_llm_stream, cached_llm_stream_async
+from .intent_router import route_intent
+from .upload_store import store_upload
+from . import registry
+from .conversation_memory import cache_prompt, context_messages
+import asyncio
+import time
 
-# Initialize OpenAI model for dynamic responses
-from langchain_openai import ChatOpenAI
+try:
+    from Metrics import observe_agent
+except ImportError:
+    from flask_backend.Metrics import observe_agent
 
-llm = ChatOpenAI(
-    temperature=0.7,
-    model="gpt-4",
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+# OpenAI model for dynamic responses (built on first use)
+DYNAMIC_MODEL = "gpt-4"
+DYNAMIC_LLM = registry.register_llm(DYNAMIC_MODEL)
 
 def save_image(image_file):
-    """Saves the uploaded image to the uploads directory."""
-    uploads_dir = os.path.join(os.getcwd(), "uploads")
-    if not os.path.exists(uploads_dir):
-        os.makedirs(uploads_dir)
+    """Saves the uploaded image to the content-addressed upload store and returns its path."""
+    return store_upload(image_file)["path"]
 
-    image_filename = f"{uuid.uuid4()}-{image_file.filename}"
-    image_path = os.path.join(uploads_dir, image_filename)
-    image_file.save(image_path)
-    return image_path
+GREETING_RESPONSE = "Hi, Welcome to Cuisine Connect! How may I assist you today?"
+
+# System prompt of the fallback assistant
+DYNAMIC_SYSTEM_PROMPT = (
+    "You are a helpful and friendly assistant specialized in food and cuisines. "
+    "You can answer questions about food recommendations, allergens, ingredients, cooking methods, and health benefits. "
+    "If someone asks 'What can you do?', explain your capabilities conversationally."
+)
 
-def generate_dynamic_response(query: str) -> dict:
+def _dynamic_messages(query, history=None):
+    return [
+        {"role": "system", "content": DYNAMIC_SYSTEM_PROMPT},
+        *context_messages(history),
+        {"role": "user", "content": query}
+    ]
+
+def _response_text(response):
+    return response.content.strip() if hasattr(response, "content") else response["content"]
+
+def generate_dynamic_response(query: str, history=None) -> dict:
     """
     Generates a fallback response using GPT-4 for unrecognized queries.
     :param query: The user's unrecognized query.
+    :param history: Optional conversation context (see conversation_memory.get_context()).
     :return: A dictionary containing the dynamically generated response.
     """
     try:
-        system_prompt = (
-            "You are a helpful and friendly assistant specialized in food and cuisines. "
-            "You can answer questions about food recommendations, allergens, ingredients, cooking methods, and health benefits. "
-            "If someone asks 'What can you do?', explain your capabilities conversationally."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ]
-
-        response = llm.invoke(messages)
-        content = response.content.strip() if hasattr(response, "content") else response["content"]
+        messages = _dynamic_messages(query, history)
+
+        def call_llm():
+            return _response_text(registry.get(DYNAMIC_LLM).invoke(messages))
+
+        # Repeated questions ("What can you do?") are answered from the response cache
+        content = cached_llm_call(DYNAMIC_MODEL, DYNAMIC_SYSTEM_PROMPT, cache_prompt(query, history), call_llm)
+        return {"response": content}
+    except Exception as e:
+        print(f"Error generating dynamic response: {e}")
+        return {"response": "I'm sorry, I couldn't generate a response. Please try again later."}
+
+async def generate_dynamic_response_async(query: str, history=None) -> dict:
+    """
+    Async variant of generate_dynamic_response().
+    """
+    try:
+        messages = _dynamic_messages(query, history)
+
+        async def acall():
+            return _response_text(await registry.get(DYNAMIC_LLM).ainvoke(messages))
+
+        content = await cached_llm_call_async(DYNAMIC_MODEL, DYNAMIC_SYSTEM_PROMPT, cache_prompt(query, history), acall)
         return {"response": content}
     except Exception as e:
         print(f"Error generating dynamic response: {e}")
         return {"response": "I'm sorry, I couldn't generate a response. Please try again later."}
 
-def decide_agent(query: str, additional_input=None):
+def stream_dynamic_response(query: str, history=None):
+    """
+    Streaming variant of generate_dynamic_response(): yields text chunks as GPT-4 generates them.
+    """
+    messages = _dynamic_messages(query, history)
+
+    def stream():
+        for chunk in registry.get(DYNAMIC_LLM).stream(messages):
+            if chunk.content:
+                yield chunk.content
+
+    return cached_llm_stream(DYNAMIC_MODEL, DYNAMIC_SYSTEM_PROMPT, cache_prompt(query, history), stream)
+
+def stream_dynamic_response_async(query: str, history=None):
+    """
+    Async variant of stream_dynamic_response().
+    """
+    messages = _dynamic_messages(query, history)
+
+    async def astream():
+        async for chunk in registry.get(DYNAMIC_LLM).astream(messages):
+            if chunk.content:
+                yield chunk.content
+
+    return cached_llm_stream_async(DYNAMIC_MODEL, DYNAMIC_SYSTEM_PROMPT, cache_prompt(query, history), astream)
+
+def _failed(response) -> bool:
+    # For the per-intent metrics: the agent raised (None) or answered with an error
+    return response is None or (isinstance(response, dict) and "error" in response)
+
+def decide_agent(query: str, additional_input=None, history=None, user_id=None):
     """
     Decides which agent to invoke based on the query content.
     :param query: The user's query.
     :param additional_input: Optional additional data (e.g., images, descriptions).
+    :param history: Optional conversation context for the LLM-backed agents (see conversation_memory).
+    :param user_id: The user from the request's session token; orders are only placed for them.
     :return: Response from the selected agent.
     """
+    intent = route_intent(query.lower().strip())
+    start = time.perf_counter()
+    response = None
+    try:
+        response = _run_agent(intent, query, additional_input, history, user_id)
+        return response
+    finally:
+        observe_agent(intent, time.perf_counter() - start, _failed(response))
+
+def _run_agent(intent, query, additional_input=None, history=None, user_id=None):
     query_lower = query.lower().strip()
 
     # Handle greetings
-    greeting_keywords = ["hi", "hello", "how are you", "hey"]
-    if any(keyword in query_lower for keyword in greeting_keywords):
-        return "Hi, Welcome to Cuisine Connect! How may I assist you today?"
+    if intent == "greeting":
+        return GREETING_RESPONSE
 
     # Handle food recommendations
-    recommendation_keywords = ["recommend", "show", "list", "suggest", "give"]
-    if any(keyword in query_lower for keyword in recommendation_keywords):
+    if intent == "recommendation":
         return get_food_recommendations(query)
 
     # Handle general food-related queries
-    query_keywords = ["allergen", "ingredients", "calories", "health", "explain", "details", "information"]
-    if any(keyword in query_lower for keyword in query_keywords):
-        return handle_food_query(query)
+    if intent == "food_query":
+        return handle_food_query(query, history)
 
     # Handle fraud or product issue queries
-    fraud_keywords = ["fraud", "issue", "problem", "defective", "damaged", "broken"]
-    if any(keyword in query_lower for keyword in fraud_keywords):
+    if intent == "fraud":
         if additional_input:
             # Check for missing inputs
             missing_keys = [key for key in ["image", "description", "order_id"] if key not in additional_input]
@@ -104,15 +168,111 @@ def decide_agent(query: str, additional_input=None):
         else:
             return {"error": "Additional input (image, description, order_id) required for fraud detection."}
 
-    order_status_keywords = ["order status", "shipping status", "defective", "spoiled","damaged", "refund", "replace"]
-    if any(keyword in query_lower for keyword in order_status_keywords):
+    if intent == "order_status":
         return handle_orders(query)
 
     print(f"Query: {query_lower}")
-    order_creation_keywords = ["place order"]
-    if any(keyword in query_lower for keyword in order_creation_keywords):
+    if intent == "order_creation":
         print("Handling order creation")
-        return handle_order_creation(query, additional_input)
+        # The mock order agent is only imported when an order query arrives
+        from .craete_orders_agent import handle_order_creation
+        return handle_order_creation(query, additional_input, user_id)
 
     # Dynamic fallback for unrecognized queries
-    return generate_dynamic_response(query)
\ No newline at end of file
+    return generate_dynamic_response(query, history)
+
+async def decide_agent_async(query: str, additional_input=None, history=None, user_id=None):
+    """
+    Async variant of decide_agent() for the ASGI app: OpenAI and MongoDB calls are awaited,
+    so one worker can hold many in-flight chatbot requests.
+    :param query: The user's query.
+    :param additional_input: Optional additional data (e.g., images, descriptions).
+    :param history: Optional conversation context for the LLM-backed agents.
+    :param user_id: The user from the request's session token; orders are only placed for them.
+    :return: Response from the selected agent.
+    """
+    intent = route_intent(query.lower().strip())
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await _run_agent_async(intent, query, additional_input, history, user_id)
+        return response
+    finally:
+        observe_agent(intent, time.perf_counter() - start, _failed(response))
+
+async def _run_agent_async(intent, query, additional_input=None, history=None, user_id=None):
+    if intent == "greeting":
+        return GREETING_RESPONSE
+    if intent == "recommendation":
+        return await get_food_recommendations_async(query)
+    if intent == "food_query":
+        return await handle_food_query_async(query, history)
+    if intent == "order_status":
+        return await handle_orders_async(query)
+    if intent in ("fraud", "order_creation"):
+        # Uploads and the mock order agent are not async; keep them off the event loop
+        return await asyncio.to_thread(_run_agent, intent, query, additional_input, None, user_id)
+
+    return await generate_dynamic_response_async(query, history)
+
+def _streamed_text_intent(query: str):
+    # Intents answered with free text from a single LLM call, which can be streamed token by token
+    intent = route_intent(query.lower().strip())
+    return intent if intent in ("food_query", "fallback") else None
+
+def stream_agent(query: str, additional_input=None, history=None, user_id=None):
+    """
+    Streaming variant of decide_agent(). Yields ("token", text) events while the fallback and
+    general food answers are generated, then one ("done", response) event with the same
+    response decide_agent() would return (recommendations, order details, ...).
+    :param query: The user's query.
+    :param additional_input: Optional additional data (e.g., images, descriptions).
+    :param history: Optional conversation context for the LLM-backed agents.
+    :param user_id: The user from the request's session token (see decide_agent).
+    :return: An iterator of (event, data) tuples.
+    """
+    intent = _streamed_text_intent(query)
+    if intent is None:
+        yield "done", decide_agent(query, additional_input, history, user_id)
+        return
+
+    chunks = []
+    start = time.perf_counter()
+    try:
+        tokens = stream_food_query(query, history) if intent == "food_query" else stream_dynamic_response(query, history)
+        for token in tokens:
+            chunks.append(token)
+            yield "token", token
+    except Exception as e:
+        print(f"Error streaming response: {e}")
+        if not chunks:
+            observe_agent(intent, time.perf_counter() - start, error=True)
+            yield "done", {"response": "I'm sorry, I couldn't generate a response. Please try again later."}
+            return
+    observe_agent(intent, time.perf_counter() - start)
+    yield "done", {"response": "".join(chunks).strip()}
+
+async def stream_agent_async(query: str, additional_input=None, history=None, user_id=None):
+    """
+    Async variant of stream_agent() used by the ASGI app.
+    """
+    intent = _streamed_text_intent(query)
+    if intent is None:
+        yield "done", await decide_agent_async(query, additional_input, history, user_id)
+        return
+
+    chunks = []
+    start = time.perf_counter()
+    try:
+        tokens = stream_food_query_async(query, history) if intent == "food_query" else stream_dynamic_response_async(query, history)
+        async for token in tokens:
+            chunks.append(token)
+            yield "token", token
+    except Exception as e:
+        print(f"Error streaming response: {e}")
+        if not chunks:
+            observe_agent(intent, time.perf_counter() - start, error=True)
+            yield "done", {"response": "I'm sorry, I couldn't generate a response. Please try again later."}
+            return
+    observe_agent(intent, time.perf_counter() - start)
+    yield "done", {"response": "".join(chunks).strip()}
@@ -1,36 +1,56 @@
 from flask import Flask, request, jsonify
-from pymongo import MongoClient
 import re
 
+try:
+    from Db import get_async_collection, get_collection
+except ImportError:
+    from flask_backend.Db import get_async_collection, get_collection
+
+from .single_flight import single_flight
+
 app = Flask(__name__)
 
-# MongoDB connection setup
-client = MongoClient('mongodb://localhost:27017/')  # Connect to your MongoDB server
-db = client['CuisineConnect']  # Use the 'Foodservices' database
-orders_collection = db['Orders']  # Use the 'Orders' collection
+# MongoDB connection setup (shared pool from Db.py)
+orders_collection = get_collection('Orders')  # Use the 'Orders' collection
+
+ORDER_ID_PATTERN = re.compile(r'\bORD-\d+\b')
+
+
+def order_lookup_key(query):
+    # Concurrent lookups of the same order (e.g. client retries) share one query; see single_flight
+    match = ORDER_ID_PATTERN.search(query)
+    return match.group(0) if match else None
+
 
+def format_order_details(order):
+    """
+    Formats an Orders document for the chatbot's order card.
+    """
+    return {
+        "orderId": order.get("order_id"),
+        "userId": order.get("user_ID"),
+        "foodItem": order.get("fooditem_name"),
+        "name": order.get("Name"),
+        "phoneNumber": order.get("phone_number"),
+        "email": order.get("email"),
+        "quantity": order.get("quantity"),
+        "deliveryAddress": order.get("delivery_address"),
+        "collectingOrder": order.get("collecting_order", False),
+        "status": order.get("status")
+    }
+
+
+@single_flight(key=order_lookup_key)
 def handle_orders(query):
     try:
-        order_id_match = re.search(r'\bORD-\d+\b', query)
+        order_id_match = ORDER_ID_PATTERN.search(query)
 
         if order_id_match:
             order_id = order_id_match.group(0)
             order = orders_collection.find_one({"order_id": order_id})
 
             if order:
-                order_details = {
-                    "orderId": order.get("order_id"),
-                    "userId": order.get("user_ID"),
-                    "foodItem": order.get("fooditem_name"),
-                    "name": order.get("Name"),
-                    "phoneNumber": order.get("phone_number"),
-                    "email": order.get("email"),
-                    "quantity": order.get("quantity"),
-                    "deliveryAddress": order.get("delivery_address"),
-                    "collectingOrder": order.get("collecting_order", False),
-                    "status": order.get("status")
-                }
-                return {"response": order_details}
+                return {"response": format_order_details(order)}
             else:
                 return {"response": "No order found with the provided order ID."}
         else:
@@ -38,3 +58,26 @@ def handle_orders(query):
     except Exception as e:
         print(f"Error in handle_orders: {e}")
         return {"response": "An error occurred while processing the order query."}
+
+
+@single_flight(key=order_lookup_key)
+async def handle_orders_async(query):
+    """
+    Async variant of handle_orders() using the async MongoDB client.
+    """
+    try:
+        order_id_match = ORDER_ID_PATTERN.search(query)
+
+        if order_id_match:
+            order_id = order_id_match.group(0)
+            order = await get_async_collection('Orders').find_one({"order_id": order_id})
+
+            if order:
+                return {"response": format_order_details(order)}
+            else:
+                return {"response": "No order found with the provided order ID."}
+        else:
+            return {"response": "Order ID not found in the query."}
+    except Exception as e:
+        print(f"Error in handle_orders_async: {e}")
+        return {"response": "An error occurred while processing the order query."}
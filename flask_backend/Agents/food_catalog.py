@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+import time
+
+from pymongo import errors
+
+try:
+    from Db import get_collection
+except ImportError:
+    from flask_backend.Db import get_collection
+
+# Cache settings: a TTL of 0 disables the cache, FOOD_CATALOG_WATCH=1 also refreshes
+# the catalog as soon as a MongoDB change stream reports a write (replica sets only)
+CATALOG_TTL_SECONDS = float(os.getenv("FOOD_CATALOG_TTL_SECONDS", "3600"))
+CATALOG_WATCH = os.getenv("FOOD_CATALOG_WATCH", "0") == "1"
+
+fooditems_collection = get_collection("Fooditems")
+
+# In-memory catalog: the full item list plus a cuisine -> items index
+_catalog = {"items": None, "by_cuisine": {}, "loaded_at": 0.0}
+_stats = {"hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0}
+_lock = threading.Lock()
+_watcher = None
+
+
+def cache_enabled():
+    """Returns True when the catalog cache is turned on."""
+    return CATALOG_TTL_SECONDS > 0
+
+
+def normalize_cuisine(cuisine):
+    """
+    Normalizes a cuisine name into its 'cuisine_key' form (e.g. ' Italian ' -> 'italian').
+    Must stay in sync with the cuisine_key backfill in Indexes.migrate().
+    """
+    return (cuisine or "").strip().lower()
+
+
+def cuisine_filter(cuisine_keys):
+    """
+    Returns a Fooditems query for the given cuisine keys. Documents that predate the
+    cuisine_key backfill (Indexes.migrate(), run at startup) are matched on their raw cuisine.
+    """
+    unmigrated = [re.compile(rf"^\s*{re.escape(key)}\s*$", re.IGNORECASE) for key in cuisine_keys]
+    return {"$or": [
+        {"cuisine_key": {"$in": list(cuisine_keys)}},
+        {"cuisine_key": {"$exists": False}, "cuisine": {"$in": unmigrated}},
+    ]}
+
+
+def _build_index(items):
+    by_cuisine = {}
+    for item in items:
+        key = item.get("cuisine_key") or normalize_cuisine(item.get("cuisine"))
+        by_cuisine.setdefault(key, []).append(item)
+    return by_cuisine
+
+
+def load_catalog():
+    """
+    Loads the whole Fooditems collection into memory and rebuilds the cuisine index.
+    :return: A tuple of (items, cuisine index).
+    """
+    items = list(fooditems_collection.find({}, {"_id": 0}))
+    by_cuisine = _build_index(items)
+    with _lock:
+        _catalog["items"] = items
+        _catalog["by_cuisine"] = by_cuisine
+        _catalog["loaded_at"] = time.monotonic()
+        _stats["refreshes"] += 1
+    return items, by_cuisine
+
+
+def invalidate():
+    """
+    Drops the cached catalog so the next lookup reloads it from MongoDB.
+    """
+    with _lock:
+        _catalog["items"] = None
+        _catalog["by_cuisine"] = {}
+        _stats["invalidations"] += 1
+
+
+def is_fresh():
+    """
+    Returns True if lookups would be served from memory without reloading the catalog.
+    """
+    with _lock:
+        return (
+            _catalog["items"] is not None
+            and time.monotonic() - _catalog["loaded_at"] < CATALOG_TTL_SECONDS
+        )
+
+
+def _get_fresh_catalog():
+    # Serve from memory while the catalog is within its TTL, reload otherwise
+    with _lock:
+        fresh = (
+            _catalog["items"] is not None
+            and time.monotonic() - _catalog["loaded_at"] < CATALOG_TTL_SECONDS
+        )
+        if fresh:
+            _stats["hits"] += 1
+            return _catalog["items"], _catalog["by_cuisine"]
+        _stats["misses"] += 1
+
+    if CATALOG_WATCH:
+        start_watcher()
+    return load_catalog()
+
+
+def get_all_items():
+    """
+    Returns every food item in the catalog.
+    """
+    items, _ = _get_fresh_catalog()
+    return list(items)
+
+
+def get_items_by_cuisine(cuisine):
+    """
+    Returns the food items of exactly the given cuisine (case-insensitive).
+    :param cuisine: The cuisine to search for.
+    :return: A list of food item documents.
+    """
+    return get_items_by_cuisines([cuisine])
+
+
+def get_items_by_cuisines(cuisines):
+    """
+    Returns the food items of any of the given cuisines, in the order the cuisines were given.
+    :param cuisines: A list of cuisine names.
+    :return: A list of food item documents.
+    """
+    _, by_cuisine = _get_fresh_catalog()
+    items = []
+    for key in dict.fromkeys(normalize_cuisine(cuisine) for cuisine in cuisines):
+        items.extend(by_cuisine.get(key, []))
+    return items
+
+
+def _watch_catalog():
+    try:
+        with fooditems_collection.watch() as stream:
+            for _ in stream:
+                invalidate()
+    except errors.PyMongoError as e:
+        # Standalone servers have no change streams; the TTL keeps the catalog fresh instead
+        print(f"Food catalog change stream stopped, falling back to TTL refresh: {e}")
+
+
+def start_watcher():
+    """
+    Starts the background change-stream watcher once per process.
+    """
+    global _watcher
+    with _lock:
+        if _watcher is not None and _watcher.is_alive():
+            return
+        _watcher = threading.Thread(target=_watch_catalog, name="food-catalog-watcher", daemon=True)
+        _watcher.start()
+
+
+def get_cache_stats():
+    """
+    Returns hit/miss counters and the current catalog size.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["items"] = len(_catalog["items"] or [])
+        stats["cuisines"] = len(_catalog["by_cuisine"])
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
@@ -1,36 +1,47 @@
-from langchain_openai import ChatOpenAI
-from langchain.agents import Tool, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
-from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
-from dotenv import load_dotenv
-from pymongo import MongoClient
-import os
-
-# Load environment variables
-load_dotenv()
-assert os.getenv("OPENAI_API_KEY"), "OPENAI_API_KEY not found in environment variables"
-
-# MongoDB connection
-try:
-    from flask_backend.Db import get_db
+import asyncio
 
-    db = get_db()
-    if db is not None:
-        fooditems_collection = db["Fooditems"]
-    else:
-        raise ConnectionError("Failed to connect to the MongoDB database using get_db().")
+from . import cuisine_extractor, food_catalog, registry
+from .llm_resilience import ResilientLLM
+from .single_flight import single_flight
+from .response_cache import cached_llm_call, cached_llm_call_async
+
+# MongoDB connection (shared pool from Db.py; MONGO_URI is honoured there)
+try:
+    from Db import get_async_collection, get_collection
 except ImportError:
-    # Fallback to direct connection using MONGO_URI
-    assert os.getenv("MONGO_URI"), "MONGO_URI not found in environment variables"
-    mongo_uri = os.getenv("MONGO_URI")
-    client = MongoClient(mongo_uri)
-    db = client["CuisineConnect"]
-    fooditems_collection = db["Fooditems"]
+    from flask_backend.Db import get_async_collection, get_collection
+
+fooditems_collection = get_collection("Fooditems")
 
 # List of known cuisines in your MongoDB (you can extend this list as needed)
 KNOWN_CUISINES = ["indian", "italian", "chinese", "mexican", "thai", "japanese", "american"]
 
+# Prompt used to extract the cuisine when the local extractor is not confident enough
+CUISINE_PROMPT = """
+        You are an assistant that extracts cuisine types or keywords from user queries about food. 
+        Analyze the query below and respond with only the cuisine type or food category if present.
+        If the cuisine is misspelled, please correct it based on common cuisines.
+
+        User Query: "{user_query}"
+        """
+
+# OpenAI model used when the local extractor is not confident enough (built on first use)
+CUISINE_MODEL = "gpt-4o-mini"
+CUISINE_LLM = registry.register_llm(CUISINE_MODEL)
+
+
+def get_known_cuisines() -> list:
+    """
+    Returns KNOWN_CUISINES plus every cuisine present in the cached food catalog.
+    """
+    cuisines = list(KNOWN_CUISINES)
+    if food_catalog.cache_enabled():
+        try:
+            cuisines.extend(food_catalog.normalize_cuisine(item.get("cuisine")) for item in food_catalog.get_all_items())
+        except Exception as e:
+            print(f"Error loading cuisines from the food catalog: {e}")
+    return list(dict.fromkeys(cuisine for cuisine in cuisines if cuisine))
+
 
 def get_closest_cuisine(extracted_cuisine: str) -> str:
     """
@@ -55,30 +66,32 @@ def get_closest_cuisine(extracted_cuisine: str) -> str:
 
 
 # Step 1: Analyze the user input using OpenAI
+@single_flight()
 def analyze_user_input(user_query: str) -> str:
     """
-    Analyzes the user's query using OpenAI to extract the cuisine.
+    Extracts the cuisine from the user's query, locally when possible and with OpenAI otherwise.
     :param user_query: The user's input query.
     :return: Extracted cuisine type or relevant keyword.
     """
     try:
-        llm = ChatOpenAI(
-            temperature=0.7,
-            model="gpt-4o-mini",
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # Fast path: resolve cuisine names, synonyms and typos without a network call
+        cuisine, confidence = cuisine_extractor.extract_cuisine(user_query, get_known_cuisines())
+        if cuisine and confidence >= cuisine_extractor.FAST_PATH_MIN_CONFIDENCE:
+            cuisine_extractor.record_fast_path(True)
+            print(f"DEBUG: Extracted Cuisine (local, confidence {confidence:.2f}): {cuisine}")
+            return cuisine
+        cuisine_extractor.record_fast_path(False)
 
         # Prompt to extract cuisine information
-        prompt = f"""
-        You are an assistant that extracts cuisine types or keywords from user queries about food. 
-        Analyze the query below and respond with only the cuisine type or food category if present.
-        If the cuisine is misspelled, please correct it based on common cuisines.
+        prompt = CUISINE_PROMPT.format(user_query=user_query)
 
-        User Query: "{user_query}"
-        """
-
-        response = llm.invoke([{"role": "user", "content": prompt}])
-        extracted_cuisine = response.content.strip().lower()  # Normalize for consistent usage
+        extracted_cuisine = cached_llm_call(
+            CUISINE_MODEL,
+            CUISINE_PROMPT,
+            user_query,
+            lambda: registry.get(CUISINE_LLM).invoke([{"role": "user", "content": prompt}]).content
+        )
+        extracted_cuisine = extracted_cuisine.strip().lower()  # Normalize for consistent usage
         print(f"DEBUG: Extracted Cuisine: {extracted_cuisine}")
 
         # Correct the extracted cuisine based on the known cuisines
@@ -88,6 +101,36 @@ def analyze_user_input(user_query: str) -> str:
         return f"Error analyzing input: {e}"
 
 
+
+@single_flight()
+async def analyze_user_input_async(user_query: str) -> str:
+    """
+    Async variant of analyze_user_input(); the OpenAI call does not block the event loop.
+    """
+    try:
+        if food_catalog.cache_enabled() and not food_catalog.is_fresh():
+            known_cuisines = await asyncio.to_thread(get_known_cuisines)
+        else:
+            known_cuisines = get_known_cuisines()
+        cuisine, confidence = cuisine_extractor.extract_cuisine(user_query, known_cuisines)
+        if cuisine and confidence >= cuisine_extractor.FAST_PATH_MIN_CONFIDENCE:
+            cuisine_extractor.record_fast_path(True)
+            print(f"DEBUG: Extracted Cuisine (local, confidence {confidence:.2f}): {cuisine}")
+            return cuisine
+        cuisine_extractor.record_fast_path(False)
+
+        prompt = CUISINE_PROMPT.format(user_query=user_query)
+
+        async def acall():
+            return (await registry.get(CUISINE_LLM).ainvoke([{"role": "user", "content": prompt}])).content
+
+        extracted_cuisine = await cached_llm_call_async(CUISINE_MODEL, CUISINE_PROMPT, user_query, acall)
+        extracted_cuisine = extracted_cuisine.strip().lower()
+        print(f"DEBUG: Extracted Cuisine: {extracted_cuisine}")
+        return get_closest_cuisine(extracted_cuisine)
+    except Exception as e:
+        return f"Error analyzing input: {e}"
+
 # Step 2: Fetch all food items from MongoDB
 def get_all_food_items() -> list:
     """
@@ -96,7 +139,10 @@ def get_all_food_items() -> list:
     """
     try:
         # Fetch all food items, excluding MongoDB's '_id' field
-        food_items = list(fooditems_collection.find({}, {"_id": 0}))
+        if food_catalog.cache_enabled():
+            food_items = food_catalog.get_all_items()
+        else:
+            food_items = list(fooditems_collection.find({}, {"_id": 0}))
         if not food_items:
             print("DEBUG: No food items found in the database.")  # Log the case
             return []  # Return an empty list if no items are found
@@ -106,42 +152,90 @@ def get_all_food_items() -> list:
         return []  # Return an empty list in case of an error
 
 
+def parse_cuisines(cuisine) -> list:
+    """
+    Splits a cuisine argument into normalized cuisine keys.
+    :param cuisine: A cuisine name, a comma-separated list of names, or a list of names.
+    :return: A list of unique normalized cuisine keys.
+    """
+    if isinstance(cuisine, str):
+        cuisine = cuisine.split(",")
+    keys = [food_catalog.normalize_cuisine(name) for name in cuisine]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def format_recommendations(food_items, cuisine: str) -> list:
+    """
+    Formats food item documents as recommendation strings.
+    :param food_items: An iterable of food item documents.
+    :param cuisine: The cuisine names the items were fetched for (used in messages).
+    :return: A list of recommendation strings, or a one-element error list if there are none.
+    """
+    # Include the relevant fields of each item
+    food_items_list = [
+        {
+            "name": item["name"],
+            "description": item["description"],
+            "price": item["price"],
+            "imageUrl": item.get("imageUrl", ""),  # Handle cases where imageUrl might be missing
+            "spiceLevel": item.get("spiceLevel", "Unknown")  # Default to "Unknown" if spiceLevel is missing
+        }
+        for item in food_items
+    ]
+    print(f"DEBUG: Query Results for {cuisine}: {food_items_list}")
+
+    # Format recommendations with all details
+    recommendations = [
+        f"{item['name']} - {item['description']} (Price: ${item['price']:.2f}, Spice Level: {item['spiceLevel']})\nImage URL: {item['imageUrl']}"
+        for item in food_items_list
+    ]
+    return recommendations if recommendations else [{"error": f"No recommendations found for {cuisine.capitalize()} cuisine."}]
+
+
 # Tool to fetch food items from the database based on cuisine
-def fetch_food_recommendations_from_db(cuisine: str) -> list:
+@single_flight()
+def fetch_food_recommendations_from_db(cuisine) -> list:
     """
     Fetch food recommendations based on the cuisine from MongoDB.
-    :param cuisine: The cuisine to search for.
+    :param cuisine: The cuisine to search for (several cuisines may be given as a list or comma-separated).
     :return: A list of recommended dishes with details (name, description, price, imageUrl, and spiceLevel).
     """
-    cuisine = cuisine.lower()
+    cuisine_keys = parse_cuisines(cuisine)
+    cuisine = ", ".join(cuisine_keys)
     try:
-        # Query MongoDB for food items matching the cuisine
-        food_items = fooditems_collection.find({"cuisine": {"$regex": cuisine, "$options": "i"}})
-
-        # Convert the cursor to a list and include relevant fields
-        food_items_list = [
-            {
-                "name": item["name"],
-                "description": item["description"],
-                "price": item["price"],
-                "imageUrl": item.get("imageUrl", ""),  # Handle cases where imageUrl might be missing
-                "spiceLevel": item.get("spiceLevel", "Unknown")  # Default to "Unknown" if spiceLevel is missing
-            }
-            for item in food_items
-        ]
-        print(f"DEBUG: Query Results for {cuisine}: {food_items_list}")
-
-        # Format recommendations with all details
-        recommendations = [
-            f"{item['name']} - {item['description']} (Price: ${item['price']:.2f}, Spice Level: {item['spiceLevel']})\nImage URL: {item['imageUrl']}"
-            for item in food_items_list
-        ]
-        return recommendations if recommendations else [{"error": f"No recommendations found for {cuisine.capitalize()} cuisine."}]
+        # Serve from the in-memory catalog, or query MongoDB when the cache is disabled
+        if food_catalog.cache_enabled():
+            food_items = food_catalog.get_items_by_cuisines(cuisine_keys)
+        else:
+            food_items = fooditems_collection.find(food_catalog.cuisine_filter(cuisine_keys), {"_id": 0})
+        return format_recommendations(food_items, cuisine)
     except Exception as e:
         print(f"Error fetching recommendations: {e}")
         return [{"error": "Error fetching recommendations from the database."}]
 
 
+@single_flight()
+async def fetch_food_recommendations_async(cuisine) -> list:
+    """
+    Async variant of fetch_food_recommendations_from_db() for the ASGI app.
+    A stale catalog is reloaded in a worker thread; without the cache the async MongoDB client is used.
+    """
+    cuisine_keys = parse_cuisines(cuisine)
+    cuisine = ", ".join(cuisine_keys)
+    try:
+        if food_catalog.cache_enabled():
+            if food_catalog.is_fresh():
+                food_items = food_catalog.get_items_by_cuisines(cuisine_keys)
+            else:
+                food_items = await asyncio.to_thread(food_catalog.get_items_by_cuisines, cuisine_keys)
+        else:
+            cursor = get_async_collection("Fooditems").find(food_catalog.cuisine_filter(cuisine_keys), {"_id": 0})
+            food_items = await cursor.to_list(length=None)
+        return format_recommendations(food_items, cuisine)
+    except Exception as e:
+        print(f"Error fetching recommendations: {e}")
+        return [{"error": "Error fetching recommendations from the database."}]
+
 
 
 # def fetch_food_recommendations_from_db(cuisine: str) -> str:
@@ -190,46 +284,71 @@ def generate_recommendation(user_query: str) -> str:
         return f"Error generating recommendations: {e}"
 
 
-# Define the tool
-recommend_food = Tool(
-    name="recommend_food",
-    func=fetch_food_recommendations_from_db,
-    description="Recommends dishes based on the specified cuisine using data from MongoDB."
-)
+async def generate_recommendation_async(user_query: str):
+    """
+    Async variant of generate_recommendation().
+    """
+    try:
+        cuisine = await analyze_user_input_async(user_query)
+        if "error" in cuisine.lower():
+            return cuisine
 
-tools = [recommend_food]
-
-# Define the prompt
-prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "You are a food recommendation expert. Use the recommend_food tool to fetch recommendations based on user queries."),
-    ("user", "{input}"),
-    MessagesPlaceholder(variable_name="agent_scratchpad"),
-])
-
-# Initialize the OpenAI language model
-llm = ChatOpenAI(
-    temperature=0.7,
-    model="gpt-4",
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+        print(f"DEBUG: Detected cuisine from query: {cuisine}")
+        return await fetch_food_recommendations_async(cuisine)
+    except Exception as e:
+        return f"Error generating recommendations: {e}"
 
-# Bind tools to LLM
-llm_with_tools = llm.bind_tools(tools)
 
-# Define the agent
-agent = (
-        {
-            "input": lambda x: x["input"],
-            "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
-        }
-        | prompt
-        | llm_with_tools
-        | OpenAIToolsAgentOutputParser()
-)
+RECOMMENDATION_MODEL = "gpt-4"
+RECOMMENDATION_LLM = registry.register_llm(RECOMMENDATION_MODEL)
 
-# Create the AgentExecutor
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+def build_agent_executor():
+    """
+    Assembles the recommendation agent (LangChain is imported here, on first use).
+    """
+    from langchain.agents import Tool, AgentExecutor
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
+    from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
+
+    # Define the tool
+    recommend_food = Tool(
+        name="recommend_food",
+        func=fetch_food_recommendations_from_db,
+        description="Recommends dishes based on the specified cuisine using data from MongoDB."
+    )
+
+    tools = [recommend_food]
+
+    # Define the prompt
+    prompt = ChatPromptTemplate.from_messages([
+        ("system",
+         "You are a food recommendation expert. Use the recommend_food tool to fetch recommendations based on user queries."),
+        ("user", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+
+    # Bind tools to LLM
+    llm_with_tools = registry.get(RECOMMENDATION_LLM).bind_tools(tools)
+
+    # Define the agent
+    agent = (
+            {
+                "input": lambda x: x["input"],
+                "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
+            }
+            | prompt
+            | llm_with_tools
+            | OpenAIToolsAgentOutputParser()
+    )
+
+    # Create the AgentExecutor
+    return AgentExecutor(agent=agent, tools=tools, verbose=True)
+
+AGENT_EXECUTOR = registry.register(
+    "food_recommendation_agent.agent_executor",
+    lambda: ResilientLLM(build_agent_executor(), "food_recommendation_agent.agent_executor")
+)
 
 
 # Function to handle recommendations as an agent
@@ -244,4 +363,14 @@ def get_food_recommendations(user_query: str):
         recommendations = generate_recommendation(user_query)
         return recommendations
     except Exception as e:
-        return f"Error handling recommendation request: {e}"
\ No newline at end of file
+        return f"Error handling recommendation request: {e}"
+
+
+async def get_food_recommendations_async(user_query: str):
+    """
+    Async variant of get_food_recommendations() used by the ASGI app.
+    """
+    try:
+        return await generate_recommendation_async(user_query)
+    except Exception as e:
+        return f"Error handling recommendation request: {e}"
@@ -0,0 +1,76 @@
+import os
+
+from .fraud_detection_agent import analyze_fraud_claim, store_claim_image
+from .job_queue import FINISHED_STATUSES, JobQueueFull, LocalBroker
+
+# Worker pool settings for fraud claims (override through environment variables)
+FRAUD_WORKERS = int(os.getenv("FRAUD_WORKERS", "4"))
+FRAUD_MAX_PENDING = int(os.getenv("FRAUD_MAX_PENDING", "32"))
+# Claims not updated for this long belong to a worker that died and are reported as failed
+FRAUD_JOB_TIMEOUT_SECONDS = float(os.getenv("FRAUD_JOB_TIMEOUT_SECONDS", "600"))
+# Longest long-poll a client may request. The Flask route holds a thread while it waits, so it
+# waits at most MAX_BLOCKING_WAIT_SECONDS; the ASGI app awaits the job for the full time.
+MAX_WAIT_SECONDS = 30
+MAX_BLOCKING_WAIT_SECONDS = 2
+
+FRAUD_JOB = "fraud_detection"
+
+fraud_claims_queue = LocalBroker("FraudClaims", FRAUD_WORKERS, FRAUD_MAX_PENDING, FRAUD_JOB_TIMEOUT_SECONDS)
+fraud_claims_queue.register(FRAUD_JOB, analyze_fraud_claim)
+
+
+def submit_fraud_claim(description, image_file, order_id) -> dict:
+    """
+    Stores the claim image and queues the fraud analysis without waiting for the model.
+    :param description: Text description of the issue.
+    :param image_file: The uploaded image file object.
+    :param order_id: The order ID provided by the user.
+    :return: {"job_id", "status"} on success, or {"error"} (with "busy": True when the queue is full).
+    """
+    stored_image, error = store_claim_image(image_file)
+    if error:
+        return error
+
+    try:
+        job_id = fraud_claims_queue.submit(
+            FRAUD_JOB,
+            {
+                "description": description,
+                "image_data": stored_image["data"],
+                "order_id": order_id,
+                "image_sha256": stored_image["sha256"],
+            },
+            record={"order_id": order_id, "description": description[:100], "image_sha256": stored_image["sha256"]}
+        )
+    except JobQueueFull:
+        return {"error": "Too many claims are being processed. Please try again shortly.", "busy": True}
+    return {"job_id": job_id, "status": "queued"}
+
+
+def get_fraud_claim(job_id, wait=0):
+    """
+    Returns the public view of a fraud claim job, optionally long-polling for its result.
+    :param job_id: The job id returned by submit_fraud_claim().
+    :param wait: Seconds to wait for the decision (capped at MAX_BLOCKING_WAIT_SECONDS).
+    :return: A dict with job_id, status, order_id and the decision or error, or None if unknown.
+    """
+    job = fraud_claims_queue.get(job_id, wait=min(max(wait, 0), MAX_BLOCKING_WAIT_SECONDS))
+    return _claim_view(job)
+
+
+async def get_fraud_claim_async(job_id, wait=0):
+    """
+    Async get_fraud_claim(): waits up to MAX_WAIT_SECONDS without holding a thread.
+    """
+    job = await fraud_claims_queue.aget(job_id, wait=min(max(wait, 0), MAX_WAIT_SECONDS))
+    return _claim_view(job)
+
+
+def _claim_view(job):
+    if job is None:
+        return None
+
+    claim = {"job_id": job["_id"], "status": job["status"], "order_id": job.get("order_id")}
+    if job["status"] in FINISHED_STATUSES:
+        claim.update(job.get("result") or {})
+    return claim
@@ -1,46 +1,53 @@
-import os
-import base64
-import uuid
-from langchain_openai import ChatOpenAI
-
-# Initialize OpenAI
-llm = ChatOpenAI(
-    temperature=0.7,
-    model="gpt-4o-mini",
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+from . import claim_image_index, registry
+from .image_prep import image_message_content, prepare_image
+from .upload_store import UploadTooLarge, store_upload
+
+# OpenAI vision model (built on first use)
+FRAUD_MODEL = "gpt-4o-mini"
+FRAUD_LLM = registry.register_llm(FRAUD_MODEL)
 
 def save_uploaded_image(image_file):
     """
-    Saves the uploaded image to the 'uploads' directory and returns the file path.
+    Saves the uploaded image to the content-addressed upload store (once per distinct image).
+    :return: The stored upload ('sha256', 'path', 'size', 'data'), or None on failure.
+    :raises UploadTooLarge: If the image exceeds the upload size limit.
     """
     try:
-        uploads_dir = os.path.join(os.getcwd(), "uploads")
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-
-        image_filename = f"{uuid.uuid4()}-{image_file.filename}"
-        image_path = os.path.join(uploads_dir, image_filename)
-        image_file.save(image_path)
-        return image_path
+        return store_upload(image_file)
+    except UploadTooLarge:
+        raise
     except Exception as e:
         print(f"Error saving uploaded image: {e}")
         return None
 
-def encode_image_to_base64(image_path):
+def encode_image(image_data):
     """
-    Encodes the image located at the given path into a base64 string.
+    Downsamples the image bytes into a bounded thumbnail for the vision model.
+    :return: The prepared image (see image_prep.prepare_image), or None on failure.
     """
     try:
-        with open(image_path, "rb") as img_file:
-            encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
-        return encoded_image
+        return prepare_image(image_data)
     except Exception as e:
-        print(f"Error encoding image to base64: {e}")
+        print(f"Error preparing image: {e}")
         return None
 
 
 
+def store_claim_image(image_file):
+    """
+    Saves the uploaded claim image. Must run while the request is open, since the
+    upload stream is closed once the request ends.
+    :return: A tuple (stored image, error response); exactly one of them is None.
+    """
+    try:
+        stored_image = save_uploaded_image(image_file)
+    except UploadTooLarge as e:
+        return None, {"error": f"Uploaded image is too large. {e}."}
+    if not stored_image:
+        return None, {"error": "Failed to save the uploaded image."}
+    return stored_image, None
+
+
 def handle_fraud_detection(description, image_file, order_id):
     """
     Handles the fraud detection process by analyzing the provided description, image, and order ID.
@@ -49,20 +56,39 @@ def handle_fraud_detection(description, image_file, order_id):
     :param order_id: The order ID provided by the user.
     :return: A JSON response with the decision or an error message.
     """
+    # Step 1: Save the uploaded image
+    stored_image, error = store_claim_image(image_file)
+    if error:
+        return error
+    return analyze_fraud_claim(description, stored_image["data"], order_id, stored_image["sha256"])
+
+
+def analyze_fraud_claim(description, image_data, order_id, image_sha256=None):
+    """
+    Asks the vision model for a decision on a claim whose image is already stored.
+    Images already claimed for another order are escalated without calling the model.
+    :param description: Text description of the issue.
+    :param image_data: The image bytes (see upload_store.store_upload).
+    :param order_id: The order ID provided by the user.
+    :param image_sha256: Optional content hash of the image.
+    :return: A JSON response with the decision or an error message.
+    """
     try:
-        # Step 1: Save the uploaded image
-        image_path = save_uploaded_image(image_file)
-        if not image_path:
-            return {"error": "Failed to save the uploaded image."}
-
-        # Step 2: Encode the image to base64
-        base64_image = encode_image_to_base64(image_path)
-        if not base64_image:
+        # Reused photos (same or near-identical image on another order) go to a human
+        duplicate = claim_image_index.check_and_record(image_data, order_id, image_sha256)
+        if duplicate["duplicate_orders"]:
+            print(f"Claim image for {order_id} already used for {duplicate['duplicate_orders']}")
+            return {
+                "decision": "Escalate to Human Agent",
+                "duplicate_of": duplicate["duplicate_orders"],
+                "cross_account": duplicate["cross_account"],
+            }
+
+        # Step 2: Downsample the image in memory (without re-reading the file)
+        prepared_image = encode_image(image_data)
+        if not prepared_image:
             return {"error": "Failed to encode the image."}
 
-        # Truncate base64 to avoid token overload
-        base64_image = base64_image[:10000]
-
         # Truncate description to reduce token usage
         description = description[:100]
 
@@ -80,12 +106,11 @@ def handle_fraud_detection(description, image_file, order_id):
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Order ID: {order_id}"},
-            {"role": "user", "content": f"Description: {description}"},
-            {"role": "user", "content": f"Image Data (truncated): {base64_image}"}
+            {"role": "user", "content": image_message_content(f"Description: {description}", prepared_image)}
         ]
 
         # Call OpenAI API
-        response = llm.invoke(messages)
+        response = registry.get(FRAUD_LLM).invoke(messages)
 
         # Extract and clean up the decision
         raw_decision = response.content.strip() if hasattr(response, "content") else response["content"]
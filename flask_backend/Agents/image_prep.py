@@ -0,0 +1,130 @@
+import base64
+import io
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it small images are sent unchanged
+    Image = None
+
+# Thumbnail settings for images sent to the vision model
+THUMBNAIL_MAX_SIDE = int(os.getenv("FRAUD_IMAGE_MAX_SIDE", "512"))
+THUMBNAIL_QUALITY = int(os.getenv("FRAUD_IMAGE_QUALITY", "80"))
+# Largest image sent as-is when Pillow is not installed
+UNPROCESSED_MAX_BYTES = int(os.getenv("FRAUD_IMAGE_UNPROCESSED_MAX_BYTES", str(1024 * 1024)))
+# Refuse to decode images above this many pixels (decompression bombs)
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+class MemoryViewReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a bytes-like buffer that never copies the buffer.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, target):
+        chunk = self._view[self._position:self._position + len(target)]
+        size = len(chunk)
+        target[:size] = chunk
+        self._position += size
+        return size
+
+
+def _guess_media_type(data):
+    header = bytes(memoryview(data)[:12])
+    if header.startswith(b"\x89PNG"):
+        return "image/png"
+    if header.startswith(b"GIF8"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def prepare_image(data, max_side=None, quality=None):
+    """
+    Decodes an uploaded image from memory, downsamples it to a bounded JPEG thumbnail
+    and base64-encodes it. JPEGs are decoded at reduced scale (draft mode), so memory
+    use depends on the thumbnail size rather than on the upload size.
+    :param data: The image bytes (bytes, bytearray or memoryview).
+    :param max_side: Longest side of the thumbnail in pixels (defaults to THUMBNAIL_MAX_SIDE).
+    :param quality: JPEG quality of the thumbnail (defaults to THUMBNAIL_QUALITY).
+    :return: A dict with 'media_type', 'base64', 'width' and 'height'.
+    :raises ValueError: If the image cannot be decoded or is too large to send unprocessed.
+    """
+    max_side = max_side or THUMBNAIL_MAX_SIDE
+    quality = quality or THUMBNAIL_QUALITY
+
+    if Image is None:
+        if len(memoryview(data)) > UNPROCESSED_MAX_BYTES:
+            raise ValueError("Image too large to send without Pillow installed")
+        return {
+            "media_type": _guess_media_type(data),
+            "base64": base64.b64encode(data).decode("ascii"),
+            "width": None,
+            "height": None,
+        }
+
+    try:
+        with Image.open(MemoryViewReader(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError("Image has too many pixels")
+            # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+            image.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not decode image: {e}") from e
+
+    return {
+        "media_type": "image/jpeg",
+        "base64": base64.b64encode(output.getbuffer()).decode("ascii"),
+        "width": width,
+        "height": height,
+    }
+
+
+def image_message_content(text, image):
+    """
+    Builds the OpenAI vision message content for a prepared image.
+    :param text: Text sent alongside the image.
+    :param image: The result of prepare_image().
+    :return: A list of content parts for a 'user' message.
+    """
+    return [
+        {"type": "text", "text": text},
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{image['media_type']};base64,{image['base64']}",
+                "detail": "low",
+            },
+        },
+    ]
@@ -0,0 +1,120 @@
+import re
+import time
+
+# Intents in priority order: when a query matches several rules the first one wins, and an intent
+# may have several rules at different priorities. Greetings come last so "hi, show me my order
+# status" is routed to the order lookup. An explicit recommend/suggest/list verb outranks food
+# topics ("suggest something healthy"), while "show"/"give" do not ("show me the ingredients").
+# Patterns are regex fragments matched on word boundaries ("hi" no longer matches "chicken").
+INTENT_RULES = [
+    ("fraud", [r"fraud\w*", r"issues?", r"problems?", r"defective", r"damage\w*", r"broken"]),
+    ("order_status", [
+        r"order status", r"shipping status", r"spoil\w*", r"refund\w*", r"replace\w*",
+        r"track my order", r"where is my order", r"ord-\d+",
+    ]),
+    ("order_creation", [r"place (?:an |my )?order"]),
+    ("recommendation", [r"recommend\w*", r"list", r"suggest\w*"]),
+    ("food_query", [
+        r"allergens?", r"ingredients?", r"calories", r"health\w*", r"explain\w*",
+        r"details?", r"information", r"gluten", r"vegan", r"nutrition\w*",
+    ]),
+    ("recommendation", [r"show", r"give"]),
+    ("greeting", [r"hi", r"hello", r"hey", r"how are you"]),
+]
+
+# Returned when no rule matches (handled by the dynamic LLM response)
+FALLBACK_INTENT = "fallback"
+
+# Rule priority -> intent (the regex group of a rule is named "r<priority>")
+_RULE_INTENTS = [intent for intent, _ in INTENT_RULES]
+
+# One compiled alternation with a named group per rule, so a single scan finds every intent
+INTENT_PATTERN = re.compile(
+    r"\b(?:" + "|".join(
+        f"(?P<r{priority}>" + "|".join(patterns) + ")" for priority, (_, patterns) in enumerate(INTENT_RULES)
+    ) + r")\b",
+    re.IGNORECASE
+)
+
+
+def route_intent(query: str) -> str:
+    """
+    Classifies a query into one intent of INTENT_RULES in a single regex pass.
+    :param query: The user's query.
+    :return: The highest-priority matching intent, or FALLBACK_INTENT.
+    """
+    best = None
+    for match in INTENT_PATTERN.finditer(query):
+        priority = int(match.lastgroup[1:])
+        if best is None or priority < best:
+            best = priority
+            if best == 0:
+                break
+    return _RULE_INTENTS[best] if best is not None else FALLBACK_INTENT
+
+
+def is_fraud_query(query: str) -> bool:
+    """
+    Returns True when the query is routed to the fraud-claim flow.
+    """
+    return route_intent(query) == "fraud"
+
+
+# Real chatbot queries with their expected intent, used by benchmark_router()
+BENCHMARK_QUERIES = [
+    ("hi", "greeting"),
+    ("Hello, how are you?", "greeting"),
+    ("recommend italian food", "recommendation"),
+    ("Can you suggest some spicy thai dishes?", "recommendation"),
+    ("show me chicken dishes", "recommendation"),
+    ("give me a list of mexican food", "recommendation"),
+    ("recommend healthy dishes", "recommendation"),
+    ("suggest something healthy", "recommendation"),
+    ("list vegan dishes", "recommendation"),
+    ("show me the ingredients of pad thai", "food_query"),
+    ("what are the ingredients of pad thai", "food_query"),
+    ("is carbonara gluten free?", "food_query"),
+    ("how many calories are in a beef burrito", "food_query"),
+    ("explain the health benefits of sushi", "food_query"),
+    ("what is the order status of ORD-123456", "order_status"),
+    ("show my order status for ORD-998877", "order_status"),
+    ("I want a refund for ORD-554433", "order_status"),
+    ("my food was damaged", "fraud"),
+    ("there is an issue with my delivery", "fraud"),
+    ("I want to place an order", "order_creation"),
+    ("place order for spaghetti carbonara", "order_creation"),
+    ("what can you do?", FALLBACK_INTENT),
+    ("tell me a joke about chicken", FALLBACK_INTENT),
+    ("this tastes great", FALLBACK_INTENT),
+]
+
+
+def benchmark_router(queries=None, iterations=10000) -> dict:
+    """
+    Micro-benchmark of route_intent() over a corpus of labelled queries.
+    :param queries: A list of (query, expected_intent) tuples (defaults to BENCHMARK_QUERIES).
+    :param iterations: Number of passes over the corpus.
+    :return: A dict with the mean time per query in microseconds, accuracy and misrouted queries.
+    """
+    queries = queries or BENCHMARK_QUERIES
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query, _ in queries:
+            route_intent(query)
+    elapsed = time.perf_counter() - start
+
+    misrouted = [
+        (query, expected, route_intent(query))
+        for query, expected in queries
+        if route_intent(query) != expected
+    ]
+    return {
+        "queries": len(queries),
+        "mean_us_per_query": elapsed / (iterations * len(queries)) * 1e6,
+        "accuracy": 1 - len(misrouted) / len(queries),
+        "misrouted": misrouted,
+    }
+
+
+if __name__ == '__main__':
+    print(benchmark_router())
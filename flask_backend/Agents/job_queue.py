@@ -0,0 +1,274 @@
+import abc
+import asyncio
+import datetime
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import errors
+
+try:
+    from Db import get_collection
+except ImportError:
+    from flask_backend.Db import get_collection
+
+# Statuses a job goes through
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATUSES = (DONE, FAILED)
+
+# Interval between MongoDB reads when long-polling a job owned by another worker
+POLL_INTERVAL_SECONDS = 0.5
+# Finished jobs kept in memory for fast polling (older ones are read from MongoDB)
+MAX_LOCAL_JOBS = 1000
+# Result of a job whose worker process died before finishing it
+STALE_JOB_RESULT = {"error": "The job was interrupted. Please submit it again."}
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while every worker and queue slot is taken."""
+
+
+class JobBroker(abc.ABC):
+    """
+    Interface of a job broker. submit() must return immediately; handlers registered
+    with register() run elsewhere and their results are read back with get().
+    """
+
+    @abc.abstractmethod
+    def register(self, job_type, handler):
+        pass
+
+    @abc.abstractmethod
+    def submit(self, job_type, payload, record=None):
+        pass
+
+    @abc.abstractmethod
+    def get(self, job_id, wait=0):
+        pass
+
+    @abc.abstractmethod
+    async def aget(self, job_id, wait=0):
+        pass
+
+
+class LocalBroker(JobBroker):
+    """
+    In-process broker: a bounded thread pool runs the jobs and every job is persisted
+    to a MongoDB collection, so any worker process can report its status. A job not updated
+    for job_timeout seconds is reported as failed, since the process that owned it is gone
+    (the queue and the handlers must finish well within that time).
+    """
+
+    def __init__(self, collection_name, max_workers, max_pending, job_timeout=600):
+        self.collection_name = collection_name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self._handlers = {}
+        self._jobs = OrderedDict()
+        self._events = {}
+        # job id -> [(event loop, future)] of aget() calls waiting for the job
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _get_executor(self):
+        # Threads do not survive a fork, so each pre-fork worker starts its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.collection_name)
+                self._executor_pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+            return self._executor
+
+    def _persist(self, job_id, update, insert=False):
+        try:
+            collection = get_collection(self.collection_name)
+            if insert:
+                collection.insert_one(update)
+            else:
+                collection.update_one({"_id": job_id}, {"$set": update})
+        except errors.PyMongoError as e:
+            print(f"Error persisting job {job_id} to {self.collection_name}: {e}")
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            self._jobs[job_id].update(fields)
+        self._persist(job_id, fields)
+
+    def register(self, job_type, handler):
+        """
+        Registers the function that runs jobs of the given type (called with **payload).
+        """
+        self._handlers[job_type] = handler
+
+    def submit(self, job_type, payload, record=None):
+        """
+        Queues a job and returns its id without waiting for it to run.
+        :param job_type: A type registered with register().
+        :param payload: Keyword arguments for the handler (kept in memory only).
+        :param record: Extra JSON-safe fields persisted with the job (e.g. order_id).
+        :return: The job id.
+        :raises JobQueueFull: If max_workers + max_pending jobs are already in flight.
+        """
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull(f"{self.collection_name} queue is full")
+
+        job_id = uuid.uuid4().hex
+        now = datetime.datetime.now(datetime.timezone.utc)
+        job = {
+            "_id": job_id,
+            "type": job_type,
+            "status": QUEUED,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        job.update(record or {})
+        with self._lock:
+            self._jobs[job_id] = job
+            self._events[job_id] = threading.Event()
+            self._evict_finished()
+        self._persist(job_id, dict(job), insert=True)
+
+        try:
+            executor.submit(self._run, job_id, job_type, payload)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, job_type, payload):
+        try:
+            self._update(job_id, status=RUNNING)
+            result = self._handlers[job_type](**payload)
+            status = FAILED if isinstance(result, dict) and "error" in result else DONE
+            self._update(job_id, status=status, result=result)
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            self._update(job_id, status=FAILED, result={"error": "Internal server error. Please try again later."})
+        finally:
+            self._slots.release()
+            with self._lock:
+                event = self._events.pop(job_id, None)
+                waiters = self._waiters.pop(job_id, [])
+            if event is not None:
+                event.set()
+            for loop, waiter in waiters:
+                try:
+                    loop.call_soon_threadsafe(_wake, waiter)
+                except RuntimeError:
+                    # The waiting event loop has been closed
+                    pass
+
+    def _evict_finished(self):
+        # Called with self._lock held
+        excess = len(self._jobs) - MAX_LOCAL_JOBS
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id]["status"] in FINISHED_STATUSES:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        try:
+            job = get_collection(self.collection_name).find_one({"_id": job_id})
+        except errors.PyMongoError as e:
+            print(f"Error reading job {job_id} from {self.collection_name}: {e}")
+            return None
+        if job is not None and self._is_stale(job):
+            job = self._fail_stale(job)
+        return job
+
+    def _is_stale(self, job):
+        # Only called for jobs this process does not own
+        if job["status"] in FINISHED_STATUSES:
+            return False
+        updated_at = job["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=datetime.timezone.utc)
+        age = datetime.datetime.now(datetime.timezone.utc) - updated_at
+        return age.total_seconds() > self.job_timeout
+
+    def _fail_stale(self, job):
+        # Marks a job abandoned by a dead or restarted worker as failed, unless it moved on meanwhile
+        fields = {
+            "status": FAILED,
+            "result": STALE_JOB_RESULT,
+            "updated_at": datetime.datetime.now(datetime.timezone.utc),
+        }
+        try:
+            get_collection(self.collection_name).update_one(
+                {"_id": job["_id"], "status": job["status"], "updated_at": job["updated_at"]}, {"$set": fields}
+            )
+        except errors.PyMongoError as e:
+            print(f"Error failing stale job {job['_id']} in {self.collection_name}: {e}")
+        print(f"Job {job['_id']} in {self.collection_name} was abandoned while {job['status']}, marked failed")
+        return dict(job, **fields)
+
+    def get(self, job_id, wait=0):
+        """
+        Returns the job document, optionally long-polling until it finishes.
+        :param job_id: The job id returned by submit().
+        :param wait: Maximum number of seconds to wait for the job to finish.
+        :return: The job document, or None if the job is unknown.
+        """
+        deadline = time.monotonic() + wait
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None and wait > 0:
+            event.wait(wait)
+
+        job = self._load(job_id)
+        # Jobs owned by another worker process are polled through MongoDB
+        while job is not None and job["status"] not in FINISHED_STATUSES and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL_SECONDS, max(0.0, deadline - time.monotonic())))
+            job = self._load(job_id)
+        return job
+
+    async def aget(self, job_id, wait=0):
+        """
+        Same as get(), but awaits the job on the event loop instead of blocking a thread.
+        """
+        deadline = time.monotonic() + wait
+        waiter = None
+        if wait > 0:
+            with self._lock:
+                if job_id in self._events:
+                    waiter = asyncio.get_running_loop().create_future()
+                    self._waiters.setdefault(job_id, []).append((waiter.get_loop(), waiter))
+        if waiter is not None:
+            try:
+                await asyncio.wait([waiter], timeout=wait)
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(job_id, [])
+                    if (waiter.get_loop(), waiter) in waiters:
+                        waiters.remove((waiter.get_loop(), waiter))
+
+        job = await asyncio.to_thread(self._load, job_id)
+        while job is not None and job["status"] not in FINISHED_STATUSES and time.monotonic() < deadline:
+            await asyncio.sleep(min(POLL_INTERVAL_SECONDS, max(0.0, deadline - time.monotonic())))
+            job = await asyncio.to_thread(self._load, job_id)
+        return job
+
+
+def _wake(waiter):
+    # Runs on the waiter's event loop
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,504 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from Metrics import (
+        count_llm_short_circuit, count_llm_tokens, observe_llm_call, register_collector, set_llm_breaker_state
+    )
+except ImportError:
+    from flask_backend.Metrics import (
+        count_llm_short_circuit, count_llm_tokens, observe_llm_call, register_collector, set_llm_breaker_state
+    )
+
+# Resilience layer around every OpenAI call (chat models and the LangChain agent executors).
+# Each logical call gets one deadline covering all its attempts; transient failures (timeouts,
+# connection errors, 429 and 5xx) are retried with full-jitter backoff; a circuit breaker per
+# client fails fast with CircuitOpen once too many recent calls failed, so workers stop piling up
+# behind a degraded API, and the agents answer with their canned "try again later" responses.
+# Optionally, a call still running after the client's observed p95 latency is hedged with a
+# second identical request and the first answer wins.
+
+# Total time for a call including retries
+DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+# Timeout of a single HTTP request to OpenAI (set on the ChatOpenAI clients)
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "20"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "0.25"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "4"))
+
+# The breaker opens when at least BREAKER_ERROR_RATE of the last BREAKER_WINDOW calls failed
+# (counted once BREAKER_MIN_CALLS calls are in the window) and lets a trial call through after
+# BREAKER_COOLDOWN_SECONDS
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Hedged requests (off by default: a hedge costs a second completion)
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Latency samples needed before hedging starts
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_SAMPLES = 200
+
+# Threads running synchronous calls, so a call can be abandoned at its deadline
+CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", "32"))
+
+# Errors worth retrying (matched by name, so the openai package is not imported here)
+RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+# CircuitBreaker.allow() result for the single trial call of a half-open breaker
+TRIAL = "trial"
+
+
+class CircuitOpen(Exception):
+    """Raised without calling OpenAI while a client's circuit breaker is open."""
+
+
+class LLMTimeout(TimeoutError):
+    """Raised when a call does not finish within its deadline."""
+
+
+_call_pool = {"pid": None, "executor": None}
+_call_pool_lock = threading.Lock()
+
+
+def _executor():
+    with _call_pool_lock:
+        if _call_pool["pid"] != os.getpid():
+            _call_pool["executor"] = ThreadPoolExecutor(max_workers=CALL_THREADS, thread_name_prefix="llm-call")
+            _call_pool["pid"] = os.getpid()
+        return _call_pool["executor"]
+
+
+def is_retryable(error) -> bool:
+    """
+    Returns True for failures that say nothing about the request itself (timeouts, overload, outages).
+    """
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2^attempt (capped).
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after too many recent failures -> half-open (one trial call) after the
+    cooldown -> closed again if the trial succeeds, open again if it fails.
+    """
+
+    def __init__(self):
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns False to fail fast, True for a call, or TRIAL for the half-open trial call. Whoever
+        gets TRIAL must end it with record() or release(), or the breaker stays half-open.
+        """
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open":
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+                return TRIAL
+            return self.state == "closed"
+
+    def record(self, success: bool):
+        with self.lock:
+            if self.state == "half_open":
+                self.trial_in_flight = False
+                if success:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                else:
+                    self._open()
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (self.state == "closed" and len(self.outcomes) >= BREAKER_MIN_CALLS
+                    and failures / len(self.outcomes) >= BREAKER_ERROR_RATE):
+                self._open()
+
+    def release(self):
+        # Ends a trial call that neither proves nor disproves the API is healthy
+        with self.lock:
+            self.trial_in_flight = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        print(f"LLM circuit breaker opened for {BREAKER_COOLDOWN_SECONDS:.0f} s")
+
+
+class ClientState:
+    """
+    Breaker, latency samples and counters of one client (shared by all wrappers with the same name).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = dict.fromkeys(
+            ("calls", "successes", "failures", "timeouts", "retries", "short_circuited", "hedges", "hedge_wins"), 0
+        )
+        self.lock = threading.Lock()
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def record_success(self, latency=None):
+        self.breaker.record(True)
+        with self.lock:
+            self.counters["successes"] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def record_failure(self, error, retryable, permit=True):
+        # Only transient failures count against the API's health; a bad request is our problem
+        if retryable:
+            self.breaker.record(False)
+        elif permit == TRIAL:
+            self.breaker.release()
+        self.count("timeouts" if isinstance(error, TimeoutError) else "failures")
+
+    def latency_percentile(self, p):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def hedge_delay(self):
+        # Seconds after which a call is hedged (None while hedging is off or there are too few samples)
+        if not HEDGE_ENABLED or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency_percentile(HEDGE_PERCENTILE)
+
+    def stats(self) -> dict:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        with self.lock:
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            breaker=self.breaker.state,
+            p50_ms=p50 * 1000 if p50 is not None else None,
+            p95_ms=p95 * 1000 if p95 is not None else None,
+        )
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_state(name) -> ClientState:
+    with _states_lock:
+        if name not in _states:
+            _states[name] = ClientState(name)
+        return _states[name]
+
+
+def get_llm_stats() -> dict:
+    """
+    Returns breaker state, call counters and latency percentiles per client.
+    """
+    with _states_lock:
+        states = list(_states.values())
+    return {state.name: state.stats() for state in states}
+
+
+def _collect_breaker_states():
+    # Breaker state per client for /metrics, read at scrape time
+    with _states_lock:
+        states = list(_states.values())
+    for state in states:
+        set_llm_breaker_state(state.name, state.breaker.state)
+
+
+register_collector(_collect_breaker_states)
+
+
+class ResilientLLM:
+    """
+    Wraps a chat model or agent executor: invoke/ainvoke/stream/astream get the deadline, retry,
+    breaker and hedging policy; every other attribute (e.g. bind_tools) is passed through.
+    """
+
+    def __init__(self, inner, name):
+        self.inner = inner
+        self.state = get_state(name)
+
+    def __getattr__(self, attribute):
+        return getattr(self.inner, attribute)
+
+    def _admit(self):
+        # Returns the breaker's permit for the first attempt
+        permit = self.state.breaker.allow()
+        if not permit:
+            self.state.count("short_circuited")
+            count_llm_short_circuit(self.state.name)
+            raise CircuitOpen(f"OpenAI calls to {self.state.name} are paused after repeated failures")
+        self.state.count("calls")
+        return permit
+
+    def _end_trial(self, permit):
+        # Every exit that recorded no outcome (cancellation, a closed stream, BaseException) frees
+        # the half-open trial, so the next call can try the API again
+        if permit == TRIAL:
+            self.state.breaker.release()
+
+    def _observe(self, call_start, error=False):
+        # Duration of the whole call (all attempts; streams until their last chunk) for /metrics
+        observe_llm_call(self.state.name, time.monotonic() - call_start, error)
+
+    def _retry_permit(self, error, attempt, deadline, permit):
+        # Records the failed attempt; returns the breaker's permit for a retry, or False to give up
+        retryable = is_retryable(error)
+        self.state.record_failure(error, retryable, permit)
+        if not retryable or attempt >= MAX_RETRIES or time.monotonic() >= deadline:
+            return False
+        return self.state.breaker.allow()
+
+    def _submit(self, args, kwargs):
+        # Runs in a call thread with the caller's context variables (LangChain callbacks, tracing)
+        return _executor().submit(contextvars.copy_context().run, self.inner.invoke, *args, **kwargs)
+
+    def _attempt(self, args, kwargs, timeout):
+        # One attempt in the call threads, hedged once it runs past the client's p95 latency
+        first = self._submit(args, kwargs)
+        hedge_after = self.state.hedge_delay()
+        futures = [first]
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                self.state.count("hedges")
+                futures.append(self._submit(args, kwargs))
+        end = time.monotonic() + timeout
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    if future is not first:
+                        self.state.count("hedge_wins")
+                    for other in futures:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+        for future in futures:
+            future.cancel()
+        if futures or error is None:
+            raise LLMTimeout(f"{self.state.name} did not answer within {timeout:.1f} s")
+        raise error
+
+    def invoke(self, *args, **kwargs):
+        permit = self._admit()
+        call_start = time.monotonic()
+        deadline = call_start + DEADLINE_SECONDS
+        attempt = 0
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    result = self._attempt(args, kwargs, deadline - start)
+                except Exception as e:
+                    permit = self._retry_permit(e, attempt, deadline, permit)
+                    if not permit:
+                        self._observe(call_start, error=True)
+                        raise
+                    attempt += 1
+                    self.state.count("retries")
+                    time.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.monotonic())))
+                    continue
+                self.state.record_success(time.monotonic() - start)
+                permit = None
+                self._observe(call_start)
+                return result
+        finally:
+            self._end_trial(permit)
+
+    async def _attempt_async(self, args, kwargs, timeout):
+        first = asyncio.ensure_future(self.inner.ainvoke(*args, **kwargs))
+        tasks = {first}
+        hedge_after = self.state.hedge_delay()
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.state.count("hedges")
+                tasks.add(asyncio.ensure_future(self.inner.ainvoke(*args, **kwargs)))
+        end = time.monotonic() + timeout
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0.0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.state.count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+        if tasks or error is None:
+            raise LLMTimeout(f"{self.state.name} did not answer within {timeout:.1f} s")
+        raise error
+
+    async def ainvoke(self, *args, **kwargs):
+        permit = self._admit()
+        call_start = time.monotonic()
+        deadline = call_start + DEADLINE_SECONDS
+        attempt = 0
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    result = await self._attempt_async(args, kwargs, deadline - start)
+                except Exception as e:
+                    permit = self._retry_permit(e, attempt, deadline, permit)
+                    if not permit:
+                        self._observe(call_start, error=True)
+                        raise
+                    attempt += 1
+                    self.state.count("retries")
+                    await asyncio.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.monotonic())))
+                    continue
+                self.state.record_success(time.monotonic() - start)
+                permit = None
+                self._observe(call_start)
+                return result
+        finally:
+            self._end_trial(permit)
+
+    def stream(self, *args, **kwargs):
+        # Streams are retried only until the first chunk arrives; each read is bounded by the
+        # client's request timeout rather than the call deadline
+        permit = self._admit()
+        call_start = time.monotonic()
+        deadline = call_start + DEADLINE_SECONDS
+        attempt = 0
+        try:
+            while True:
+                started = False
+                try:
+                    for chunk in self.inner.stream(*args, **kwargs):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    if started:
+                        # Failed mid-stream: not retried, but still counts as the attempt's outcome
+                        self.state.record_failure(e, is_retryable(e), permit)
+                        permit = None
+                    else:
+                        permit = self._retry_permit(e, attempt, deadline, permit)
+                    if not permit:
+                        self._observe(call_start, error=True)
+                        raise
+                    attempt += 1
+                    self.state.count("retries")
+                    time.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.monotonic())))
+                    continue
+                self.state.record_success()
+                permit = None
+                self._observe(call_start)
+                return
+        finally:
+            self._end_trial(permit)
+
+    async def astream(self, *args, **kwargs):
+        permit = self._admit()
+        call_start = time.monotonic()
+        deadline = call_start + DEADLINE_SECONDS
+        attempt = 0
+        try:
+            while True:
+                started = False
+                try:
+                    async for chunk in self.inner.astream(*args, **kwargs):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    if started:
+                        # Failed mid-stream: not retried, but still counts as the attempt's outcome
+                        self.state.record_failure(e, is_retryable(e), permit)
+                        permit = None
+                    else:
+                        permit = self._retry_permit(e, attempt, deadline, permit)
+                    if not permit:
+                        self._observe(call_start, error=True)
+                        raise
+                    attempt += 1
+                    self.state.count("retries")
+                    await asyncio.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.monotonic())))
+                    continue
+                self.state.record_success()
+                permit = None
+                self._observe(call_start)
+                return
+        finally:
+            self._end_trial(permit)
+
+
+def llm_result_usage(result) -> tuple:
+    """
+    Returns the (prompt, completion) token counts of a LangChain LLMResult, or zeros if unknown.
+    """
+    prompt = completion = 0
+    for generations in result.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0)
+                completion += usage.get("output_tokens", 0)
+    if not prompt and not completion:
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return prompt, completion
+
+
+def token_usage_callback(model):
+    """
+    Returns a LangChain callback counting the prompt and completion tokens of every call a chat model
+    makes, including the calls agent executors make through bind_tools(), for /metrics.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageCallback(BaseCallbackHandler):
+        # Counting is cheap, so async runs need not hand it to a thread
+        run_inline = True
+
+        def on_llm_end(self, response, **kwargs):
+            count_llm_tokens(model, *llm_result_usage(response))
+
+    return TokenUsageCallback()
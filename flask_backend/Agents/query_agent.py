@@ -1,14 +1,7 @@
-from langchain_openai import ChatOpenAI
-from langchain.agents import Tool, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
-from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
-from dotenv import load_dotenv
-import os
-
-# Load environment variables
-load_dotenv()
-assert os.getenv("OPENAI_API_KEY"), "OPENAI_API_KEY not found in environment variables"
+from .response_cache import cached_llm_call, cached_llm_call_async, cached_llm_stream, cached_llm_stream_async
+from . import registry
+from .llm_resilience import ResilientLLM
+from .conversation_memory import cache_prompt, context_messages
 
 # Define a fallback for broad or general food queries
 def general_food_query_tool(query: str) -> str:
@@ -22,52 +15,140 @@ def general_food_query_tool(query: str) -> str:
         return "In America, you can enjoy iconic foods like hamburgers, hot dogs, apple pie, barbecue ribs, pancakes, and clam chowder. Don't miss the regional specialties like deep-dish pizza in Chicago or lobster rolls in New England!"
     return "That's an interesting question! Could you please provide more details or specify your query?"
 
-# Wrap the tool in a LangChain Tool object
-general_food_query = Tool(
-    name="general_food_query",
-    func=general_food_query_tool,
-    description="Handles broad or general food-related questions.",
-)
+# Define the custom prompt template
+SYSTEM_PROMPT = "You are an expert in answering general food-related queries."
 
-# List of tools
-tools = [general_food_query]
+# Load the LLM (built on first use)
+QUERY_MODEL = "gpt-4o"
+QUERY_LLM = registry.register_llm(QUERY_MODEL)
 
-# Define the custom prompt template
-prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are an expert in answering general food-related queries."),
-    ("user", "{input}"),
-    MessagesPlaceholder(variable_name="agent_scratchpad"),
-])
-
-# Load the LLM
-llm = ChatOpenAI(
-    temperature=0.7,
-    model="gpt-4o",
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+def build_agent_executor():
+    """
+    Assembles the general query agent (LangChain is imported here, on first use).
+    """
+    from langchain.agents import Tool, AgentExecutor
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
+    from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
+
+    # Wrap the tool in a LangChain Tool object
+    general_food_query = Tool(
+        name="general_food_query",
+        func=general_food_query_tool,
+        description="Handles broad or general food-related questions.",
+    )
+
+    # List of tools
+    tools = [general_food_query]
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="chat_history", optional=True),
+        ("user", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
 
-# Bind tools to the LLM
-llm_with_tools = llm.bind_tools(tools)
-
-# Assemble the agent
-agent = (
-    {
-        "input": lambda x: x["input"],
-        "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
-    }
-    | prompt
-    | llm_with_tools
-    | OpenAIToolsAgentOutputParser()
+    # Bind tools to the LLM
+    llm_with_tools = registry.get(QUERY_LLM).bind_tools(tools)
+
+    # Assemble the agent
+    agent = (
+        {
+            "input": lambda x: x["input"],
+            "chat_history": lambda x: x.get("chat_history", []),
+            "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
+        }
+        | prompt
+        | llm_with_tools
+        | OpenAIToolsAgentOutputParser()
+    )
+
+    # Create the AgentExecutor
+    return AgentExecutor(agent=agent, tools=tools, verbose=True)
+
+AGENT_EXECUTOR = registry.register(
+    "query_agent.agent_executor", lambda: ResilientLLM(build_agent_executor(), "query_agent.agent_executor")
 )
 
-# Create the AgentExecutor
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+# Answer when the model is unavailable (circuit breaker open, deadline exceeded)
+UNAVAILABLE_RESPONSE = "I'm sorry, I can't answer food questions right now. Please try again later."
+
+def _agent_input(user_query, history):
+    return {"input": user_query, "chat_history": context_messages(history)}
+
+
+def _query_messages(user_query, history):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *context_messages(history),
+        {"role": "user", "content": user_query}
+    ]
+
 
 # Function to handle broad or general food-related queries
-def handle_food_query(user_query: str):
+def handle_food_query(user_query: str, history=None):
     """
     Invokes the general query agent with the provided query.
     :param user_query: The user's query string.
+    :param history: Optional conversation context (see conversation_memory.get_context()).
     :return: The agent's response as a dictionary.
     """
-    return agent_executor.invoke({"input": user_query})
\ No newline at end of file
+    try:
+        # Identical questions ("is carbonara gluten free?") are answered from the response cache
+        output = cached_llm_call(
+            QUERY_MODEL,
+            SYSTEM_PROMPT,
+            cache_prompt(user_query, history),
+            lambda: registry.get(AGENT_EXECUTOR).invoke(_agent_input(user_query, history))["output"]
+        )
+    except Exception as e:
+        print(f"Error answering food query: {e}")
+        output = UNAVAILABLE_RESPONSE
+    return {"input": user_query, "output": output}
+
+
+async def handle_food_query_async(user_query: str, history=None):
+    """
+    Async variant of handle_food_query() used by the ASGI app.
+    """
+    async def acall():
+        return (await registry.get(AGENT_EXECUTOR).ainvoke(_agent_input(user_query, history)))["output"]
+
+    try:
+        output = await cached_llm_call_async(QUERY_MODEL, SYSTEM_PROMPT, cache_prompt(user_query, history), acall)
+    except Exception as e:
+        print(f"Error answering food query: {e}")
+        output = UNAVAILABLE_RESPONSE
+    return {"input": user_query, "output": output}
+
+
+def stream_food_query(user_query: str, history=None):
+    """
+    Streams the answer to a general food query as text chunks while the LLM generates it.
+    The chat model is streamed directly (the agent's tool round-trip cannot be streamed).
+    :param user_query: The user's query string.
+    :param history: Optional conversation context (see conversation_memory.get_context()).
+    :return: An iterator of text chunks.
+    """
+    messages = _query_messages(user_query, history)
+
+    def stream():
+        for chunk in registry.get(QUERY_LLM).stream(messages):
+            if chunk.content:
+                yield chunk.content
+
+    return cached_llm_stream(QUERY_MODEL, SYSTEM_PROMPT, cache_prompt(user_query, history), stream)
+
+
+def stream_food_query_async(user_query: str, history=None):
+    """
+    Async variant of stream_food_query(); returns an async iterator of text chunks.
+    """
+    messages = _query_messages(user_query, history)
+
+    async def astream():
+        async for chunk in registry.get(QUERY_LLM).astream(messages):
+            if chunk.content:
+                yield chunk.content
+
+    return cached_llm_stream_async(QUERY_MODEL, SYSTEM_PROMPT, cache_prompt(user_query, history), astream)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+# Lazy registry of the agents' expensive objects (OpenAI clients, LangChain agent executors).
+# Nothing is built, and no LangChain module is imported, until an agent first needs it,
+# so the app starts quickly and routes that never touch an agent need no OpenAI credentials.
+
+# Build every registered object in the background as soon as a worker starts
+PRELOAD = os.getenv("AGENTS_PRELOAD", "0") == "1"
+
+_factories = {}
+_instances = {}
+# name -> seconds spent building the object
+_build_seconds = {}
+_lock = threading.RLock()
+_env_loaded = False
+
+
+def load_env():
+    """
+    Loads the .env file once per process.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_openai_api_key() -> str:
+    """
+    Returns the OpenAI API key.
+    :raises RuntimeError: If OPENAI_API_KEY is not set.
+    """
+    load_env()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY not found in environment variables")
+    return api_key
+
+
+def register(name, factory):
+    """
+    Registers a zero-argument factory; the object is built on the first get(name).
+    Registering a name again keeps the first factory.
+    :return: The name, for use with get().
+    """
+    with _lock:
+        _factories.setdefault(name, factory)
+    return name
+
+
+def get(name):
+    """
+    Returns the object registered under name, building it on first use.
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            start = time.perf_counter()
+            instance = _factories[name]()
+            _build_seconds[name] = time.perf_counter() - start
+            _instances[name] = instance
+            print(f"Initialized {name} in {_build_seconds[name] * 1000:.0f} ms")
+        return instance
+
+
+def install(name, instance):
+    """
+    Uses an already-built object for name instead of its factory (e.g. a fake model in benchmarks).
+    """
+    with _lock:
+        _instances[name] = instance
+        _build_seconds[name] = 0.0
+
+
+def register_llm(model, temperature=0.7):
+    """
+    Registers a shared ChatOpenAI client; agents asking for the same model and temperature share it.
+    Calls go through llm_resilience (deadline, retries and a circuit breaker per model), and their
+    token usage is counted for /metrics.
+    :return: The registry name of the client.
+    """
+    def build():
+        from langchain_openai import ChatOpenAI
+        from .llm_resilience import REQUEST_TIMEOUT_SECONDS, ResilientLLM, token_usage_callback
+        # Retries are left to ResilientLLM, so they share the call's deadline; streamed calls
+        # report their token usage too, for /metrics
+        llm = ChatOpenAI(
+            temperature=temperature, model=model, openai_api_key=get_openai_api_key(),
+            timeout=REQUEST_TIMEOUT_SECONDS, max_retries=0, stream_usage=True,
+            callbacks=[token_usage_callback(model)]
+        )
+        return ResilientLLM(llm, model)
+
+    return register(f"llm:{model}:{temperature}", build)
+
+
+def preload(names=None):
+    """
+    Builds the given (default: all registered) objects now, e.g. right after a worker starts.
+    Failures are logged, not raised, so a missing API key does not stop the server.
+    """
+    with _lock:
+        names = list(names or _factories)
+    for name in names:
+        try:
+            get(name)
+        except Exception as e:
+            print(f"Error initializing {name}: {e}")
+
+
+def preload_in_background(names=None):
+    """
+    Runs preload() in a daemon thread so the worker can serve requests meanwhile.
+    """
+    thread = threading.Thread(target=preload, args=(names,), name="agent-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_registry_stats() -> dict:
+    """
+    Returns, per registered object, whether it is built and how long building it took.
+    """
+    with _lock:
+        return {
+            name: {"built": name in _instances, "build_seconds": _build_seconds.get(name)}
+            for name in _factories
+        }
+
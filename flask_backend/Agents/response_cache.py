@@ -0,0 +1,333 @@
+import asyncio
+import datetime
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import errors
+
+from . import registry
+
+try:
+    from Db import get_collection
+except ImportError:
+    from flask_backend.Db import get_collection
+
+# Cache settings (override through environment variables)
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+# Shared tier in MongoDB, so every worker benefits from each other's answers
+CACHE_MONGO = os.getenv("LLM_CACHE_MONGO", "0") == "1"
+CACHE_COLLECTION = "LLMResponseCache"
+# Near-duplicate lookup through OpenAI embeddings (costs one embedding call per miss)
+CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+# key -> {"response", "scope", "embedding", "latency", "expires_at"}
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    "hits": 0,
+    "memory_hits": 0,
+    "mongo_hits": 0,
+    "semantic_hits": 0,
+    "misses": 0,
+    "latency_saved_seconds": 0.0,
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a prompt so trivially different questions share a cache entry
+    ('What can you do?' and 'what can you do' map to the same key).
+    """
+    return _WHITESPACE.sub(" ", prompt.lower()).strip().rstrip("?!. ")
+
+
+def _scope(model: str, system_prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x00{system_prompt}".encode("utf-8")).hexdigest()
+
+
+def make_key(model: str, system_prompt: str, prompt: str) -> str:
+    """
+    Builds the cache key from the model, the system prompt and the normalized prompt.
+    """
+    return hashlib.sha256(f"{_scope(model, system_prompt)}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+def _build_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model="text-embedding-3-small", openai_api_key=registry.get_openai_api_key())
+
+
+EMBEDDINGS = "embeddings:text-embedding-3-small"
+if CACHE_SEMANTIC:
+    registry.register(EMBEDDINGS, _build_embeddings)
+
+
+def _embed(text: str):
+    return registry.get(EMBEDDINGS).embed_query(text)
+
+
+def _cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _record_hit(tier: str, entry: dict):
+    with _lock:
+        _stats["hits"] += 1
+        _stats[f"{tier}_hits"] += 1
+        _stats["latency_saved_seconds"] += entry.get("latency", 0.0)
+
+
+def _memory_get(key: str):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return entry
+
+
+def _memory_put(key: str, entry: dict):
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def _semantic_get(scope: str, embedding):
+    # Linear scan is fine for the bounded in-memory tier (CACHE_MAX_ENTRIES entries)
+    now = time.monotonic()
+    best, best_similarity = None, SEMANTIC_THRESHOLD
+    with _lock:
+        candidates = [entry for entry in _entries.values() if entry["scope"] == scope and entry["embedding"]]
+    for entry in candidates:
+        if entry["expires_at"] < now:
+            continue
+        similarity = _cosine_similarity(embedding, entry["embedding"])
+        if similarity >= best_similarity:
+            best, best_similarity = entry, similarity
+    return best
+
+
+def _mongo_get(key: str):
+    # The TTL index removes expired entries only about once a minute, so the age is checked here too
+    oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=CACHE_TTL_SECONDS)
+    try:
+        return get_collection(CACHE_COLLECTION).find_one({"_id": key, "created_at": {"$gte": oldest}})
+    except errors.PyMongoError as e:
+        print(f"Error reading LLM response cache: {e}")
+        return None
+
+
+def _age_seconds(created_at) -> float:
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (datetime.datetime.now(datetime.timezone.utc) - created_at).total_seconds())
+
+
+def _mongo_put(key: str, model: str, response: str, latency: float):
+    try:
+        get_collection(CACHE_COLLECTION).replace_one(
+            {"_id": key},
+            {
+                "response": response,
+                "model": model,
+                "latency": latency,
+                "created_at": datetime.datetime.now(datetime.timezone.utc),
+            },
+            upsert=True
+        )
+    except errors.PyMongoError as e:
+        print(f"Error writing LLM response cache: {e}")
+
+
+def _lookup(model: str, system_prompt: str, prompt: str):
+    # Returns (key, scope, embedding, cached response or None); may block on MongoDB/OpenAI
+    key = make_key(model, system_prompt, prompt)
+    scope = _scope(model, system_prompt)
+
+    entry = _memory_get(key)
+    if entry is not None:
+        _record_hit("memory", entry)
+        return key, scope, None, entry["response"]
+
+    if CACHE_MONGO:
+        document = _mongo_get(key)
+        if document is not None:
+            entry = {
+                "response": document["response"],
+                "scope": scope,
+                "embedding": None,
+                "latency": document.get("latency", 0.0),
+                # Expires in memory when it expires in MongoDB, not CACHE_TTL_SECONDS from now
+                "expires_at": time.monotonic() + CACHE_TTL_SECONDS - _age_seconds(document["created_at"]),
+            }
+            _memory_put(key, entry)
+            _record_hit("mongo", entry)
+            return key, scope, None, entry["response"]
+
+    embedding = None
+    if CACHE_SEMANTIC:
+        try:
+            embedding = _embed(normalize_prompt(prompt))
+            entry = _semantic_get(scope, embedding)
+            if entry is not None:
+                _record_hit("semantic", entry)
+                return key, scope, embedding, entry["response"]
+        except Exception as e:
+            print(f"Error computing prompt embedding: {e}")
+
+    with _lock:
+        _stats["misses"] += 1
+    return key, scope, embedding, None
+
+
+def _store(key: str, scope: str, model: str, embedding, response: str, latency: float):
+    _memory_put(key, {
+        "response": response,
+        "scope": scope,
+        "embedding": embedding,
+        "latency": latency,
+        "expires_at": time.monotonic() + CACHE_TTL_SECONDS,
+    })
+    if CACHE_MONGO:
+        _mongo_put(key, model, response, latency)
+
+
+def cached_llm_call(model: str, system_prompt: str, prompt: str, call) -> str:
+    """
+    Returns a cached LLM response for this model/system prompt/prompt, or runs `call` and caches it.
+    Lookup order: in-memory LRU, MongoDB shared tier, embedding similarity.
+    :param model: The model name (part of the key).
+    :param system_prompt: The system prompt (part of the key), or "" if there is none.
+    :param prompt: The user prompt.
+    :param call: Zero-argument function performing the real LLM call and returning the response text.
+    :return: The response text.
+    """
+    if not CACHE_ENABLED:
+        return call()
+
+    key, scope, embedding, response = _lookup(model, system_prompt, prompt)
+    if response is not None:
+        return response
+
+    start = time.perf_counter()
+    response = call()
+    _store(key, scope, model, embedding, response, time.perf_counter() - start)
+    return response
+
+
+async def cached_llm_call_async(model: str, system_prompt: str, prompt: str, acall) -> str:
+    """
+    Async variant of cached_llm_call(); `acall` is a zero-argument coroutine function.
+    Blocking cache tiers (MongoDB, embeddings) run in a worker thread.
+    """
+    if not CACHE_ENABLED:
+        return await acall()
+
+    blocking = CACHE_MONGO or CACHE_SEMANTIC
+    if blocking:
+        key, scope, embedding, response = await asyncio.to_thread(_lookup, model, system_prompt, prompt)
+    else:
+        key, scope, embedding, response = _lookup(model, system_prompt, prompt)
+    if response is not None:
+        return response
+
+    start = time.perf_counter()
+    response = await acall()
+    latency = time.perf_counter() - start
+    if blocking:
+        await asyncio.to_thread(_store, key, scope, model, embedding, response, latency)
+    else:
+        _store(key, scope, model, embedding, response, latency)
+    return response
+
+
+
+def cached_llm_stream(model: str, system_prompt: str, prompt: str, stream):
+    """
+    Streaming variant of cached_llm_call(): yields the response text piece by piece.
+    A cached response is yielded whole; a fresh one is cached once the stream completes.
+    :param stream: Zero-argument function returning an iterator of text chunks from the LLM.
+    """
+    if not CACHE_ENABLED:
+        yield from stream()
+        return
+
+    key, scope, embedding, response = _lookup(model, system_prompt, prompt)
+    if response is not None:
+        yield response
+        return
+
+    start = time.perf_counter()
+    chunks = []
+    for chunk in stream():
+        chunks.append(chunk)
+        yield chunk
+    _store(key, scope, model, embedding, "".join(chunks).strip(), time.perf_counter() - start)
+
+
+async def cached_llm_stream_async(model: str, system_prompt: str, prompt: str, astream):
+    """
+    Async variant of cached_llm_stream(); `astream` returns an async iterator of text chunks.
+    """
+    if not CACHE_ENABLED:
+        async for chunk in astream():
+            yield chunk
+        return
+
+    blocking = CACHE_MONGO or CACHE_SEMANTIC
+    if blocking:
+        key, scope, embedding, response = await asyncio.to_thread(_lookup, model, system_prompt, prompt)
+    else:
+        key, scope, embedding, response = _lookup(model, system_prompt, prompt)
+    if response is not None:
+        yield response
+        return
+
+    start = time.perf_counter()
+    chunks = []
+    async for chunk in astream():
+        chunks.append(chunk)
+        yield chunk
+    latency = time.perf_counter() - start
+    response = "".join(chunks).strip()
+    if blocking:
+        await asyncio.to_thread(_store, key, scope, model, embedding, response, latency)
+    else:
+        _store(key, scope, model, embedding, response, latency)
+
+def clear_cache():
+    """
+    Empties the in-memory tier (the MongoDB tier expires through its TTL index).
+    """
+    with _lock:
+        _entries.clear()
+
+
+def get_cache_stats() -> dict:
+    """
+    Returns hit/miss counters per tier, the hit rate and the LLM latency saved by hits.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
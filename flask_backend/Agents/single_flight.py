@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import inspect
+import re
+import threading
+
+# Single-flight request coalescing: while a call with a given key is running, identical calls
+# (same function, same normalized arguments) wait for it and share its result or exception
+# instead of repeating the LLM or MongoDB request. Nothing is kept once the call finishes,
+# so this never serves stale data (see response_cache.py for caching across time).
+
+_WHITESPACE = re.compile(r"\s+")
+
+# function name -> {"executions", "coalesced"}
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(name, executed: bool):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"executions": 0, "coalesced": 0})
+        stats["executions" if executed else "coalesced"] += 1
+
+
+def normalize_argument(value):
+    """
+    Normalizes an argument for the coalescing key: strings are compared case- and
+    whitespace-insensitively, lists and tuples element by element.
+    """
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value.lower()).strip()
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_argument(item) for item in value)
+    return value
+
+
+def default_key(*args, **kwargs):
+    return (
+        tuple(normalize_argument(arg) for arg in args),
+        tuple(sorted((name, normalize_argument(value)) for name, value in kwargs.items())),
+    )
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key=None):
+    """
+    Decorator collapsing concurrent identical calls into one. Works on plain functions (callers
+    in other threads block until the running call finishes) and on coroutine functions (callers
+    on the same event loop await the running call's task).
+    :param key: Optional function of the call's arguments returning a hashable key; calls with
+                equal keys are coalesced (defaults to the normalized arguments). A None key
+                disables coalescing for that call.
+    """
+    make_key = key or default_key
+
+    def decorator(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+
+        if inspect.iscoroutinefunction(function):
+            # (event loop, key) -> running task; tasks cannot be shared across event loops
+            tasks = {}
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                call_key = make_key(*args, **kwargs)
+                if call_key is None:
+                    return await function(*args, **kwargs)
+                task_key = (id(asyncio.get_running_loop()), call_key)
+                task = tasks.get(task_key)
+                _count(name, task is None)
+                if task is None:
+                    task = asyncio.ensure_future(function(*args, **kwargs))
+                    tasks[task_key] = task
+                    task.add_done_callback(lambda _: tasks.pop(task_key, None))
+                # A cancelled caller does not cancel the call the others are waiting for
+                return await asyncio.shield(task)
+
+            return async_wrapper
+
+        calls = {}
+        lock = threading.Lock()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            call_key = make_key(*args, **kwargs)
+            if call_key is None:
+                return function(*args, **kwargs)
+            with lock:
+                call = calls.get(call_key)
+                leader = call is None
+                if leader:
+                    call = calls[call_key] = _Call()
+            _count(name, leader)
+
+            if not leader:
+                call.done.wait()
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            try:
+                call.result = function(*args, **kwargs)
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with lock:
+                    del calls[call_key]
+                call.done.set()
+
+        return wrapper
+
+    return decorator
+
+
+def get_single_flight_stats() -> dict:
+    """
+    Returns, per decorated function, how many calls ran upstream and how many shared a call in flight.
+    """
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,181 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from werkzeug.utils import secure_filename
+
+# Upload store settings (override through environment variables)
+UPLOADS_DIR = os.getenv("UPLOADS_DIR", os.path.join(os.getcwd(), "uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", "90"))
+CHUNK_SIZE = 64 * 1024
+# Leading bytes of the image types fraud claims are submitted as -> their canonical extension
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+# Other spellings of the canonical extensions
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg"}
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+def _extension(data, filename):
+    # The detected image type wins over the filename, which the client chooses
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    _, ext = os.path.splitext(secure_filename(filename or ""))
+    return EXTENSION_ALIASES.get(ext.lower(), ext.lower())
+
+
+def content_path(sha256, uploads_dir=None):
+    """
+    Returns the sharded path of a stored file: <uploads>/ab/cd/abcd... (the content hash alone,
+    so the same bytes uploaded under different names or extensions are stored once).
+    """
+    return os.path.join(uploads_dir or UPLOADS_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def store_stream(stream, filename="", uploads_dir=None, max_bytes=None):
+    """
+    Writes a binary stream to the content-addressed store, hashing it while it is written.
+    Identical content is only stored once.
+    :param stream: A readable binary file object.
+    :param filename: The original filename (only used for 'ext' when the image type is unknown).
+    :param uploads_dir: Optional store root (defaults to UPLOADS_DIR).
+    :param max_bytes: Optional size limit (defaults to MAX_UPLOAD_BYTES).
+    :return: A dict with 'sha256', 'path', 'ext' (e.g. '.jpg', from the detected image type),
+             'size', 'data' (a memoryview of the bytes, not a copy) and 'deduplicated'.
+    :raises UploadTooLarge: If the stream is larger than the size limit.
+    """
+    uploads_dir = uploads_dir or UPLOADS_DIR
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    os.makedirs(uploads_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    data = bytearray()
+    fd, temp_path = tempfile.mkstemp(dir=uploads_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(data) + len(chunk) > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+                digest.update(chunk)
+                data.extend(chunk)
+                temp_file.write(chunk)
+
+        sha256 = digest.hexdigest()
+        path = content_path(sha256, uploads_dir)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            # Refresh the mtime so retention counts from the latest submission
+            os.utime(path)
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {
+        "sha256": sha256,
+        "path": path,
+        "ext": _extension(data, filename),
+        "size": len(data),
+        "data": memoryview(data),
+        "deduplicated": deduplicated,
+    }
+
+
+def store_upload(file_storage, uploads_dir=None, max_bytes=None):
+    """
+    Stores a Werkzeug FileStorage upload (see store_stream).
+    """
+    return store_stream(file_storage.stream, file_storage.filename, uploads_dir, max_bytes)
+
+
+def garbage_collect(retention_days=None, uploads_dir=None):
+    """
+    Deletes stored files that were not submitted again within the retention period.
+    :return: The number of deleted files.
+    """
+    uploads_dir = uploads_dir or UPLOADS_DIR
+    retention_days = UPLOAD_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = time.time() - retention_days * 86400
+    deleted = 0
+    for root, _, files in os.walk(uploads_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    deleted += 1
+            except OSError as e:
+                print(f"Error removing upload {path}: {e}")
+    return deleted
+
+
+def _strip_extensions(uploads_dir, counts):
+    # Renames files stored as <sha256><ext> (the earlier layout) to <sha256>
+    for root, _, files in os.walk(uploads_dir):
+        if root == uploads_dir:
+            continue
+        for name in files:
+            sha256, ext = os.path.splitext(name)
+            if not ext:
+                continue
+            path = os.path.join(root, name)
+            target = os.path.join(root, sha256)
+            if os.path.exists(target):
+                os.remove(path)
+                counts["duplicates"] += 1
+            else:
+                os.replace(path, target)
+                counts["renamed"] += 1
+
+
+def migrate_legacy_uploads(uploads_dir=None):
+    """
+    Moves files saved flat in the uploads directory (<uuid>-<name>) into the
+    content-addressed layout, dropping byte-identical copies, and renames stored
+    files that still carry an extension.
+    :return: A dict with the number of 'moved', 'renamed' and 'duplicates' files.
+    """
+    uploads_dir = uploads_dir or UPLOADS_DIR
+    counts = {"moved": 0, "renamed": 0, "duplicates": 0}
+    _strip_extensions(uploads_dir, counts)
+    for name in os.listdir(uploads_dir):
+        path = os.path.join(uploads_dir, name)
+        if not os.path.isfile(path) or name.startswith(".upload-"):
+            continue
+        with open(path, "rb") as legacy_file:
+            stored = store_stream(legacy_file, name, uploads_dir, max_bytes=float("inf"))
+        os.remove(path)
+        counts["duplicates" if stored["deduplicated"] else "moved"] += 1
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the fraud-claim upload store.")
+    parser.add_argument("--migrate", action="store_true", help="Move flat legacy uploads into the store")
+    parser.add_argument("--gc", type=float, metavar="DAYS", help="Delete uploads older than DAYS")
+    args = parser.parse_args()
+
+    if args.migrate:
+        print(f"Migrated uploads: {migrate_legacy_uploads()}")
+    if args.gc is not None:
+        print(f"Deleted uploads: {garbage_collect(args.gc)}")
@@ -0,0 +1,318 @@
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# Password hashing and session tokens for the auth blueprint.
+#
+# Passwords are hashed with scrypt (memory-hard, in the standard library). One hash costs tens of
+# milliseconds of CPU, so it runs in a small process pool instead of the request thread: the
+# worker's other requests keep the GIL while a login is being checked, and at most
+# AUTH_HASH_MAX_PENDING hashes wait at once (further logins get HashingBusy -> 503).
+#
+# After a login the client gets a signed token ("v1.<claims>.<signature>", HMAC-SHA256). Later
+# requests send it as "Authorization: Bearer <token>" and are authenticated from the signature
+# and expiry alone, without a database lookup.
+
+# scrypt cost (N=2^14, r=8 uses 16 MB and ~50 ms per hash); stored hashes record their own cost
+SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("AUTH_SCRYPT_P", "1"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Hashing processes per server worker (0 hashes in the calling thread)
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Hashes queued or running at once per server worker before logins are turned away
+HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "32"))
+HASH_TIMEOUT_SECONDS = float(os.getenv("AUTH_HASH_TIMEOUT_SECONDS", "10"))
+
+TOKEN_VERSION = "v1"
+TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", str(24 * 3600)))
+# Protected routes require a "Bearer" token (1). AUTH_REQUIRE_TOKEN=0 is a migration switch only:
+# requests without a token are then trusted with the user id they claim
+REQUIRE_TOKEN = os.getenv("AUTH_REQUIRE_TOKEN", "1") == "1"
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+class AuthError(Exception):
+    """Raised when a request's credentials are missing or invalid; carries the HTTP status."""
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.status = status
+
+
+_pool = {"pid": None, "executor": None}
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+def _reset_pool():
+    """
+    Forgets the parent's hashing pool after a fork; each server worker starts its own.
+    """
+    global _pool_lock, _pending
+    _pool.update(pid=None, executor=None)
+    _pool_lock = threading.Lock()
+    _pending = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _get_executor():
+    with _pool_lock:
+        if _pool["pid"] != os.getpid():
+            # "spawn" so the hashing processes do not inherit the server's threads and sockets;
+            # they re-import the entry script, which must keep its startup under __main__
+            _pool["executor"] = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool["pid"] = os.getpid()
+        return _pool["executor"]
+
+
+def shutdown_pool():
+    """
+    Stops this process's hashing processes (e.g. on server shutdown).
+    """
+    with _pool_lock:
+        if _pool["executor"] is not None and _pool["pid"] == os.getpid():
+            _pool["executor"].shutdown(wait=False, cancel_futures=True)
+        _pool.update(pid=None, executor=None)
+
+
+def _discard_executor(executor):
+    # Drops a broken pool so the next _get_executor() starts a new one
+    with _pool_lock:
+        if _pool["executor"] is executor:
+            _pool.update(pid=None, executor=None)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(executor, function, *args):
+    # Queues a hash, refusing new work once HASH_MAX_PENDING are queued or running. The slot is
+    # freed when the hash finishes, not when the caller stops waiting for it.
+    pending = _pending
+    if not pending.acquire(blocking=False):
+        raise HashingBusy("Too many logins in progress")
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        pending.release()
+        raise
+    future.add_done_callback(lambda _: pending.release())
+    return future
+
+
+def _run(function, *args):
+    # Runs a hashing function in the pool; if a hashing process died (e.g. killed for running
+    # out of memory) the pool is broken for good, so it is replaced and the hash retried once
+    if HASH_WORKERS <= 0:
+        return function(*args)
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            future = _submit(executor, function, *args)
+            try:
+                return future.result(timeout=HASH_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                # Frees the slot now if the hash has not started yet
+                future.cancel()
+                raise
+        except BrokenProcessPool:
+            print("Password hashing pool broken, starting a new one")
+            _discard_executor(executor)
+            if attempt:
+                raise
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024,
+                          dklen=HASH_BYTES)
+
+
+def _hash(password: str) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _verify(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = stored.split("$")
+        if scheme != "scrypt":
+            return False
+        return hmac.compare_digest(_scrypt(password, _b64decode(salt), int(n), int(r), int(p)), _b64decode(digest))
+    except ValueError:
+        return False
+
+
+def hash_password(password: str) -> str:
+    """
+    Hashes a password for storage (in the hashing pool).
+    :return: "scrypt$N$r$p$<salt>$<hash>".
+    :raises HashingBusy: If too many hashes are already queued.
+    """
+    return _run(_hash, password)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Checks a password against a stored hash (in the hashing pool).
+    :raises HashingBusy: If too many hashes are already queued.
+    """
+    return _run(_verify, password, stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    Returns True if a stored hash was made with other cost settings than the current ones.
+    """
+    return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+# Checked against when the email is unknown, so failed logins take as long either way
+_DUMMY_HASH = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(b'0' * SALT_BYTES)}${_b64encode(b'0' * HASH_BYTES)}"
+
+
+def check_user_password(user, password: str):
+    """
+    Checks a login against a Logincredentials document.
+    Accounts created before hashing store the plaintext "password"; those are compared directly
+    and a hash is returned so the caller can replace the plaintext.
+    :param user: The user document (None if the email is unknown).
+    :return: (authenticated, new hash to store or None).
+    :raises HashingBusy: If too many hashes are already queued.
+    """
+    if user is None:
+        verify_password(password, _DUMMY_HASH)
+        return False, None
+    stored = user.get("password_hash")
+    if stored:
+        if not verify_password(password, stored):
+            return False, None
+        return True, hash_password(password) if needs_rehash(stored) else None
+    legacy = user.get("password")
+    if isinstance(legacy, str) and hmac.compare_digest(legacy.encode(), password.encode()):
+        return True, hash_password(password)
+    return False, None
+
+
+def _secrets():
+    configured = os.getenv("AUTH_TOKEN_SECRET")
+    if not configured:
+        configured = ensure_token_secret()
+    return [secret.strip().encode() for secret in configured.split(",") if secret.strip()]
+
+
+def ensure_token_secret() -> str:
+    """
+    Returns AUTH_TOKEN_SECRET, generating a random one for this process tree if it is unset.
+    Call it before forking workers (see gunicorn.conf.py) so they all accept each other's tokens;
+    set AUTH_TOKEN_SECRET explicitly so tokens survive restarts and are shared across hosts.
+    A comma-separated list rotates secrets: the first signs, all of them verify.
+    """
+    secret = os.getenv("AUTH_TOKEN_SECRET")
+    if not secret:
+        print("AUTH_TOKEN_SECRET not set, using a random secret (tokens end with this server)")
+        secret = secrets.token_urlsafe(32)
+        os.environ["AUTH_TOKEN_SECRET"] = secret
+    return secret
+
+
+def _sign(secret: bytes, message: str) -> str:
+    return _b64encode(hmac.new(secret, message.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: str, ttl_seconds=None) -> str:
+    """
+    Issues a signed session token for a user.
+    :param user_id: The user's id (the Logincredentials _id as a string).
+    :param ttl_seconds: Optional lifetime (defaults to AUTH_TOKEN_TTL_SECONDS).
+    """
+    now = int(time.time())
+    claims = {"sub": user_id, "iat": now, "exp": now + (ttl_seconds or TOKEN_TTL_SECONDS)}
+    message = f"{TOKEN_VERSION}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode())}"
+    return f"{message}.{_sign(_secrets()[0], message)}"
+
+
+def verify_token(token: str) -> dict:
+    """
+    Verifies a token's signature and expiry.
+    :return: The token's claims ({"sub", "iat", "exp"}).
+    :raises AuthError: If the token is malformed, forged or expired.
+    """
+    try:
+        version, payload, signature = token.split(".")
+    except (AttributeError, ValueError):
+        raise AuthError("Malformed token")
+    message = f"{version}.{payload}"
+    if version != TOKEN_VERSION or not any(
+        hmac.compare_digest(_sign(secret, message), signature) for secret in _secrets()
+    ):
+        raise AuthError("Invalid token")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise AuthError("Malformed token")
+    if claims.get("exp", 0) < time.time():
+        raise AuthError("Token expired")
+    return claims
+
+
+def authenticate(authorization, claimed_user_id=None):
+    """
+    Resolves the user of a request from its Authorization header.
+    :param authorization: The Authorization header value (may be None).
+    :param claimed_user_id: The user id the request body/query names, if any.
+    :return: The token's user id; without a token, claimed_user_id (only when REQUIRE_TOKEN is off).
+    :raises AuthError: If the token is invalid (401), missing while required (401),
+                       or belongs to another user than claimed_user_id (403).
+    """
+    if not authorization:
+        if REQUIRE_TOKEN:
+            raise AuthError("Authentication required")
+        return claimed_user_id
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise AuthError("Expected a Bearer token")
+    user_id = verify_token(token.strip())["sub"]
+    if claimed_user_id and claimed_user_id != user_id:
+        raise AuthError("Token does not match the requested user", status=403)
+    return user_id
+
+
+def optional_user(authorization):
+    """
+    Resolves the user of a request that may be anonymous (e.g. chatbot queries).
+    :param authorization: The Authorization header value (may be None).
+    :return: The token's user id, or None if there is no valid Bearer token.
+    """
+    if not authorization:
+        return None
+    try:
+        return authenticate(authorization)
+    except AuthError:
+        return None
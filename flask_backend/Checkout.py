@@ -1,14 +1,129 @@
+import datetime
+
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
-from Db import get_db
+from pymongo import ReturnDocument, UpdateOne, errors
+from Db import get_collection
+from OrderIds import generate_order_id
+from Auth import AuthError, authenticate
 
 # Define Blueprint
 checkout_blueprint = Blueprint('checkout', __name__)
 CORS(checkout_blueprint, origins=["http://localhost:3000"], supports_credentials=True)
 
-# MongoDB connection
-db = get_db()  # Get the database connection
-orders_collection = db['Orders'] if db is not None else None  # Explicit None check
+# MongoDB connection (shared pool, connects lazily on first query)
+orders_collection = get_collection('Orders')
+# Idempotency key -> order id, one document per (user_ID, key)
+checkout_keys_collection = get_collection('CheckoutKeys')
+
+# Error code returned by standalone servers that cannot run multi-document transactions
+ILLEGAL_OPERATION = 20
+# Unique index violation (an order_id already used by another user)
+DUPLICATE_KEY = 11000
+# Longest Idempotency-Key header accepted
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+# None until the first checkout finds out whether the server supports transactions
+_transactions_supported = None
+
+
+def build_order_operations(order_id, user_id, customer_name, phone_number, email, delivery_address, cart_items):
+    """
+    Builds one idempotent upsert per cart item, keyed on (order_id, line_no, user_ID).
+    A retried checkout with the same order_id matches the existing rows instead of duplicating them;
+    another user's order with that id never matches (the unique (order_id, line_no) index rejects it).
+    :return: A list of pymongo UpdateOne operations.
+    """
+    operations = []
+    for line_no, cart_item in enumerate(cart_items):
+        order = {
+            "collecting_order": True,
+            "user_ID": user_id,
+            "fooditem_name": cart_item.get("product_name"),
+            "Name": customer_name,
+            "phone_number": phone_number,
+            "email": email,
+            "quantity": cart_item.get("quantity"),
+            "delivery_address": delivery_address,
+            "order_id": order_id,
+            "line_no": line_no
+        }
+        operations.append(UpdateOne(
+            {"order_id": order_id, "line_no": line_no, "user_ID": user_id},
+            {"$setOnInsert": order},
+            upsert=True
+        ))
+    return operations
+
+
+def order_id_for_key(user_id, key):
+    """
+    Returns the order id issued for this user's idempotency key, issuing a new one the first time.
+    A replayed or double-submitted checkout therefore writes (and returns) the same order.
+    """
+    for _ in range(2):
+        try:
+            record = checkout_keys_collection.find_one_and_update(
+                {"user_ID": user_id, "key": key},
+                {"$setOnInsert": {
+                    "order_id": generate_order_id(),
+                    "created_at": datetime.datetime.now(datetime.timezone.utc),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return record["order_id"]
+        except errors.DuplicateKeyError:
+            # A concurrent request with the same key inserted first; the retry reads its order id
+            continue
+    raise RuntimeError(f"Could not resolve idempotency key for user {user_id}")
+
+
+def order_belongs_to_other_user(order_id, user_id) -> bool:
+    """
+    Returns True if line items with this order_id already exist for a different user.
+    """
+    return orders_collection.find_one({"order_id": order_id, "user_ID": {"$ne": user_id}}, {"_id": 1}) is not None
+
+
+def is_duplicate_key_error(error) -> bool:
+    """
+    Returns True if a bulk write failed on the unique (order_id, line_no) index.
+    """
+    return any(write_error.get("code") == DUPLICATE_KEY for write_error in error.details.get("writeErrors", []))
+
+
+def write_order(operations):
+    """
+    Writes all line items of an order in a single ordered bulk write.
+    Runs inside a transaction when the server supports it (replica set / mongos),
+    otherwise falls back to a plain ordered bulk write.
+    :return: The number of newly inserted line items (0 for a replayed checkout).
+    """
+    global _transactions_supported
+
+    if _transactions_supported is not False:
+        try:
+            with orders_collection.database.client.start_session() as session:
+                result = session.with_transaction(
+                    lambda s: orders_collection.bulk_write(operations, ordered=True, session=s)
+                )
+            _transactions_supported = True
+            return result.upserted_count
+        except errors.OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+            print("Transactions not supported by MongoDB server, using plain bulk writes")
+            _transactions_supported = False
+
+    result = orders_collection.bulk_write(operations, ordered=True)
+    return result.upserted_count
+
+def conflict_response(order_id):
+    print(f"Checkout rejected: order {order_id} belongs to another user")
+    response = jsonify({"status": "error", "message": "Order ID already in use"})
+    response.headers.add("Access-Control-Allow-Origin", "http://localhost:3000")
+    response.headers.add("Access-Control-Allow-Credentials", "true")
+    return response, 409
 
 @checkout_blueprint.route('/checkout', methods=['POST', 'OPTIONS'])
 def checkout():
@@ -17,48 +132,60 @@ def checkout():
         response = jsonify()
         response.headers.add("Access-Control-Allow-Origin", "http://localhost:3000")
         response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, Authorization, Idempotency-Key")
         response.headers.add("Access-Control-Allow-Credentials", "true")
         return response, 200
 
-    if db is None or orders_collection is None:
-        return jsonify({"status": "error", "message": "Database connection error"}), 500
-
     try:
         # Parse JSON from the request
         data = request.json
         if not data:
             return jsonify({"status": "error", "message": "Invalid JSON format"}), 400
 
-        # Extract data from the request
-        user_id = data.get("user_id")
+        # Extract data from the request (the user comes from the session token when one is sent)
+        try:
+            user_id = authenticate(request.headers.get("Authorization"), data.get("user_id"))
+        except AuthError as e:
+            return jsonify({"status": "error", "message": str(e)}), e.status
         customer_name = data.get("customer_name")
         phone_number = data.get("phone_number")
         email = data.get("email")
         delivery_address = data.get("delivery_address")
-        order_id = data.get("order_id")
+        # The client sends one Idempotency-Key per checkout, so retries get the order id issued the
+        # first time; the id of an earlier attempt may also be sent back as order_id
+        idempotency_key = request.headers.get("Idempotency-Key", "").strip()
         cart_items = data.get("cart_items", [])
 
-        if not all([user_id, customer_name, phone_number, email, delivery_address, order_id, cart_items]):
+        if not all([user_id, customer_name, phone_number, email, delivery_address, cart_items]):
             return jsonify({"status": "error", "message": "All fields are required"}), 400
+        if len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return jsonify({"status": "error", "message": "Idempotency-Key is too long"}), 400
+
+        if data.get("order_id"):
+            order_id = data["order_id"]
+        elif idempotency_key:
+            order_id = order_id_for_key(user_id, idempotency_key)
+        else:
+            order_id = generate_order_id()
 
-        # Insert each cart item as a separate order document in MongoDB
-        for cart_item in cart_items:
-            order = {
-                "collecting_order": True,
-                "user_ID": user_id,
-                "fooditem_name": cart_item.get("product_name"),
-                "Name": customer_name,
-                "phone_number": phone_number,
-                "email": email,
-                "quantity": cart_item.get("quantity"),
-                "delivery_address": delivery_address,
-                "order_id": order_id
-            }
-            orders_collection.insert_one(order)
+        # Insert every cart item (one document per item) in a single round-trip
+        operations = build_order_operations(
+            order_id, user_id, customer_name, phone_number, email, delivery_address, cart_items
+        )
+        if data.get("order_id") and order_belongs_to_other_user(order_id, user_id):
+            return conflict_response(order_id)
+        try:
+            inserted = write_order(operations)
+        except errors.BulkWriteError as e:
+            # Another user's checkout took this order_id after the check above
+            if not is_duplicate_key_error(e):
+                raise
+            return conflict_response(order_id)
+        if not inserted:
+            print(f"Checkout for order {order_id} already recorded, ignoring retry")
 
         # Respond with success
-        response = jsonify({"status": "success"})
+        response = jsonify({"status": "success", "order_id": order_id})
         response.headers.add("Access-Control-Allow-Origin", "http://localhost:3000")
         response.headers.add("Access-Control-Allow-Credentials", "true")
         return response, 200
@@ -1,13 +1,174 @@
+import inspect
+import os
+import threading
+
 from pymongo import MongoClient, errors
 
-def get_db():
+try:
+    from Metrics import mongo_command_listener
+except ImportError:
+    from flask_backend.Metrics import mongo_command_listener
+
+# Connection settings (override through environment variables)
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("MONGO_DB_NAME", "CuisineConnect")
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Process-wide client registries: uri -> (owner pid, client)
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_clients():
+    """
+    Drops clients inherited from the parent process after a fork.
+    MongoClient is not fork-safe, so each pre-fork worker builds its own pool.
+    """
+    global _clients_lock
+    _clients.clear()
+    _async_clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def get_client(uri=None):
+    """
+    Returns the shared MongoClient for the given URI, creating it on first use.
+    The client connects lazily, so no network round-trip happens here.
+    :param uri: Optional MongoDB URI (defaults to MONGO_URI).
+    :return: A pooled MongoClient owned by the current process.
+    """
+    uri = uri or MONGO_URI
+    pid = os.getpid()
+    entry = _clients.get(uri)
+    if entry is not None and entry[0] == pid:
+        return entry[1]
+
+    with _clients_lock:
+        entry = _clients.get(uri)
+        if entry is None or entry[0] != pid:
+            client = MongoClient(
+                uri,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                connect=False,
+                # Command timings for /metrics
+                event_listeners=[mongo_command_listener],
+            )
+            entry = (pid, client)
+            _clients[uri] = entry
+        return entry[1]
+
+
+def set_client(client, uri=None):
+    """
+    Installs an already-built client for the given URI in this process, e.g. a mongomock
+    client for offline benchmarks. Must run before modules grab their collections.
+    :param client: A MongoClient-compatible object.
+    :param uri: Optional MongoDB URI (defaults to MONGO_URI).
+    """
+    with _clients_lock:
+        _clients[uri or MONGO_URI] = (os.getpid(), client)
+
+
+def get_async_client(uri=None):
+    """
+    Returns the shared asyncio MongoDB client for the given URI (used by the ASGI app).
+    Uses pymongo's AsyncMongoClient (pymongo >= 4.10) or Motor when it is not available.
+    :param uri: Optional MongoDB URI (defaults to MONGO_URI).
+    :return: An async client owned by the current process.
+    """
+    uri = uri or MONGO_URI
+    pid = os.getpid()
+    with _clients_lock:
+        entry = _async_clients.get(uri)
+        if entry is None or entry[0] != pid:
+            try:
+                from pymongo import AsyncMongoClient
+            except ImportError:
+                from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+            client = AsyncMongoClient(
+                uri,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                event_listeners=[mongo_command_listener],
+            )
+            entry = (pid, client)
+            _async_clients[uri] = entry
+        return entry[1]
+
+
+def get_async_collection(name):
+    """
+    Returns a collection from the CuisineConnect database on the shared async client.
+    :param name: The collection name (e.g. 'Orders').
+    :return: An async collection object (await its find_one(), to_list(), ...).
+    """
+    return get_async_client()[DB_NAME][name]
+
+
+def get_db(name=None):
+    """
+    Returns the CuisineConnect database handle backed by the shared client.
+    :param name: Optional database name (defaults to DB_NAME).
+    :return: A pymongo Database object.
+    """
+    return get_client()[name or DB_NAME]
+
+
+def get_collection(name):
+    """
+    Returns a collection from the CuisineConnect database.
+    :param name: The collection name (e.g. 'Orders').
+    :return: A pymongo Collection object.
+    """
+    return get_db()[name]
+
+
+def ping():
+    """
+    Checks that MongoDB is reachable. Intended for health checks, not for every request.
+    :return: True if the server answered, False otherwise.
+    """
     try:
-        client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
-        # Trigger a connection test
-        client.server_info()
-        db = client['CuisineConnect']  # Database name
-        print("Connected to MongoDB successfully!")
-        return db
-    except errors.ServerSelectionTimeoutError as err:
+        get_client().admin.command("ping")
+        return True
+    except errors.PyMongoError as err:
         print("MongoDB connection error:", err)
-        return None
\ No newline at end of file
+        return False
+
+
+def close_clients():
+    """
+    Closes every client in the registry (e.g. on worker shutdown).
+    """
+    with _clients_lock:
+        for _, client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+async def close_async_clients():
+    """
+    Closes every async client this process created (e.g. on ASGI lifespan shutdown).
+    """
+    pid = os.getpid()
+    with _clients_lock:
+        clients = [client for owner, client in _async_clients.values() if owner == pid]
+        _async_clients.clear()
+    for client in clients:
+        # AsyncMongoClient.close() is a coroutine; Motor's close() is not
+        result = client.close()
+        if inspect.isawaitable(result):
+            await result
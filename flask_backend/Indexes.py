@@ -0,0 +1,167 @@
+import argparse
+
+from pymongo import ASCENDING, errors
+from Db import get_db
+from Agents.response_cache import CACHE_TTL_SECONDS
+
+# Declarative index specification: collection -> list of indexes.
+# Every index is named explicitly so ensure_indexes() is idempotent across runs.
+INDEXES = {
+    "Logincredentials": [
+        # Login lookups and the uniqueness check in create_account()
+        {"name": "email_unique", "keys": [("email", ASCENDING)], "unique": True},
+    ],
+    "Orders": [
+        # Lookups by order id: fetch_orders.handle_orders(), craete_orders_agent.handle_order_status()
+        # and claim_image_index (the partial index below cannot serve them, and misses legacy rows)
+        {"name": "order_id", "keys": [("order_id", ASCENDING)]},
+        # Idempotent checkout upserts: one row per (order_id, line_no)
+        {
+            "name": "order_id_line_no_unique",
+            "keys": [("order_id", ASCENDING), ("line_no", ASCENDING)],
+            "unique": True,
+            # Orders written before line_no existed are left out of the uniqueness check
+            "partialFilterExpression": {"line_no": {"$exists": True}},
+        },
+        # Per-user order listing in GET /api/orders (match on user_ID, page on order_id)
+        {"name": "user_ID_order_id", "keys": [("user_ID", ASCENDING), ("order_id", ASCENDING)]},
+    ],
+    "CheckoutKeys": [
+        # Idempotency-Key -> order id per user (Checkout.order_id_for_key)
+        {"name": "user_ID_key_unique", "keys": [("user_ID", ASCENDING), ("key", ASCENDING)], "unique": True},
+    ],
+    "Fooditems": [
+        # Cuisine recommendations
+        {"name": "cuisine_key", "keys": [("cuisine_key", ASCENDING)]},
+    ],
+    "FraudClaims": [
+        # Claim history per order (Agents/fraud_claims.py)
+        {"name": "order_id", "keys": [("order_id", ASCENDING)]},
+    ],
+    "ClaimImages": [
+        # Incremental refresh of the duplicate-claim index (Agents/claim_image_index.py)
+        {"name": "created_at", "keys": [("created_at", ASCENDING)]},
+        {"name": "order_id", "keys": [("order_id", ASCENDING)]},
+    ],
+    "LLMResponseCache": [
+        # Expire shared LLM response cache entries (Agents/response_cache.py) after LLM_CACHE_TTL_SECONDS
+        {"name": "created_at_ttl", "keys": [("created_at", ASCENDING)], "expireAfterSeconds": int(CACHE_TTL_SECONDS)},
+    ],
+    "ChatSessions": [
+        # Delete idle chat sessions (Agents/conversation_memory.py) at their expires_at time
+        {"name": "expires_at_ttl", "keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+}
+
+
+def migrate(db=None):
+    """
+    Applies data migrations the declared indexes depend on.
+    Currently backfills the normalized 'cuisine_key' field on Fooditems.
+    :return: A dict of collection name -> number of modified documents.
+    """
+    db = db if db is not None else get_db()
+    result = db["Fooditems"].update_many(
+        {"cuisine_key": {"$exists": False}, "cuisine": {"$type": "string"}},
+        [{"$set": {"cuisine_key": {"$toLower": {"$trim": {"input": "$cuisine"}}}}}]
+    )
+    return {"Fooditems": result.modified_count}
+
+
+def _update_ttl(db, collection_name, index, existing):
+    # A TTL index keeps the expireAfterSeconds it was built with; collMod applies a changed setting
+    ttl = index.get("expireAfterSeconds")
+    if ttl is None or existing.get("expireAfterSeconds") == ttl:
+        return
+    try:
+        db.command("collMod", collection_name, index={"name": index["name"], "expireAfterSeconds": ttl})
+        print(f"Updated {index['name']} on {collection_name} to expire after {ttl} s")
+    except errors.OperationFailure as e:
+        print(f"Failed to update TTL of {index['name']} on {collection_name}: {e}")
+
+
+def ensure_indexes(db=None):
+    """
+    Creates every index declared in INDEXES that does not exist yet and updates changed TTLs.
+    :return: A dict of collection name -> list of index names that were created.
+    """
+    db = db if db is not None else get_db()
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        for index in indexes:
+            if index["name"] in existing:
+                _update_ttl(db, collection_name, index, existing[index["name"]])
+                continue
+            options = {key: value for key, value in index.items() if key != "keys"}
+            try:
+                collection.create_index(index["keys"], **options)
+                created.setdefault(collection_name, []).append(index["name"])
+            except errors.OperationFailure as e:
+                # e.g. duplicate emails already stored; report instead of aborting startup
+                print(f"Failed to create index {index['name']} on {collection_name}: {e}")
+    return created
+
+
+def report_indexes(db=None):
+    """
+    Compares the declared indexes with the ones present in the database.
+    :return: A dict of collection name -> {"missing": [...], "unused": [...], "undeclared": [...]}.
+             'unused' lists indexes with no recorded accesses since the server started.
+    """
+    db = db if db is not None else get_db()
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        declared = {index["name"] for index in indexes}
+
+        try:
+            stats = list(collection.aggregate([{"$indexStats": {}}]))
+            unused = sorted(
+                stat["name"] for stat in stats
+                if stat["name"] != "_id_" and stat.get("accesses", {}).get("ops", 0) == 0
+            )
+        except errors.OperationFailure as e:
+            print(f"Could not read index stats for {collection_name}: {e}")
+            unused = []
+
+        report[collection_name] = {
+            "missing": sorted(declared - set(existing)),
+            "unused": unused,
+            "undeclared": sorted(set(existing) - declared - {"_id_"}),
+        }
+    return report
+
+
+def ensure_database():
+    """
+    Runs migrate() and ensure_indexes() at server startup, so documents added since the last
+    run get their derived fields. Failures are reported without stopping the server.
+    """
+    try:
+        print(f"Migrated documents: {migrate()}")
+    except Exception as e:
+        print(f"Error migrating documents: {e}")
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print(f"Error ensuring indexes: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage CuisineConnect MongoDB indexes.")
+    parser.add_argument("--report", action="store_true", help="Only report missing and unused indexes")
+    args = parser.parse_args()
+
+    if not args.report:
+        print(f"Migrated documents: {migrate()}")
+        print(f"Created indexes: {ensure_indexes()}")
+
+    for collection_name, entry in report_indexes().items():
+        print(f"{collection_name}: missing={entry['missing']} unused={entry['unused']} undeclared={entry['undeclared']}")
+
+
+if __name__ == '__main__':
+    main()
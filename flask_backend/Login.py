@@ -1,15 +1,26 @@
 from flask import Blueprint, request, jsonify
-from pymongo import MongoClient
 from flask_cors import CORS
+from pymongo import errors
+from Db import get_collection
+from Auth import HashingBusy, TOKEN_TTL_SECONDS, check_user_password, hash_password, issue_token
 
 # Define Blueprint
 auth_blueprint = Blueprint('auth', __name__)
 CORS(auth_blueprint, origins=["http://localhost:3000"], supports_credentials=True)
 
-# MongoDB connection
-client = MongoClient('mongodb://localhost:27017/')
-db = client['CuisineConnect']
-users_collection = db['Logincredentials']
+# MongoDB connection (shared pool)
+users_collection = get_collection('Logincredentials')
+
+
+def busy_response():
+    # All hashing slots are taken; the client should retry shortly
+    response = jsonify({"status": "error", "message": "Too many login attempts in progress, please retry"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+def token_fields(user_id):
+    return {"user_id": user_id, "token": issue_token(user_id), "expires_in": TOKEN_TTL_SECONDS}
 
 @auth_blueprint.route('/login', methods=['POST', 'OPTIONS'])
 def login():
@@ -30,21 +41,26 @@ def login():
     if not email or not password:
         return jsonify({"status": "error", "message": "Email and password are required"}), 400
 
-    # Debug incoming credentials
     print(f"Received Email: {email}")
-    print(f"Received Password: {password}")  # In production, don't log passwords
 
     try:
-        # Directly match email and password in the database
-        user = users_collection.find_one({"email": email, "password": password})
-        print(f"Database query result: {user}")
+        user = users_collection.find_one({"email": email}, {"password_hash": 1, "password": 1})
+        # The password is checked in the hashing pool, off this worker's request threads
+        authenticated, new_hash = check_user_password(user, password)
 
-        if user:
+        if authenticated:
             print("User authenticated")
-            return jsonify({"status": "success", "message": "Login successful!", "user_id": str(user['_id'])}), 200
+            if new_hash:
+                # Replace a plaintext (pre-hashing) password or an outdated hash
+                users_collection.update_one(
+                    {"_id": user["_id"]}, {"$set": {"password_hash": new_hash}, "$unset": {"password": ""}}
+                )
+            return jsonify({"status": "success", "message": "Login successful!", **token_fields(str(user['_id']))}), 200
         else:
             print("Authentication failed")
             return jsonify({"status": "error", "message": "Invalid email or password"}), 401
+    except HashingBusy:
+        return busy_response()
     except Exception as e:
         print(f"Error querying the database: {e}")
         return jsonify({"status": "error", "message": "An error occurred while processing the login"}), 500
@@ -69,25 +85,25 @@ def create_account():
         return jsonify({"status": "error", "message": "All fields are required"}), 400
 
     try:
-        # Check if the email already exists
-        existing_user = users_collection.find_one({"email": email})
-        if existing_user:
-            return jsonify({"status": "error", "message": "Email already registered"}), 400
-
-        # Insert new user into database without hashing password
         new_user = {
             "name": name,
             "email": email,
-            "password": password  # Store the password as-is
+            "password_hash": hash_password(password)
         }
-        result = users_collection.insert_one(new_user)
+        # The unique index on email (see Indexes.py) rejects already registered emails
+        try:
+            result = users_collection.insert_one(new_user)
+        except errors.DuplicateKeyError:
+            return jsonify({"status": "error", "message": "Email already registered"}), 400
         print(f"New user created with ID: {result.inserted_id}")
 
         return jsonify({
             "status": "success",
             "message": "Account created successfully!",
-            "user_id": str(result.inserted_id)
+            **token_fields(str(result.inserted_id))
         }), 201
+    except HashingBusy:
+        return busy_response()
     except Exception as e:
         print("Error during account creation:", e)
         return jsonify({"status": "error", "message": "An error occurred while creating the account"}), 500
\ No newline at end of file
@@ -0,0 +1,247 @@
+import bisect
+import os
+import threading
+
+from pymongo import monitoring
+
+# In-process metrics in the Prometheus text format, served at GET /metrics.
+# Recording a sample is a dict lookup and a few additions under a per-metric lock, so the
+# hooks can sit on every request, agent call and MongoDB command. Each worker process keeps its
+# own counts; scrape every worker (or run a single worker per port) to get the full picture.
+
+# Set METRICS_ENABLED=0 to turn every hook into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Histogram buckets, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count per label combination.
+    """
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}")
+        return lines
+
+
+class Gauge:
+    """
+    A value per label combination that can go up and down (set from current state at scrape time).
+    """
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label combination (plus their count and sum).
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted((label_values, list(counts), total) for label_values, (counts, total) in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, [("le", _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce an HTTP response, by route.",
+    ("route", "method", "status"),
+)
+agent_duration = Histogram(
+    "agent_duration_seconds", "Time for decide_agent() to answer a chatbot query, by routed intent.",
+    ("intent", "outcome"),
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "Duration of OpenAI calls including retries, by model or agent executor.",
+    ("model", "outcome"),
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "OpenAI tokens used, by model and type (prompt or completion).",
+    ("model", "type"),
+)
+llm_short_circuited = Counter(
+    "llm_short_circuited_total", "OpenAI calls failed fast because the model's circuit breaker was open.",
+    ("model",),
+)
+llm_breaker_state = Gauge(
+    "llm_circuit_breaker_state", "1 for the current circuit breaker state of each model (closed, open or half_open).",
+    ("model", "state"),
+)
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "Duration of MongoDB commands, by command name.",
+    ("command", "outcome"), MONGO_BUCKETS,
+)
+
+METRICS = [
+    http_request_duration, agent_duration, llm_request_duration, llm_tokens, llm_short_circuited,
+    llm_breaker_state, mongo_command_duration,
+]
+# Functions run before each scrape, e.g. to set gauges from the current state
+_collectors = []
+
+
+def register_collector(collector):
+    """
+    Registers a zero-argument function that render_metrics() calls first (e.g. to update gauges).
+    """
+    _collectors.append(collector)
+
+
+def observe_request(route, method, status, seconds):
+    """
+    Records one HTTP response.
+    :param route: The route pattern (e.g. '/api/fraud-claims/<job_id>'), not the raw path.
+    """
+    if METRICS_ENABLED:
+        http_request_duration.observe(seconds, route, method, str(status))
+
+
+def observe_agent(intent, seconds, error=False):
+    """
+    Records one decide_agent() call; error is True when the agent failed or returned an error.
+    """
+    if METRICS_ENABLED:
+        agent_duration.observe(seconds, intent, "error" if error else "ok")
+
+
+def observe_llm_call(model, seconds, error=False):
+    """
+    Records one logical OpenAI call (all its attempts).
+    """
+    if METRICS_ENABLED:
+        llm_request_duration.observe(seconds, model, "error" if error else "ok")
+
+
+def count_llm_short_circuit(model):
+    if METRICS_ENABLED:
+        llm_short_circuited.inc(model)
+
+
+def set_llm_breaker_state(model, state):
+    for known_state in ("closed", "open", "half_open"):
+        llm_breaker_state.set(int(state == known_state), model, known_state)
+
+
+def count_llm_tokens(model, prompt_tokens, completion_tokens):
+    if METRICS_ENABLED:
+        if prompt_tokens:
+            llm_tokens.inc(model, "prompt", amount=prompt_tokens)
+        if completion_tokens:
+            llm_tokens.inc(model, "completion", amount=completion_tokens)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Times every command sent on a client it is registered with (see Db.get_client).
+    pymongo reports the duration itself, so nothing is kept between started and finished.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if METRICS_ENABLED:
+            mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, "ok")
+
+    def failed(self, event):
+        if METRICS_ENABLED:
+            mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
+mongo_command_listener = MongoCommandListener()
+
+
+def render_metrics() -> str:
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
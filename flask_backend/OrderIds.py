@@ -0,0 +1,66 @@
+import os
+import random
+import threading
+import time
+
+# Order ids are "ORD-" followed by a Snowflake-style 63-bit number, generated without a database
+# round-trip: milliseconds since ORDER_ID_EPOCH_MS (41 bits, good until 2093), a per-process
+# node id (12 bits) and a per-millisecond sequence (10 bits). Ids from one process are strictly
+# increasing; ids from different processes differ in their node id. They keep the ORD-<digits>
+# shape that fetch_orders.handle_orders() and the intent router recognise.
+ORDER_ID_PREFIX = "ORD-"
+ORDER_ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 12
+SEQUENCE_BITS = 10
+# Optional fixed node id per worker/host (0-4095); a random one is drawn per process otherwise
+ORDER_ID_NODE = os.getenv("ORDER_ID_NODE")
+
+_state = {"pid": None, "node": 0, "last_ms": -1, "sequence": 0}
+_lock = threading.Lock()
+
+
+def _reset_state():
+    """
+    Forgets the parent's node id after a fork, so pre-fork workers draw their own.
+    """
+    global _lock
+    _state["pid"] = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_state)
+
+
+def _init_state():
+    # Called with _lock held
+    if ORDER_ID_NODE is not None:
+        node = int(ORDER_ID_NODE) & ((1 << NODE_BITS) - 1)
+    else:
+        node = random.SystemRandom().getrandbits(NODE_BITS)
+    _state.update(pid=os.getpid(), node=node, last_ms=-1, sequence=0)
+
+
+def generate_order_id() -> str:
+    """
+    Returns a new, unique order id such as 'ORD-1234567890123456789'.
+    If the clock goes backwards or a millisecond's 1024 sequence numbers run out, the id
+    borrows the next millisecond instead of waiting, so ids never repeat or decrease.
+    """
+    with _lock:
+        if _state["pid"] != os.getpid():
+            _init_state()
+        now_ms = max(int(time.time() * 1000), _state["last_ms"])
+        if now_ms == _state["last_ms"]:
+            _state["sequence"] = (_state["sequence"] + 1) & ((1 << SEQUENCE_BITS) - 1)
+            if _state["sequence"] == 0:
+                now_ms += 1
+        else:
+            _state["sequence"] = 0
+        _state["last_ms"] = now_ms
+        value = (
+            ((now_ms - ORDER_ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS))
+            | (_state["node"] << SEQUENCE_BITS)
+            | _state["sequence"]
+        )
+    return f"{ORDER_ID_PREFIX}{value}"
@@ -1,41 +1,167 @@
-from flask import Blueprint, jsonify
+import json
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from Db import get_db
+from Db import get_collection
+from Auth import AuthError, authenticate
 
 # Define Blueprint
 orders_blueprint = Blueprint('orders', __name__)
-CORS(orders_blueprint, origins=["http://localhost:3000"], supports_credentials=True)
+CORS(orders_blueprint, origins=["http://localhost:3000"], supports_credentials=True, expose_headers=["X-Next-Cursor"])
+
+# MongoDB connection (shared pool, connects lazily on first query)
+orders_collection = get_collection('Orders')
+
+# Page size limits for GET /api/orders
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 200
+
+
+def _order_filter(user_id=None, after=None):
+    match = {}
+    if user_id:
+        match["user_ID"] = user_id
+    if after:
+        match["order_id"] = {"$gt": after}
+    return match
+
+
+def next_order_ids(user_id=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns the next `limit` distinct order ids (ascending) after the cursor. Only the order_id
+    index (user_ID_order_id for a user's listing) is walked, and only as far as the page reaches,
+    so a page costs the same however many orders follow it.
+    :param user_id: Optional user id to restrict the listing to (matches user_ID).
+    :param after: Optional cursor (the order_id of the last order of the previous page).
+    :param limit: Maximum number of order ids to return.
+    """
+    order_ids = []
+    cursor = orders_collection.find(_order_filter(user_id, after), {"_id": 0, "order_id": 1}).sort("order_id", 1)
+    try:
+        for line in cursor:
+            order_id = line.get("order_id")
+            if order_ids and order_id == order_ids[-1]:
+                continue
+            if len(order_ids) == limit:
+                break
+            order_ids.append(order_id)
+    finally:
+        cursor.close()
+    return order_ids
+
+
+def build_orders_pipeline(order_ids, user_id=None):
+    """
+    Builds the aggregation that groups Orders line items (one document per cart item)
+    into one entry per order_id, computing item counts and quantities in the database.
+    Only the line items of the given orders (one page, see next_order_ids()) are grouped.
+    :param order_ids: The order ids of the page.
+    :param user_id: Optional user id to restrict the listing to (matches user_ID).
+    :return: A list of aggregation stages.
+    """
+    match = _order_filter(user_id)
+    match["order_id"] = {"$in": order_ids}
+    return [
+        {"$match": match},
+        {"$sort": {"order_id": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$order_id",
+            "customer_name": {"$first": "$Name"},
+            "delivery_address": {"$first": "$delivery_address"},
+            "cart_items": {"$push": {"product_name": "$fooditem_name", "quantity": "$quantity"}},
+            "item_count": {"$sum": 1},
+            "total_quantity": {"$sum": "$quantity"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def fetch_orders(order_ids, user_id=None) -> list:
+    """
+    Returns the grouped orders for a page of order ids.
+    """
+    if not order_ids:
+        return []
+    return list(orders_collection.aggregate(build_orders_pipeline(order_ids, user_id)))
+
+
+def format_order(order):
+    """
+    Formats a grouped order (output of build_orders_pipeline) for the API response.
+    """
+    return {
+        "order_id": order.get("_id"),
+        "customer_name": order.get("customer_name"),
+        "delivery_address": order.get("delivery_address"),
+        "cart_items": order.get("cart_items", []),
+        "item_count": order.get("item_count", 0),
+        "total_quantity": order.get("total_quantity", 0)
+    }
+
+
+def parse_limit(value, default):
+    """
+    Parses the 'limit' query parameter and clamps it to MAX_PAGE_SIZE.
+    :raises ValueError: If the value is not a positive integer.
+    """
+    if value is None or value == "":
+        return default
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def stream_orders(user_id=None, after=None, limit=None):
+    """
+    Yields orders as NDJSON lines, fetching and grouping STREAM_BATCH_SIZE orders at a time,
+    so the first lines are sent before later orders are read.
+    :param limit: Optional maximum number of orders to send (all of them by default).
+    """
+    sent = 0
+    while limit is None or sent < limit:
+        batch = STREAM_BATCH_SIZE if limit is None else min(STREAM_BATCH_SIZE, limit - sent)
+        order_ids = next_order_ids(user_id, after, batch)
+        for order in fetch_orders(order_ids, user_id):
+            yield json.dumps(format_order(order)) + "\n"
+        sent += len(order_ids)
+        # A short page is the last one (as is a page ending with orders that have no order_id)
+        if len(order_ids) < batch or order_ids[-1] is None:
+            return
+        after = order_ids[-1]
 
-# MongoDB connection
-db = get_db()  # Get the database connection
-orders_collection = db['Orders'] if db is not None else None  # Ensure the collection exists
 
 @orders_blueprint.route('/orders', methods=['GET'])
 def get_orders():
-    if db is None or orders_collection is None:  # Explicit None check
-        return jsonify({"status": "error", "message": "Database connection error"}), 500
+    try:
+        # A session token limits the listing to its own user (verified without a database lookup)
+        user_id = authenticate(request.headers.get("Authorization"), request.args.get("user_id", "").strip())
+    except AuthError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
+    after = request.args.get("after", "").strip()
+    stream = request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson"
+
+    try:
+        # Streaming responses are not buffered, so they are only limited when asked to
+        limit = parse_limit(request.args.get("limit"), None if stream else DEFAULT_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid pagination parameters: {e}"}), 400
 
     try:
-        # Fetch all orders from the Orders collection
-        orders = list(orders_collection.find())
-        formatted_orders = []
-
-        # Format the data for the response
-        for order in orders:
-            formatted_orders.append({
-                "order_id": order.get("order_id"),
-                "customer_name": order.get("Name"),
-                "delivery_address": order.get("delivery_address"),
-                "cart_items": [
-                    {
-                        "product_name": order.get("fooditem_name"),
-                        "quantity": order.get("quantity")
-                    }
-                ]
-            })
-
-        return jsonify(formatted_orders), 200
+        if stream:
+            return Response(stream_with_context(stream_orders(user_id, after, limit)), mimetype="application/x-ndjson")
+
+        # Look up one extra order id to know whether another page exists
+        order_ids = next_order_ids(user_id, after, limit + 1)
+        has_more = len(order_ids) > limit
+        orders = fetch_orders(order_ids[:limit], user_id)
+
+        response = jsonify([format_order(order) for order in orders])
+        if has_more:
+            response.headers["X-Next-Cursor"] = order_ids[limit - 1]
+        return response, 200
 
     except Exception as e:
         print(f"Error fetching orders: {e}")
-        return jsonify({"status": "error", "message": "An error occurred while fetching orders"}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": "An error occurred while fetching orders"}), 500
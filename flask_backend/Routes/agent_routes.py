@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from decision_agent import decide_agent
+from Agents.decision_agent import decide_agent
 
 agent_routes = Blueprint('agent_routes', __name__)
 
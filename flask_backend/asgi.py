@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from main import FRAUD_DETAILS_MESSAGE, SSE_HEADERS, app, format_agent_response, sse_event
+from Db import close_async_clients, close_clients
+from Auth import ensure_token_secret, optional_user, shutdown_pool
+from Admission import Overloaded, RateLimited, admit_async, check_rate_limit
+from Metrics import observe_request
+from Agents import conversation_memory, registry
+from Agents.fraud_claims import get_fraud_claim_async
+from Agents.decision_agent import decide_agent_async, stream_agent_async
+from Agents.intent_router import is_fraud_query
+
+# Origins allowed to call the natively served endpoint (same as the Flask-CORS setup in main.py)
+CORS_ORIGINS = {"http://localhost:3000"}
+# Largest JSON body accepted by /api/query
+MAX_QUERY_BODY_BYTES = int(os.getenv("MAX_QUERY_BODY_BYTES", str(1024 * 1024)))
+# Fraud claim status polls, served natively so their long-poll holds no thread
+FRAUD_CLAIMS_PREFIX = "/api/fraud-claims/"
+# Threads per worker for the routes served by Flask
+FLASK_THREADS = int(os.getenv("FLASK_THREADS", "16"))
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi that runs each request on a thread pool. asgiref's default runs every request
+    on the one thread-sensitive thread, so a slow login or upload would hold up all the others.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="flask")
+
+    async def __call__(self, scope, receive, send):
+        instance = WsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)
+        # Replaces the thread-sensitive run_wsgi_app for this request only
+        run_wsgi_app = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func.__get__(instance)
+        instance.run_wsgi_app = sync_to_async(run_wsgi_app, thread_sensitive=False, executor=self.executor)
+        await instance(scope, receive, send)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Every other route (login, checkout, orders, uploads) runs through Flask on FLASK_THREADS threads
+wsgi_app = PooledWsgiToAsgi(app, FLASK_THREADS)
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _cors_headers(scope):
+    origin = _header(scope, b"origin")
+    if origin not in CORS_ORIGINS:
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+async def _send_json(scope, send, body, status, extra_headers=()):
+    payload = json.dumps(body).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(payload)).encode("ascii")),
+        *extra_headers,
+    ]
+    await send({"type": "http.response.start", "status": status, "headers": headers + _cors_headers(scope)})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _record_turn(session_id, query, agent_response):
+    # Runs after the response is sent, so errors are only logged
+    try:
+        text = conversation_memory.response_text(agent_response)
+        await asyncio.to_thread(conversation_memory.record_turn, session_id, query, text)
+    except Exception as e:
+        print(f"Error recording chat turn: {e}")
+
+
+# Turns being recorded in the background (referenced so the tasks are not garbage collected)
+_background_tasks = set()
+
+
+def _record_turn_in_background(session_id, query, agent_response):
+    task = asyncio.ensure_future(_record_turn(session_id, query, agent_response))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _send_event_stream(scope, send, query, additional_input, session_id, history, user_id):
+    # Same events as the Flask SSE mode (see main.sse_agent_events), flushed as they arrive; the
+    # turn is recorded after the stream is closed, so neither the client nor the bulkhead slot
+    # waits for the session write
+    completed = []
+    headers = [(b"content-type", b"text/event-stream")]
+    headers += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in SSE_HEADERS.items()]
+    await send({"type": "http.response.start", "status": 200, "headers": headers + _cors_headers(scope)})
+    try:
+        async for event, data in stream_agent_async(query, additional_input, history, user_id):
+            if event == "done":
+                body, status = format_agent_response(data)
+                chunk = sse_event("done", dict(body, status=status, session_id=session_id))
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+                completed.append(data)
+                continue
+            chunk = sse_event(event, {"text": data})
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    except Exception as e:
+        print(f"Error in /api/query stream: {e}")
+        chunk = sse_event("done", {"response": "Internal server error", "status": 500})
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+    if completed:
+        _record_turn_in_background(session_id, query, completed[0])
+
+
+async def _send_overloaded(scope, send, error):
+    # Same responses as main.overloaded_response()
+    status = 429 if isinstance(error, RateLimited) else 503
+    retry_after = [(b"retry-after", str(error.retry_after).encode("ascii"))]
+    return await _send_json(scope, send, {"response": str(error)}, status, retry_after)
+
+
+async def _read_body(receive):
+    # Returns the request body, or None once it grows past MAX_QUERY_BODY_BYTES
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_QUERY_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def query_endpoint(scope, receive, send):
+    """
+    Async /api/query for JSON chatbot queries: the agents await OpenAI and MongoDB,
+    so the worker keeps serving other requests while one waits on the network.
+    """
+    try:
+        check_rate_limit((scope.get("client") or ("",))[0])
+    except Overloaded as e:
+        return await _send_overloaded(scope, send, e)
+
+    try:
+        body = await _read_body(receive)
+        if body is None:
+            return await _send_json(scope, send, {"error": "Request body too large"}, 413)
+
+        data = json.loads(body or b"{}")
+        query = data.get("query", "").strip()
+
+        if not query:
+            return await _send_json(scope, send, {"response": "Query cannot be empty"}, 400)
+
+        if is_fraud_query(query):
+            return await _send_json(scope, send, {"response": FRAUD_DETAILS_MESSAGE}, 200)
+
+        try:
+            slot = await admit_async(query)
+        except Overloaded as e:
+            return await _send_overloaded(scope, send, e)
+
+        try:
+            session_id = conversation_memory.valid_session_id(data.get("session_id")) or conversation_memory.new_session_id()
+            history = await asyncio.to_thread(conversation_memory.get_context, session_id)
+
+            additional_input = data.get("additional_input")
+            user_id = optional_user(_header(scope, b"authorization"))
+
+            if data.get("stream") or "text/event-stream" in _header(scope, b"accept"):
+                return await _send_event_stream(scope, send, query, additional_input, session_id, history, user_id)
+
+            agent_response = await decide_agent_async(query, additional_input, history, user_id)
+        finally:
+            slot.release()
+        response_body, status = format_agent_response(agent_response)
+        await _send_json(scope, send, dict(response_body, session_id=session_id), status)
+        return await _record_turn(session_id, query, agent_response)
+
+    except Exception as e:
+        print(f"Error in /api/query: {e}")
+        return await _send_json(scope, send, {"response": "Internal server error"}, 500)
+
+
+async def fraud_claim_endpoint(scope, receive, send):
+    """
+    Async /api/fraud-claims/<job_id>: the ?wait= long-poll awaits the job instead of holding
+    one of the Flask threads.
+    """
+    try:
+        job_id = scope["path"][len(FRAUD_CLAIMS_PREFIX):]
+        try:
+            wait = float(parse_qs(scope["query_string"].decode("latin-1")).get("wait", ["0"])[0])
+        except ValueError:
+            wait = 0
+        claim = await get_fraud_claim_async(job_id, wait)
+        if claim is None:
+            return await _send_json(scope, send, {"error": "Unknown fraud claim"}, 404)
+        return await _send_json(scope, send, claim, 200)
+
+    except Exception as e:
+        print(f"Error in /api/fraud-claims: {e}")
+        return await _send_json(scope, send, {"error": "Internal server error"}, 500)
+
+
+async def _timed(endpoint, route, scope, receive, send):
+    # Flask's request hooks do not see the native endpoints, so they record their own metrics
+    # (like Flask, up to the response headers)
+    start = time.perf_counter()
+
+    async def timed_send(message):
+        if message["type"] == "http.response.start":
+            observe_request(route, scope["method"], message["status"], time.perf_counter() - start)
+        await send(message)
+
+    return await endpoint(scope, receive, timed_send)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if registry.PRELOAD:
+                registry.preload_in_background()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            close_clients()
+            await close_async_clients()
+            shutdown_pool()
+            wsgi_app.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    ASGI entry point: JSON POSTs to /api/query and fraud claim polls are served natively,
+    everything else by Flask.
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(scope, receive, send)
+    if (
+        scope["type"] == "http"
+        and scope["method"] == "POST"
+        and scope["path"] == "/api/query"
+        and _header(scope, b"content-type") == "application/json"
+    ):
+        return await _timed(query_endpoint, "/api/query", scope, receive, send)
+    if (
+        scope["type"] == "http"
+        and scope["method"] == "GET"
+        and scope["path"].startswith(FRAUD_CLAIMS_PREFIX)
+        and scope["path"][len(FRAUD_CLAIMS_PREFIX):].isalnum()
+    ):
+        return await _timed(fraud_claim_endpoint, "/api/fraud-claims/<job_id>", scope, receive, send)
+    return await wsgi_app(scope, receive, send)
+
+
+# Production entry point: python asgi.py (or gunicorn -c gunicorn.conf.py)
+if __name__ == '__main__':
+    import uvicorn
+
+    from Indexes import ensure_database
+
+    ensure_database()
+    try:
+        # Generated before the workers start so they all accept each other's tokens
+        ensure_token_secret()
+        uvicorn.run(
+            "asgi:application",
+            host=os.getenv("HOST", "127.0.0.1"),
+            port=int(os.getenv("PORT", "5000")),
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        )
+    except Exception as e:
+        print(f"Error starting the ASGI app: {e}")
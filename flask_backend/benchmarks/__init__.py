@@ -0,0 +1 @@
+# Offline latency and accuracy benchmarks of the chatbot agents (run with: python -m benchmarks)
@@ -0,0 +1,41 @@
+import argparse
+import json
+import sys
+
+from .harness import compare, print_report, run_benchmark
+
+# Usage (from flask_backend/): python -m benchmarks --concurrency 1 8 32 --output report.json
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline latency, throughput and accuracy benchmark of the agents.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="Concurrent clients to measure")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over the corpus per concurrency level")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated OpenAI latency per call")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="Fraction of fake LLM calls that time out (exercises retries and the breaker)")
+    parser.add_argument("--recordings", help="JSON file of recorded model responses {last user message: response}")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with a report written by an earlier --output")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed p95/throughput slowdown against the baseline (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.concurrency, args.iterations, args.llm_latency_ms / 1000, args.recordings, args.cache,
+                           llm_error_rate=args.llm_error_rate)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
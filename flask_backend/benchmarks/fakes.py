@@ -0,0 +1,202 @@
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+# Offline stand-ins for OpenAI and MongoDB. install() must run before any agent module is
+# imported, because the agents take their collections from Db.py at import time.
+
+KNOWN_CUISINES = ["indian", "italian", "chinese", "mexican", "thai", "japanese", "american"]
+
+_CUISINE_QUERY = re.compile(r'User Query: "(.*)"', re.S)
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+def _text(content):
+    # Message content is either a string or a list of parts (text + image_url)
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+class FakeChatModel:
+    """
+    Stand-in for ChatOpenAI: answers from a recording (last user message -> response) when one
+    matches, otherwise with a canned answer shaped like the real model's, after `latency` seconds.
+    """
+
+    def __init__(self, model_name, latency=0.0, recordings=None, error_rate=0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.recordings = recordings or {}
+        self.error_rate = error_rate
+        self.calls = 0
+
+    def _respond(self, messages):
+        self.calls += 1
+        if self.error_rate and random.random() < self.error_rate:
+            raise TimeoutError("Simulated OpenAI timeout")
+        user_text = _text(messages[-1]["content"]) if messages else ""
+        if user_text in self.recordings:
+            return self.recordings[user_text]
+        system_text = _text(messages[0]["content"]) if messages and messages[0]["role"] == "system" else ""
+
+        if "Refund Order" in system_text:
+            return "Refund Order"
+        match = _CUISINE_QUERY.search(user_text)
+        if match:
+            query = match.group(1).lower()
+            return next((cuisine for cuisine in KNOWN_CUISINES if cuisine in query), "unknown")
+        if "Update the summary" in user_text:
+            return "The user asked about food."
+        return "Here is a helpful answer about food and cuisines."
+
+    def invoke(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeMessage(self._respond(messages))
+
+    async def ainvoke(self, messages):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeMessage(self._respond(messages))
+
+    def stream(self, messages):
+        for word in self.invoke(messages).content.split(" "):
+            yield FakeMessage(word + " ")
+
+    async def astream(self, messages):
+        for word in (await self.ainvoke(messages)).content.split(" "):
+            yield FakeMessage(word + " ")
+
+
+class FakeAgentExecutor:
+    """
+    Stand-in for a LangChain AgentExecutor (tool calling is not simulated).
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def invoke(self, inputs):
+        messages = list(inputs.get("chat_history", [])) + [{"role": "user", "content": inputs["input"]}]
+        return {"input": inputs["input"], "output": self.model.invoke(messages).content}
+
+    async def ainvoke(self, inputs):
+        messages = list(inputs.get("chat_history", [])) + [{"role": "user", "content": inputs["input"]}]
+        return {"input": inputs["input"], "output": (await self.model.ainvoke(messages)).content}
+
+
+FOOD_ITEMS = [
+    {"name": "Spaghetti Carbonara", "cuisine": "Italian", "price": 12.99, "spiceLevel": "Mild"},
+    {"name": "Margherita Pizza", "cuisine": "Italian", "price": 10.5, "spiceLevel": "Mild"},
+    {"name": "Pad Thai", "cuisine": "Thai", "price": 11.0, "spiceLevel": "Medium"},
+    {"name": "Green Curry", "cuisine": "Thai", "price": 12.0, "spiceLevel": "Hot"},
+    {"name": "Chicken Tikka Masala", "cuisine": "Indian", "price": 13.5, "spiceLevel": "Medium"},
+    {"name": "Palak Paneer", "cuisine": "Indian", "price": 11.5, "spiceLevel": "Mild"},
+    {"name": "Kung Pao Chicken", "cuisine": "Chinese", "price": 11.99, "spiceLevel": "Hot"},
+    {"name": "Beef Burrito", "cuisine": "Mexican", "price": 9.99, "spiceLevel": "Medium"},
+    {"name": "Salmon Sushi", "cuisine": "Japanese", "price": 14.0, "spiceLevel": "Mild"},
+    {"name": "Cheeseburger", "cuisine": "American", "price": 8.99, "spiceLevel": "Mild"},
+]
+
+
+# Orders seeded by seed_database(); the corpus refers to them (ORD-999999 is deliberately missing)
+SEEDED_ORDER_IDS = [f"ORD-{100001 + i}" for i in range(5)]
+
+
+def seed_database(db):
+    """
+    Fills the local database with a small food catalog and a few orders (ORD-100001...).
+    """
+    db["Fooditems"].insert_many([
+        dict(item, description=f"Freshly made {item['name'].lower()}.", cuisine_key=item["cuisine"].lower(),
+             imageUrl=f"/images/{item['name'].replace(' ', '_')}.jpg")
+        for item in FOOD_ITEMS
+    ])
+    db["Orders"].insert_many([
+        {
+            "order_id": order_id, "line_no": 0, "user_ID": f"user-{i % 3}",
+            "fooditem_name": FOOD_ITEMS[i % len(FOOD_ITEMS)]["name"], "Name": "Test User",
+            "phone_number": "555-0100", "email": "test@example.com", "quantity": 1 + i % 3,
+            "delivery_address": "1 Test Street", "collecting_order": True, "status": "Processing",
+        }
+        for i, order_id in enumerate(SEEDED_ORDER_IDS)
+    ])
+
+
+def make_claim_image(seed):
+    """
+    Returns the bytes of a small, distinct JPEG (raw random bytes when Pillow is missing).
+    """
+    rng = random.Random(seed)
+    try:
+        from PIL import Image
+    except ImportError:
+        return bytes(rng.getrandbits(8) for _ in range(4096))
+    image = Image.new("RGB", (64, 64))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(64 * 64)])
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def install(llm_latency=0.0, recordings_path=None, llm_cache=False, llm_error_rate=0.0):
+    """
+    Points the backend at an in-memory mongomock database and fake OpenAI models, wrapped in
+    the same resilience layer (deadline, retries, circuit breaker) as the real clients.
+    :param llm_latency: Seconds each fake LLM call takes (simulates the OpenAI round-trip).
+    :param recordings_path: Optional JSON file of {last user message: response}.
+    :param llm_cache: Keep the LLM response cache on (off by default so every call reaches the fake).
+    :param llm_error_rate: Fraction of fake LLM calls that fail with a timeout.
+    :return: The mongomock database.
+    """
+    import mongomock
+
+    # Keep uploads out of the working tree and off the semantic/Mongo cache tiers
+    os.environ.setdefault("UPLOADS_DIR", tempfile.mkdtemp(prefix="benchmark-uploads-"))
+    os.environ["LLM_CACHE_MONGO"] = "0"
+    os.environ["LLM_CACHE_SEMANTIC"] = "0"
+
+    import Db
+    client = mongomock.MongoClient()
+    Db.set_client(client)
+    db = client[Db.DB_NAME]
+    seed_database(db)
+
+    recordings = {}
+    if recordings_path:
+        with open(recordings_path) as f:
+            recordings = json.load(f)
+
+    from Agents import registry, response_cache
+    from Agents import decision_agent, food_recommendation_agent, fraud_detection_agent, query_agent
+    from Agents import conversation_memory
+    from Agents.llm_resilience import ResilientLLM
+    response_cache.CACHE_ENABLED = llm_cache
+
+    models = {}
+    for name, model in [
+        (decision_agent.DYNAMIC_LLM, decision_agent.DYNAMIC_MODEL),
+        (food_recommendation_agent.CUISINE_LLM, food_recommendation_agent.CUISINE_MODEL),
+        (food_recommendation_agent.RECOMMENDATION_LLM, food_recommendation_agent.RECOMMENDATION_MODEL),
+        (fraud_detection_agent.FRAUD_LLM, fraud_detection_agent.FRAUD_MODEL),
+        (query_agent.QUERY_LLM, query_agent.QUERY_MODEL),
+        (conversation_memory.SUMMARY_LLM, conversation_memory.SUMMARY_MODEL),
+    ]:
+        models.setdefault(name, FakeChatModel(model, llm_latency, recordings, llm_error_rate))
+        registry.install(name, ResilientLLM(models[name], model))
+    for name, llm in [
+        (query_agent.AGENT_EXECUTOR, query_agent.QUERY_LLM),
+        (food_recommendation_agent.AGENT_EXECUTOR, food_recommendation_agent.RECOMMENDATION_LLM),
+    ]:
+        registry.install(name, ResilientLLM(FakeAgentExecutor(models[llm]), name))
+    return db
@@ -0,0 +1,262 @@
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import fakes
+
+# Latency, throughput and accuracy benchmark of the chatbot agents. Every corpus query goes
+# through decide_agent(), the same entry point /api/query uses, with OpenAI and MongoDB replaced
+# by the offline fakes in fakes.py, so results are reproducible and need no credentials.
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.jsonl")
+PERCENTILES = (50, 95, 99)
+# Latency increases smaller than this are treated as noise when comparing with a baseline
+MIN_REGRESSION_MS = 1.0
+
+# Order details sent with "place an order" queries (as the chatbot's order form does)
+ORDER_FORM = {
+    "userDetails": {"name": "Test User", "email": "test@example.com", "address": "1 Test Street", "phone": "555-0100"},
+    "foodItem": {"name": "Pad Thai"},
+    "quantity": 2,
+}
+# Orders are placed for the session token's user; the benchmark acts as one logged-in user
+BENCHMARK_USER_ID = "benchmark-user"
+
+
+def load_corpus(path=CORPUS_PATH) -> list:
+    """
+    Loads the labelled queries: one JSON object per line with "query", the expected "intent" and
+    optionally the "cuisine" or "order_id" a correct answer must contain.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def routing_accuracy(corpus) -> dict:
+    """
+    Scores route_intent() against the corpus labels.
+    :return: Overall accuracy, accuracy per expected intent and the misrouted queries.
+    """
+    from Agents.intent_router import route_intent
+
+    per_intent = {}
+    misrouted = []
+    for entry in corpus:
+        routed = route_intent(entry["query"].lower().strip())
+        stats = per_intent.setdefault(entry["intent"], {"queries": 0, "correct": 0})
+        stats["queries"] += 1
+        if routed == entry["intent"]:
+            stats["correct"] += 1
+        else:
+            misrouted.append({"query": entry["query"], "expected": entry["intent"], "routed": routed})
+    for stats in per_intent.values():
+        stats["accuracy"] = stats["correct"] / stats["queries"]
+    return {
+        "accuracy": 1 - len(misrouted) / len(corpus) if corpus else 0.0,
+        "per_intent": per_intent,
+        "misrouted": misrouted,
+    }
+
+
+def build_request(entry, seed):
+    """
+    Returns the (query, additional_input) the frontend would send for a corpus entry.
+    Fraud claims get a distinct synthetic photo each time so the duplicate-image check
+    does not short-circuit the vision model call.
+    """
+    from werkzeug.datastructures import FileStorage
+
+    if entry["intent"] == "fraud":
+        image = FileStorage(io.BytesIO(fakes.make_claim_image(seed)), filename=f"claim-{seed}.jpg",
+                            content_type="image/jpeg")
+        return entry["query"], {"image": image, "description": entry["query"],
+                                "order_id": entry.get("order_id", "ORD-100001")}
+    if entry["intent"] == "order_creation":
+        return entry["query"], ORDER_FORM
+    return entry["query"], None
+
+
+def check_answer(entry, response):
+    """
+    Returns whether the response contains what the entry expects (None if the entry sets no expectation).
+    """
+    text = json.dumps(response, default=str).lower()
+    if entry.get("cuisine"):
+        names = [item["name"].lower() for item in fakes.FOOD_ITEMS if item["cuisine"].lower() == entry["cuisine"]]
+        return any(name in text for name in names)
+    if entry.get("order_id"):
+        if entry["order_id"] in fakes.SEEDED_ORDER_IDS:
+            return entry["order_id"].lower() in text
+        return "no order found" in text
+    return None
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies) -> dict:
+    values = sorted(latencies)
+    summary = {"count": len(values), "mean_ms": sum(values) / len(values) * 1000 if values else 0.0}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = percentile(values, p) * 1000
+    return summary
+
+
+def run_load(corpus, concurrency, iterations):
+    """
+    Sends every corpus query `iterations` times from `concurrency` client threads.
+    :return: Latency percentiles per agent (the intent the query was routed to), throughput,
+             error counts and answer accuracy.
+    """
+    from Agents.decision_agent import decide_agent
+    from Agents.intent_router import route_intent
+
+    seeds = itertools.count()
+    lock = threading.Lock()
+    latencies = {}
+    errors = {}
+    answers = {}
+
+    def one_request(entry):
+        query, additional_input = build_request(entry, next(seeds))
+        agent = route_intent(query.lower().strip())
+        start = time.perf_counter()
+        try:
+            response = decide_agent(query, additional_input, user_id=BENCHMARK_USER_ID)
+            failed = isinstance(response, dict) and "error" in response
+        except Exception as e:
+            print(f"Error benchmarking {query!r}: {e}")
+            response, failed = None, True
+        elapsed = time.perf_counter() - start
+        correct = check_answer(entry, response)
+        with lock:
+            latencies.setdefault(agent, []).append(elapsed)
+            errors[agent] = errors.get(agent, 0) + failed
+            if correct is not None:
+                checked = answers.setdefault(agent, {"checked": 0, "correct": 0})
+                checked["checked"] += 1
+                checked["correct"] += correct
+
+    requests = [entry for _ in range(iterations) for entry in corpus]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, requests))
+    wall = time.perf_counter() - start
+
+    agents = {}
+    for agent, values in sorted(latencies.items()):
+        agents[agent] = dict(summarize(values), errors=errors[agent])
+        if agent in answers:
+            agents[agent]["answer_accuracy"] = answers[agent]["correct"] / answers[agent]["checked"]
+    return {
+        "concurrency": concurrency,
+        "requests": len(requests),
+        "wall_seconds": wall,
+        "throughput_rps": len(requests) / wall if wall else 0.0,
+        "overall": summarize([value for values in latencies.values() for value in values]),
+        "agents": agents,
+    }
+
+
+def run_benchmark(concurrency=(1, 8), iterations=3, llm_latency=0.0, recordings_path=None,
+                  llm_cache=False, corpus_path=CORPUS_PATH, llm_error_rate=0.0) -> dict:
+    """
+    Runs the routing accuracy check and the load test at each concurrency level.
+    :param concurrency: Numbers of concurrent clients to measure.
+    :param iterations: Passes over the corpus per concurrency level.
+    :param llm_latency: Simulated OpenAI latency per call, in seconds.
+    :param recordings_path: Optional JSON file of recorded model responses (see fakes.install).
+    :param llm_cache: Keep the LLM response cache enabled.
+    :param llm_error_rate: Fraction of fake LLM calls that time out (exercises retries and the breaker).
+    :return: The report (see README "Benchmarks").
+    """
+    from Agents.llm_resilience import get_llm_stats
+    from Agents.single_flight import get_single_flight_stats
+
+    fakes.install(llm_latency, recordings_path, llm_cache, llm_error_rate)
+    corpus = load_corpus(corpus_path)
+    # Warm up lazily built state (food catalog, compiled prompts) outside the measurements
+    run_load(corpus, 1, 1)
+    load = [run_load(corpus, level, iterations) for level in concurrency]
+    return {
+        "config": {"concurrency": list(concurrency), "iterations": iterations, "llm_latency_ms": llm_latency * 1000,
+                   "llm_cache": llm_cache, "llm_error_rate": llm_error_rate,
+                   "corpus": os.path.basename(corpus_path), "queries": len(corpus)},
+        "routing": routing_accuracy(corpus),
+        "load": load,
+        "llm": get_llm_stats(),
+        "single_flight": get_single_flight_stats(),
+    }
+
+
+def compare(report, baseline, max_regression=0.2) -> list:
+    """
+    Compares a report with a baseline report.
+    :param max_regression: Allowed relative slowdown of p95 latency / throughput (0.2 = 20%).
+    :return: Descriptions of the regressions found (empty if none).
+    """
+    regressions = []
+    if report["routing"]["accuracy"] < baseline["routing"]["accuracy"]:
+        regressions.append(
+            f"routing accuracy {report['routing']['accuracy']:.1%} < baseline {baseline['routing']['accuracy']:.1%}"
+        )
+
+    baseline_load = {run["concurrency"]: run for run in baseline["load"]}
+    for run in report["load"]:
+        base = baseline_load.get(run["concurrency"])
+        if base is None:
+            continue
+        label = f"c={run['concurrency']}"
+        if run["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{label} throughput {run['throughput_rps']:.1f} rps < baseline {base['throughput_rps']:.1f} rps"
+            )
+        for agent, stats in run["agents"].items():
+            base_stats = base["agents"].get(agent)
+            if base_stats is None:
+                continue
+            p95, base_p95 = stats["p95_ms"], base_stats["p95_ms"]
+            if p95 > base_p95 * (1 + max_regression) and p95 - base_p95 > MIN_REGRESSION_MS:
+                regressions.append(f"{label} {agent} p95 {p95:.1f} ms > baseline {base_p95:.1f} ms")
+            if stats.get("answer_accuracy", 1.0) < base_stats.get("answer_accuracy", 0.0):
+                regressions.append(
+                    f"{label} {agent} answer accuracy {stats['answer_accuracy']:.1%} "
+                    f"< baseline {base_stats['answer_accuracy']:.1%}"
+                )
+    return regressions
+
+
+def print_report(report):
+    routing = report["routing"]
+    print(f"Routing accuracy: {routing['accuracy']:.1%} over {report['config']['queries']} queries")
+    for intent, stats in sorted(routing["per_intent"].items()):
+        print(f"  {intent:15} {stats['correct']:3}/{stats['queries']:<3} {stats['accuracy']:7.1%}")
+    for miss in routing["misrouted"]:
+        print(f"  misrouted: {miss['query']!r} -> {miss['routed']} (expected {miss['expected']})")
+
+    for run in report["load"]:
+        print(f"\nConcurrency {run['concurrency']}: {run['requests']} requests in {run['wall_seconds']:.2f} s, "
+              f"{run['throughput_rps']:.1f} req/s")
+        print(f"  {'agent':15} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} "
+              f"{'errors':>6} {'answers':>8}")
+        rows = list(run["agents"].items()) + [("all", dict(run["overall"], errors=""))]
+        for agent, stats in rows:
+            answers = f"{stats['answer_accuracy']:.0%}" if "answer_accuracy" in stats else ""
+            print(f"  {agent:15} {stats['count']:6} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+                  f"{stats['p99_ms']:9.2f} {stats['mean_ms']:9.2f} {stats['errors']:>6} {answers:>8}")
+
+    print("\nLLM clients:")
+    for name, stats in report.get("llm", {}).items():
+        print(f"  {name:42} calls {stats['calls']:5}  retries {stats['retries']:4}  timeouts {stats['timeouts']:4}  "
+              f"short-circuited {stats['short_circuited']:4}  breaker {stats['breaker']}")
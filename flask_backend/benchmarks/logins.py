@@ -0,0 +1,75 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Auth
+
+# Login throughput benchmark: how many password checks per second a server worker sustains with
+# N hashing processes, and how slow a cheap request on the same worker gets meanwhile.
+# Usage (from flask_backend/): python -m benchmarks.logins --workers 0 1 2 4 --logins 200
+
+PASSWORD = "correct horse battery staple"
+
+
+def _probe(stop, latencies):
+    # Stands in for the worker's other requests: short bursts of Python work that need the GIL
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(range(20000))
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.005)
+
+
+def measure(workers, logins, clients):
+    """
+    Checks `logins` passwords from `clients` threads with `workers` hashing processes
+    (0 = in the request threads, as before the pool).
+    :return: Logins per second, per core, and the p95 latency of a concurrent cheap request.
+    """
+    Auth.shutdown_pool()
+    Auth.HASH_WORKERS = workers
+    user = {"password_hash": Auth._hash(PASSWORD)}
+    # Start the hashing processes outside the measurement
+    Auth.check_user_password(user, PASSWORD)
+
+    stop = threading.Event()
+    probe_latencies = []
+    probe = threading.Thread(target=_probe, args=(stop, probe_latencies), daemon=True)
+    probe.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: Auth.check_user_password(user, PASSWORD)[0], range(logins)))
+    wall = time.perf_counter() - start
+    stop.set()
+    probe.join()
+
+    probe_latencies.sort()
+    cores = max(workers, 1)
+    return {
+        "hash_workers": workers,
+        "logins": logins,
+        "failed": results.count(False),
+        "logins_per_second": logins / wall,
+        "logins_per_second_per_core": logins / wall / cores,
+        "other_request_p95_ms": probe_latencies[int(len(probe_latencies) * 0.95)] * 1000 if probe_latencies else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Password check throughput per hashing process.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, os.cpu_count() or 1],
+                        help="Hashing process counts to measure (0 = in the request threads)")
+    parser.add_argument("--logins", type=int, default=100, help="Password checks per measurement")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent login requests")
+    args = parser.parse_args()
+
+    print(f"scrypt N={Auth.SCRYPT_N} r={Auth.SCRYPT_R} p={Auth.SCRYPT_P}, {args.clients} concurrent clients")
+    print(f"{'workers':>7} {'logins/s':>9} {'per core':>9} {'other req p95 ms':>17}")
+    for workers in args.workers:
+        result = measure(workers, args.logins, args.clients)
+        print(f"{workers:7} {result['logins_per_second']:9.1f} {result['logins_per_second_per_core']:9.1f} "
+              f"{result['other_request_p95_ms']:17.2f}")
+    Auth.shutdown_pool()
@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py
+# Serves asgi:application (async /api/query) on uvicorn workers; set GUNICORN_APP=main:app
+# and GUNICORN_WORKER_CLASS=gthread to run the plain Flask app on threads instead.
+wsgi_app = os.getenv("GUNICORN_APP", "asgi:application")
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+# Threads per gthread worker (also used by "-k gthread" on the command line); Admission.py caps
+# the /api/query bulkheads to a share of them
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+# Silent workers are restarted after this many seconds (fraud claim long-polls hold a gthread
+# thread for at most 2 seconds; the ASGI app awaits them without one)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Migrate, create the indexes and the session token secret once in the master, before the workers fork
+    from Auth import ensure_token_secret
+    from Indexes import ensure_database
+    ensure_token_secret()
+    ensure_database()
+
+
+def post_worker_init(worker):
+    # Size the /api/query bulkheads for the threads this worker really has; these are the final
+    # settings, after command-line options such as -k gthread --threads N
+    from gunicorn.workers.gthread import ThreadWorker
+    from Admission import configure_worker_threads
+    configure_worker_threads(worker.cfg.threads if isinstance(worker, ThreadWorker) else 0)
+
+    # Agents are built on first use; AGENTS_PRELOAD=1 warms them up in the background instead
+    from Agents import registry
+    if registry.PRELOAD:
+        registry.preload_in_background()
@@ -1,10 +1,22 @@
-from flask import Flask, request, jsonify
+import json
+import time
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from Login import auth_blueprint
 from Checkout import checkout_blueprint
 from Orders import orders_blueprint
-from Agents.decision_agent import decide_agent
-from Agents.fraud_detection_agent import handle_fraud_detection
+from Indexes import ensure_database
+from Db import ping
+from Auth import ensure_token_secret, optional_user
+from Admission import Overloaded, RateLimited, admit, check_rate_limit, get_admission_stats
+from Metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, observe_request, render_metrics
+from Agents import conversation_memory, registry
+from Agents.llm_resilience import get_llm_stats
+from Agents.single_flight import get_single_flight_stats
+from Agents.decision_agent import decide_agent, stream_agent
+from Agents.fraud_claims import get_fraud_claim, submit_fraud_claim
+from Agents.intent_router import is_fraud_query
 
 
 # Initialize Flask app
@@ -16,8 +28,106 @@ app.register_blueprint(auth_blueprint, url_prefix='/api')
 app.register_blueprint(checkout_blueprint, url_prefix='/api')
 app.register_blueprint(orders_blueprint, url_prefix='/api')
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+def _observe_request(status):
+    # Labelled by route pattern so ids in paths do not create new series; streamed responses
+    # are timed until their headers are ready
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    if rule != "/metrics" and "request_start" in g:
+        observe_request(rule, request.method, status, time.perf_counter() - g.pop("request_start"))
+
+@app.after_request
+def record_request_metrics(response):
+    _observe_request(response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(error):
+    # Unhandled exceptions skip after_request when they propagate (debug mode); count them as 500s
+    if error is not None:
+        _observe_request(500)
+
+# Asked for when a fraud claim arrives without its description, order ID or image
+FRAUD_DETAILS_MESSAGE = "Please provide additional details (description, order ID, and attach an image) to proceed with your request."
+
+def format_agent_response(agent_response):
+    """
+    Converts a decide_agent() result into a (body, status) pair for /api/query.
+    """
+    if isinstance(agent_response, dict) and "response" in agent_response:
+        return agent_response, 200
+    elif isinstance(agent_response, dict):
+        return {"response": "Unexpected response format"}, 500
+    else:
+        return {"response": agent_response}, 200
+
+def sse_event(event, data):
+    """
+    Encodes one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_agent_events(events, session_id=None, completed=None):
+    """
+    Converts stream_agent() events to SSE: 'token' events carry {"text": ...} and the final
+    'done' event carries the same body as the non-streaming /api/query response.
+    :param completed: Optional list that receives the final agent response, so the caller can
+                      record the turn once the stream is closed (see record_streamed_turn()).
+    """
+    try:
+        for event, data in events:
+            if event == "done":
+                body, status = format_agent_response(data)
+                yield sse_event("done", dict(body, status=status, session_id=session_id))
+                if completed is not None:
+                    completed.append(data)
+            else:
+                yield sse_event(event, {"text": data})
+    except Exception as e:
+        # Headers are already sent, so the error is reported in the final event
+        print(f"Error in /api/query stream: {e}")
+        yield sse_event("done", {"response": "Internal server error", "status": 500})
+
+def record_streamed_turn(session_id, query, completed):
+    # Runs when the event stream is closed, so the client never waits for the session write
+    # (or the occasional summarization call)
+    if completed:
+        conversation_memory.record_turn(session_id, query, conversation_memory.response_text(completed[0]))
+
+# Headers that keep proxies from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def fraud_claim_response(submission):
+    """
+    Converts the result of submit_fraud_claim() into a Flask response.
+    """
+    if "job_id" in submission:
+        submission["status_url"] = f"/api/fraud-claims/{submission['job_id']}"
+        return jsonify(submission), 202
+    if submission.get("busy"):
+        response = jsonify({"error": submission["error"]})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    return jsonify(submission), 400
+
+def overloaded_response(error):
+    """
+    Converts an Admission rejection into a 429 (client over its rate) or 503 (agent at capacity).
+    """
+    response = jsonify({"response": str(error)})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429 if isinstance(error, RateLimited) else 503
+
 @app.route('/api/query', methods=['POST'])
 def query_route():
+    try:
+        check_rate_limit(request.remote_addr)
+    except Overloaded as e:
+        return overloaded_response(e)
+
     try:
         if request.content_type.startswith('multipart/form-data'):
             # Handle form-data requests (e.g., fraud detection with image uploads)
@@ -30,18 +140,12 @@ def query_route():
                 return jsonify({"error": "Query cannot be empty"}), 400
 
             # Check for fraud-related keywords
-            fraud_keywords = ["fraud", "issue", "problem", "damage", "broken"]
-            if any(keyword in query.lower() for keyword in fraud_keywords):
+            if is_fraud_query(query):
                 if not description or not order_id or not image_file:
-                    return jsonify({
-                        "response": "Please provide additional details (description, order ID, and attach an image) to proceed with your request."
-                    }), 200
+                    return jsonify({"response": FRAUD_DETAILS_MESSAGE}), 200
 
-                # Handle fraud detection
-                fraud_response = handle_fraud_detection(description, image_file, order_id)
-                if "error" in fraud_response:
-                    return jsonify(fraud_response), 400
-                return jsonify(fraud_response), 200
+                # Queue fraud detection; the client polls /api/fraud-claims/<job_id> for the decision
+                return fraud_claim_response(submit_fraud_claim(description, image_file, order_id))
 
             # If no fraud keyword, return invalid request for multipart form-data
             return jsonify({"error": "Invalid form-data query."}), 400
@@ -50,27 +154,53 @@ def query_route():
             # Handle JSON requests (e.g., order status or general queries)
             data = request.get_json()
             query = data.get("query", "").strip()
-            chat_history = data.get("chat_history", [])
 
             if not query:
                 return jsonify({"response": "Query cannot be empty"}), 400
 
             # Directly handle fraud-related keywords in JSON requests
-            fraud_keywords = ["fraud", "issue", "problem", "damage", "broken"]
-            if any(keyword in query.lower() for keyword in fraud_keywords):
-                return jsonify({
-                    "response": "Please provide additional details (description, order ID, and attach an image) to proceed with your request."
-                }), 200
-
-            # Use decision agent for query handling (includes order status logic)
-            agent_response = decide_agent(query, chat_history)
-
-            if isinstance(agent_response, dict) and "response" in agent_response:
-                return jsonify(agent_response), 200
-            elif isinstance(agent_response, dict):
-                return jsonify({"response": "Unexpected response format"}), 500
-            else:
-                return jsonify({"response": agent_response}), 200
+            if is_fraud_query(query):
+                return jsonify({"response": FRAUD_DETAILS_MESSAGE}), 200
+
+            # Reserve capacity in the agent's bulkhead before doing any work for the query
+            try:
+                slot = admit(query)
+            except Overloaded as e:
+                return overloaded_response(e)
+
+            try:
+                # The conversation is kept server-side; clients send only the new turn and the session id
+                session_id = conversation_memory.valid_session_id(data.get("session_id")) or conversation_memory.new_session_id()
+                history = conversation_memory.get_context(session_id)
+
+                # Optional structured input, e.g. the order form for "place an order"; orders are
+                # placed for the session token's user, never for a user named in the form
+                additional_input = data.get("additional_input")
+                user_id = optional_user(request.headers.get("Authorization"))
+
+                # Streaming mode: {"stream": true} or Accept: text/event-stream
+                if data.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+                    completed = []
+                    events = sse_agent_events(stream_agent(query, additional_input, history, user_id), session_id, completed)
+                    response = Response(stream_with_context(events), mimetype="text/event-stream", headers=SSE_HEADERS)
+                    # The slot is held until the whole stream has been sent, and freed before the turn is saved
+                    response.call_on_close(slot.release)
+                    response.call_on_close(lambda: record_streamed_turn(session_id, query, completed))
+                    return response
+
+                # Use decision agent for query handling (includes order status logic)
+                agent_response = decide_agent(query, additional_input, history, user_id)
+                slot.release()
+            except Exception:
+                slot.release()
+                raise
+            body, status = format_agent_response(agent_response)
+            response = jsonify(dict(body, session_id=session_id))
+            # Save the turn once the response has been sent
+            response.call_on_close(lambda: conversation_memory.record_turn(
+                session_id, query, conversation_memory.response_text(agent_response)
+            ))
+            return response, status
 
         else:
             return jsonify({"error": "Unsupported Media Type"}), 415
@@ -154,20 +284,57 @@ def fraud_detection_route():
         print(f"Image file received: {image_file.filename}")
         print(f"Description: {description}, Order ID: {order_id}")
 
-        # Call fraud detection handler
-        response = handle_fraud_detection(description, image_file, order_id)
-        print(f"Response from handle_fraud_detection: {response}")
-
-        return jsonify(response), 200
+        # Queue fraud detection; the client polls /api/fraud-claims/<job_id> for the decision
+        return fraud_claim_response(submit_fraud_claim(description, image_file, order_id))
 
     except Exception as e:
         print(f"Error in /api/fraud-detection: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route('/api/fraud-claims/<job_id>', methods=['GET'])
+def fraud_claim_status_route(job_id):
+    try:
+        # Optional long-poll: wait up to ?wait=<seconds> for the decision (at most a couple of seconds
+        # here, since it holds a thread; asgi.py serves this route natively with the full wait)
+        wait = request.args.get("wait", 0, type=float)
+        claim = get_fraud_claim(job_id, wait)
+        if claim is None:
+            return jsonify({"error": "Unknown fraud claim"}), 404
+        return jsonify(claim), 200
+
+    except Exception as e:
+        print(f"Error in /api/fraud-claims: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/api/health', methods=['GET'])
+def health_route():
+    # Builds no agent, so health checks work without OpenAI credentials
+    mongo_ok = ping()
+    return jsonify({
+        "status": "ok" if mongo_ok else "degraded",
+        "mongo": mongo_ok,
+        "agents": registry.get_registry_stats(),
+        "llm": get_llm_stats(),
+        "single_flight": get_single_flight_stats(),
+        "admission": get_admission_stats(),
+    }), 200 if mongo_ok else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    # Prometheus scrape endpoint (this worker process only)
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 
 # Main entry point
 if __name__ == '__main__':
+    # Make sure the indexes and derived fields the endpoints rely on exist before serving; an
+    # unreachable MongoDB is reported but does not keep the server from starting
+    ensure_database()
     try:
+        # Shared by the reloader's child process, so tokens survive code reloads
+        ensure_token_secret()
+        if registry.PRELOAD:
+            registry.preload_in_background()
         app.run(debug=True)
     except Exception as e:
         print(f"Error starting the Flask app: {e}")
\ No newline at end of file
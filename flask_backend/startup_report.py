@@ -0,0 +1,79 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Startup timing report for the backend: how long importing the app takes, which packages
+# the time goes to (from python -X importtime), and optionally how long each agent takes to build.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module="main"):
+    """
+    Imports the module in a fresh interpreter with -X importtime.
+    :param module: The module to import (defaults to the Flask app).
+    :return: (wall-clock seconds, {top-level package: self seconds}, [(cumulative seconds, module)]).
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages = {}
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+        modules.append((int(cumulative_us) / 1e6, name))
+    return wall, packages, modules
+
+
+def agent_build_times():
+    """
+    Builds every registered agent object in this process and returns the registry stats.
+    Requires OPENAI_API_KEY (no request is sent to OpenAI).
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    import main  # noqa: F401  (registers the agents)
+    from Agents import registry
+    registry.preload()
+    return registry.get_registry_stats()
+
+
+def print_report(module="main", top=15, agents=False):
+    wall, packages, modules = import_times(module)
+    print(f"import {module}: {wall * 1000:.0f} ms wall clock (fresh interpreter)")
+
+    print(f"\nSelf import time by top-level package (top {top}):")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {seconds * 1000:8.1f} ms  {package}")
+
+    print(f"\nSlowest modules by cumulative import time (top {top}):")
+    for seconds, name in sorted(modules, reverse=True)[:top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    if agents:
+        print("\nAgent initialization (first use):")
+        for name, stats in agent_build_times().items():
+            seconds = stats["build_seconds"]
+            status = f"{seconds * 1000:8.1f} ms" if seconds is not None else "  failed"
+            print(f"  {status}  {name}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report backend startup time per module and agent.")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages/modules to list")
+    parser.add_argument("--agents", action="store_true", help="Also build every agent and time it")
+    args = parser.parse_args()
+    print_report(args.module, args.top, args.agents)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+try:
+    from Agents import llm_resilience
+except ImportError:
+    from flask_backend.Agents import llm_resilience
+
+
+class FlakyModel:
+    """
+    Streams two chunks and then fails, or blocks in ainvoke until cancelled.
+    """
+
+    def stream(self, *args, **kwargs):
+        yield "first"
+        yield "second"
+        raise ConnectionError("connection reset mid-stream")
+
+    async def astream(self, *args, **kwargs):
+        yield "first"
+        yield "second"
+        raise ConnectionError("connection reset mid-stream")
+
+    async def ainvoke(self, *args, **kwargs):
+        await asyncio.sleep(60)
+
+    def invoke(self, *args, **kwargs):
+        return "ok"
+
+
+def half_open_llm(name):
+    # A wrapper whose breaker is open and past its cooldown, so the next call is the trial
+    llm = llm_resilience.ResilientLLM(FlakyModel(), name)
+    breaker = llm.state.breaker
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - llm_resilience.BREAKER_COOLDOWN_SECONDS - 1
+    return llm
+
+
+def assert_trial_ended(llm):
+    assert not llm.state.breaker.trial_in_flight
+    # A later call is let through instead of failing with CircuitOpen
+    assert llm.invoke("next") == "ok"
+    assert llm.state.breaker.state == "closed"
+
+
+def test_trial_stream_failing_after_first_chunk_ends_the_trial():
+    llm = half_open_llm("test.stream_failure")
+    with pytest.raises(ConnectionError):
+        list(llm.stream("hi"))
+    # The failed trial reopens the breaker; after the cooldown the next trial is allowed
+    assert llm.state.breaker.state == "open"
+    llm.state.breaker.opened_at -= llm_resilience.BREAKER_COOLDOWN_SECONDS + 1
+    assert_trial_ended(llm)
+
+
+def test_trial_stream_closed_by_consumer_ends_the_trial():
+    llm = half_open_llm("test.stream_closed")
+    chunks = llm.stream("hi")
+    assert next(chunks) == "first"
+    chunks.close()
+    assert_trial_ended(llm)
+
+
+def test_trial_astream_closed_by_consumer_ends_the_trial():
+    llm = half_open_llm("test.astream_closed")
+
+    async def read_one():
+        chunks = llm.astream("hi")
+        assert await chunks.__anext__() == "first"
+        await chunks.aclose()
+
+    asyncio.run(read_one())
+    assert_trial_ended(llm)
+
+
+def test_cancelled_trial_ainvoke_ends_the_trial():
+    llm = half_open_llm("test.ainvoke_cancelled")
+
+    async def cancel_call():
+        task = asyncio.ensure_future(llm.ainvoke("hi"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_call())
+    assert_trial_ended(llm)
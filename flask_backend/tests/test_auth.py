@@ -0,0 +1,124 @@
+import time
+
+import mongomock
+import pytest
+from flask import Flask
+
+try:
+    import Auth
+    import Login
+except ImportError:
+    from flask_backend import Auth, Login
+
+
+@pytest.fixture(autouse=True)
+def token_secret(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN_SECRET", "test-secret")
+
+
+def test_token_round_trip():
+    claims = Auth.verify_token(Auth.issue_token("user-1"))
+    assert claims["sub"] == "user-1"
+    assert claims["exp"] - claims["iat"] == Auth.TOKEN_TTL_SECONDS
+
+
+def test_tampered_token_is_rejected():
+    version, payload, signature = Auth.issue_token("user-1").split(".")
+    forged = Auth.issue_token("user-2").split(".")[1]
+    for token in (f"{version}.{forged}.{signature}", f"{version}.{payload}.{signature[:-2]}AA", "not-a-token"):
+        with pytest.raises(Auth.AuthError) as error:
+            Auth.verify_token(token)
+        assert error.value.status == 401
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    token = Auth.issue_token("user-1", ttl_seconds=60)
+    now = time.time()
+    monkeypatch.setattr(Auth.time, "time", lambda: now + 61)
+    with pytest.raises(Auth.AuthError, match="expired"):
+        Auth.verify_token(token)
+
+
+def test_rotated_secret_still_verifies_until_removed(monkeypatch):
+    old_token = Auth.issue_token("user-1")
+    # New secret first: it signs new tokens, the old one still verifies
+    monkeypatch.setenv("AUTH_TOKEN_SECRET", "new-secret,test-secret")
+    assert Auth.verify_token(old_token)["sub"] == "user-1"
+    new_token = Auth.issue_token("user-1")
+    monkeypatch.setenv("AUTH_TOKEN_SECRET", "new-secret")
+    assert Auth.verify_token(new_token)["sub"] == "user-1"
+    with pytest.raises(Auth.AuthError):
+        Auth.verify_token(old_token)
+
+
+def test_token_for_another_user_is_forbidden():
+    authorization = f"Bearer {Auth.issue_token('user-1')}"
+    assert Auth.authenticate(authorization, "user-1") == "user-1"
+    with pytest.raises(Auth.AuthError) as error:
+        Auth.authenticate(authorization, "user-2")
+    assert error.value.status == 403
+
+
+def test_missing_token_is_rejected_when_required(monkeypatch):
+    monkeypatch.setattr(Auth, "REQUIRE_TOKEN", True)
+    with pytest.raises(Auth.AuthError) as error:
+        Auth.authenticate(None, "user-1")
+    assert error.value.status == 401
+
+
+def test_login_upgrades_legacy_plaintext_password(monkeypatch):
+    monkeypatch.setattr(Auth, "HASH_WORKERS", 0)
+    users = mongomock.MongoClient().db.Logincredentials
+    user_id = users.insert_one({"email": "a@example.com", "password": "secret"}).inserted_id
+    monkeypatch.setattr(Login, "users_collection", users)
+    app = Flask(__name__)
+    app.register_blueprint(Login.auth_blueprint, url_prefix="/api")
+    client = app.test_client()
+
+    response = client.post("/api/login", json={"email": "a@example.com", "password": "wrong"})
+    assert response.status_code == 401
+    assert "password_hash" not in users.find_one({"_id": user_id})
+
+    response = client.post("/api/login", json={"email": "a@example.com", "password": "secret"})
+    assert response.status_code == 200
+    assert Auth.verify_token(response.get_json()["token"])["sub"] == str(user_id)
+    stored = users.find_one({"_id": user_id})
+    assert "password" not in stored
+    assert Auth.verify_password("secret", stored["password_hash"])
+
+    # Later logins use the stored hash
+    response = client.post("/api/login", json={"email": "a@example.com", "password": "secret"})
+    assert response.status_code == 200
+
+
+def test_broken_hashing_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(Auth, "HASH_WORKERS", 1)
+    Auth.shutdown_pool()
+    try:
+        stored = Auth.hash_password("secret")
+        # A hashing process killed (e.g. for running out of memory) breaks the whole pool
+        for process in list(Auth._get_executor()._processes.values()):
+            process.kill()
+            process.join()
+        assert Auth.verify_password("secret", stored)
+        assert Auth.verify_password("secret", stored)
+    finally:
+        Auth.shutdown_pool()
+
+
+def test_timed_out_hash_keeps_its_pending_slot(monkeypatch):
+    monkeypatch.setattr(Auth, "HASH_WORKERS", 1)
+    monkeypatch.setattr(Auth, "HASH_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(Auth, "_pending", Auth.threading.BoundedSemaphore(1))
+    Auth.shutdown_pool()
+    try:
+        # Warm up the pool so the slow call is running, not queued, when it times out
+        Auth._run(time.sleep, 0)
+        with pytest.raises(Auth.FutureTimeoutError):
+            Auth._run(time.sleep, 1)
+        with pytest.raises(Auth.HashingBusy):
+            Auth._run(time.sleep, 0)
+        time.sleep(1.2)
+        Auth._run(time.sleep, 0)
+    finally:
+        Auth.shutdown_pool()
@@ -20,6 +20,7 @@ function CuisineCarousel({ cuisine }) {
   const updateCart = (updatedCartItems) => {
     setCartItems(updatedCartItems);
     sessionStorage.setItem("cart", JSON.stringify(updatedCartItems));
+    sessionStorage.removeItem("checkoutKey"); // A changed cart is a new checkout
   };
 
   // Function to add items to cart
@@ -25,12 +25,14 @@ const Cart = () => {
     updatedCartItems[index].quantity = Math.max(1, parseInt(newQuantity, 10)); // Ensure it doesn't go below 1
     setCartItems(updatedCartItems);
     sessionStorage.setItem("cart", JSON.stringify(updatedCartItems));
+    sessionStorage.removeItem("checkoutKey"); // A changed cart is a new checkout
   };
 
   const handleRemoveItem = (index) => {
     const updatedCartItems = cartItems.filter((_, i) => i !== index);
     setCartItems(updatedCartItems);
     sessionStorage.setItem("cart", JSON.stringify(updatedCartItems));
+    sessionStorage.removeItem("checkoutKey"); // A changed cart is a new checkout
   };
 
   const totalPrice = cartItems.reduce((acc, item) => {
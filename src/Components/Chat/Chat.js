@@ -1,6 +1,9 @@
 import React, { useState, useEffect, useRef } from "react";
 import "./Chat.css";
 
+// How long to keep polling for a fraud claim decision before giving up
+const CLAIM_TIMEOUT_MS = 5 * 60 * 1000;
+
 const Chat = () => {
     const [query, setQuery] = useState(""); // User input
     const [messages, setMessages] = useState([]); // Chat history
@@ -18,6 +21,7 @@ const Chat = () => {
         creditCard: "",
     }); // Order form state
     const chatWindowRef = useRef(null); // Chat window reference
+    const sessionIdRef = useRef(null); // Server-side chat session (history is kept by the backend)
 
     // Scroll to the bottom of the chat window when messages are updated
     useEffect(() => {
@@ -62,6 +66,35 @@ const Chat = () => {
         ];
     };
 
+    // Reads a Server-Sent Events response: calls onToken for each token event and
+    // resolves with the payload of the final "done" event
+    const readEventStream = async (res, onToken) => {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let result = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = "message";
+                let payload = "";
+                rawEvent.split("\n").forEach((line) => {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) payload += line.slice(6);
+                });
+                const eventData = payload ? JSON.parse(payload) : {};
+                if (event === "token") onToken(eventData.text);
+                else if (event === "done") result = eventData;
+            }
+        }
+        return result || {};
+    };
+
     const isFraudQuery = (text) => {
         const fraudKeywords = ["fraud", "issue", "problem", "damage", "broken"];
         return fraudKeywords.some((keyword) => text.toLowerCase().includes(keyword));
@@ -78,18 +111,43 @@ const Chat = () => {
             setLoading(true);
 
             try {
+                const authToken = localStorage.getItem("authToken");
                 const res = await fetch("http://127.0.0.1:5000/api/query", {
                     method: "POST",
                     headers: {
                         "Content-Type": "application/json",
+                        Accept: "text/event-stream",
+                        // Orders placed through the chatbot belong to the logged-in user
+                        ...(authToken ? { Authorization: `Bearer ${authToken}` } : {}),
                     },
-                    body: JSON.stringify({ query, chat_history: messages }),
+                    body: JSON.stringify({ query, session_id: sessionIdRef.current, stream: true }),
                 });
 
                 if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
 
-                const data = await res.json();
+                let data;
+                if ((res.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+                    // Show tokens as they arrive, then replace them with the final response
+                    let streamed = false;
+                    data = await readEventStream(res, (text) => {
+                        setLoading(false);
+                        setMessages((prevMessages) => {
+                            if (!streamed) {
+                                streamed = true;
+                                return [...prevMessages, { type: "bot", text, streaming: true }];
+                            }
+                            const last = prevMessages[prevMessages.length - 1];
+                            return [...prevMessages.slice(0, -1), { ...last, text: last.text + text }];
+                        });
+                    });
+                    if (streamed) {
+                        setMessages((prevMessages) => prevMessages.filter((message) => !message.streaming));
+                    }
+                } else {
+                    data = await res.json();
+                }
                 console.log("Backend Response:", data);
+                if (data.session_id) sessionIdRef.current = data.session_id;
 
                 if (isFraudQuery(query)) {
                     // Trigger fraud detection flow
@@ -155,7 +213,18 @@ const Chat = () => {
 
                     if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
 
-                    const data = await res.json();
+                    // The claim is queued; long-poll its status until a decision is available
+                    // (for at most CLAIM_TIMEOUT_MS). The server may answer before ?wait= runs out.
+                    let data = await res.json();
+                    const pollDeadline = Date.now() + CLAIM_TIMEOUT_MS;
+                    while (data.job_id && (data.status === "queued" || data.status === "running")) {
+                        if (Date.now() > pollDeadline) throw new Error("Timed out waiting for the fraud claim decision");
+                        const statusRes = await fetch(`http://127.0.0.1:5000/api/fraud-claims/${data.job_id}?wait=25`);
+                        if (!statusRes.ok) throw new Error(`HTTP error! Status: ${statusRes.status}`);
+                        data = await statusRes.json();
+                    }
+                    if (data.error) throw new Error(data.error);
+
                     setMessages((prevMessages) => [
                         ...prevMessages,
                         {
@@ -31,9 +31,6 @@ const Checkout = () => {
     delivery.setDate(delivery.getDate() + 14);
     setDeliveryDate(delivery.toDateString());
 
-    // Generate a random confirmation number
-    setConfirmationNumber(`ORD-${Math.floor(Math.random() * 1000000)}`);
-
     // Check if user is logged in
     const isLoggedIn = localStorage.getItem("isLoggedIn") === "true";
     if (!isLoggedIn) {
@@ -65,18 +62,28 @@ const Checkout = () => {
       phone_number: formData.phone_number,
       email: formData.email,
       delivery_address: `${formData.address}, ${formData.city}, ${formData.state} - ${formData.zip}`,
-      order_id: confirmationNumber,
+      // The order id (confirmation number) is issued by the server and returned in the response
       cart_items: cartItems.map(item => ({
         product_name: item.name, // Rename for consistency with backend
         quantity: item.quantity || 1, // Default to 1 if undefined
       })),
     };
 
+    // One idempotency key per checkout: a retry or double submit returns the same order
+    let checkoutKey = sessionStorage.getItem('checkoutKey');
+    if (!checkoutKey) {
+      checkoutKey = crypto.randomUUID();
+      sessionStorage.setItem('checkoutKey', checkoutKey);
+    }
+
     try {
+      const authToken = localStorage.getItem('authToken');
       const response = await fetch('http://127.0.0.1:5000/api/checkout', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': checkoutKey,
+          ...(authToken ? { Authorization: `Bearer ${authToken}` } : {}),
         },
         body: JSON.stringify(orderData),
       });
@@ -88,8 +95,10 @@ const Checkout = () => {
       const result = await response.json();
 
       if (result.status === 'success') {
-        alert(`Order placed! Confirmation Number: ${confirmationNumber}. Delivery Date: ${deliveryDate}`);
+        setConfirmationNumber(result.order_id);
+        alert(`Order placed! Confirmation Number: ${result.order_id}. Delivery Date: ${deliveryDate}`);
         sessionStorage.removeItem('cart');
+        sessionStorage.removeItem('checkoutKey');
         navigate('/');
       } else {
         alert('Order failed. Please try again.');
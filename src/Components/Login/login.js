@@ -30,10 +30,11 @@ function Login({ onSuccessfulLogin }) {
       const result = await response.json();
 
       if (response.ok) {
-        const { user_id } = result; // Assuming backend returns user_id
+        const { user_id, token } = result; // Backend returns user_id and a signed session token
         localStorage.setItem("isLoggedIn", "true"); // Store logged-in state
         localStorage.setItem("userEmail", email); // Save email to local storage
         localStorage.setItem("userId", user_id); // Save user_id to local storage
+        localStorage.setItem("authToken", token); // Sent as a Bearer token to orders and checkout
         console.log("User ID:", user_id); // Log the user_id to the console
 
         if (onSuccessfulLogin) {
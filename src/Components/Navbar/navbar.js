@@ -126,6 +126,7 @@ function Navbar() {
     const handleLoginLogout = () => {
         if (isLoggedIn) {
             localStorage.setItem("isLoggedIn", "false");
+            localStorage.removeItem("authToken");
             setIsLoggedIn(false);
             navigate("/"); // Redirect to home page after logout
         } else {
@@ -9,9 +9,27 @@ function Orders() {
         // Fetch orders data from the backend API
         const fetchOrders = async () => {
             try {
-                const response = await fetch('http://127.0.0.1:5000/api/orders'); // Replace with actual API endpoint
-                const data = await response.json();
-                setOrders(data);
+                const userId = localStorage.getItem('userId');
+                const authToken = localStorage.getItem('authToken');
+                const headers = authToken ? { Authorization: `Bearer ${authToken}` } : {};
+                const params = new URLSearchParams();
+                if (userId) params.set('user_id', userId);
+
+                // Follow the X-Next-Cursor header until every page is loaded
+                let allOrders = [];
+                let cursor = null;
+                do {
+                    if (cursor) params.set('after', cursor);
+                    const response = await fetch(`http://127.0.0.1:5000/api/orders?${params}`, { headers });
+                    if (!response.ok) {
+                        // e.g. 401 when the session token is missing or expired
+                        throw new Error(`Orders request failed with status ${response.status}`);
+                    }
+                    const data = await response.json();
+                    allOrders = allOrders.concat(data);
+                    cursor = response.headers.get('X-Next-Cursor');
+                } while (cursor);
+                setOrders(allOrders);
             } catch (error) {
                 console.error('Error fetching orders:', error);
             }